@@ -123,6 +123,9 @@ REST_FRAMEWORK = {
 
 AUTHENTICATION_BACKENDS = (
     "django.contrib.auth.backends.ModelBackend",  # this is default
+    # object permissions of entities and relations follow from their collections
+    "apis_core.apis_metainfo.permissions.CollectionPermissionBackend",
+    # per-object permissions which do not follow from the collections
     "guardian.backends.ObjectPermissionBackend",
 )
 
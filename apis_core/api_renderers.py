@@ -1,7 +1,10 @@
 import re
 from collections import OrderedDict
 
-from rest_framework import renderers
+import msgpack
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
 
 
 class NetJsonRenderer(renderers.JSONRenderer):
@@ -52,3 +55,53 @@ class NetJsonRenderer(renderers.JSONRenderer):
             data["results"] = results2
             res3 = super().render(data, accepted_media_type=media_type, renderer_context=renderer_context)
             return res3
+
+
+class NDJSONRenderer(renderers.JSONRenderer):
+    """
+    Newline delimited JSON, one object per line. The dumps of the generic list endpoints are streamed by the
+    viewsets (see api_routers.iter_ndjson), the renderer covers the responses that are not streamed, e.g. errors.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        items = data if isinstance(data, list) else [data]
+        return b"".join(
+            super(NDJSONRenderer, self).render(item, accepted_media_type, renderer_context) + b"\n" for item in items
+        )
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """
+    Binary MessagePack encoding of the same data as the JSON renderer. Values msgpack does not know (dates, decimals,
+    uuids, lazy strings ...) are converted as in JSON.
+    """
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
+
+
+class MessagePackParser(parsers.BaseParser):
+    """
+    Parses MessagePack request bodies, e.g. of the batch endpoints.
+    """
+
+    media_type = "application/msgpack"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except Exception as exc:
+            raise ParseError(f"MessagePack parse error - {exc}")
+
@@ -1,16 +1,27 @@
+from collections.abc import Mapping
 from functools import reduce
 import copy
 import importlib
 import inspect
+import json
 import typing
+import zlib
 
 from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
 
 # from django.contrib.contenttypes.models import ContentType
 from django.urls import reverse
 from rest_framework import pagination, serializers, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework import renderers
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
 
 # from drf_spectacular.contrib.django_filters import (
 #    DjangoFilterBackend as DjangoFilterbackendSpectacular,
@@ -26,9 +37,10 @@ from django import forms
 from django_filters import rest_framework as filters
 from rest_framework.filters import OrderingFilter
 from .apis_metainfo.models import TempEntityClass
-from .api_renderers import NetJsonRenderer
+from .api_renderers import MessagePackParser, MessagePackRenderer, NDJSONRenderer, NetJsonRenderer
 from .apis_relations.models import AbstractRelation
 from apis_core.helper_functions.ContentType import GetContentTypes
+from apis_core.helper_functions.conditional_get import ConditionalGetMixin
 
 
 if "apis_highlighter" in getattr(settings, "INSTALLED_APPS"):
@@ -57,8 +69,118 @@ def create_query_parameters(entity):
         print(f.name, f.__class__.__name__)
 
 
+def estimate_count(queryset):
+    """
+    :param queryset: the queryset to count
+    :return: the number of rows estimated by the query planner on PostgreSQL, the exact count elsewhere
+    """
+    if connections[queryset.db].vendor != "postgresql":
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class KeysetPagination(pagination.CursorPagination):
+    """
+    Keyset pagination: every page is a "WHERE pk > <last pk of the previous page> ORDER BY pk LIMIT n" query, so the
+    last page of a table costs as much as the first one. No COUNT(*) is run unless the client asks for one with
+    count=exact or count=approximate.
+    """
+
+    ordering = "pk"
+    page_size_query_param = "limit"
+    max_page_size = 1000
+    count_query_param = "count"
+
+    @staticmethod
+    def is_requested(request):
+        """
+        :param request: the request
+        :return: True if the request asks for keyset pagination, with pagination=cursor or a cursor
+        """
+        return request.query_params.get("pagination") == "cursor" or "cursor" in request.query_params
+
+    @staticmethod
+    def is_keyset_field(model, field_name):
+        """
+        :param model: the model of the queryset
+        :param field_name: name of the field to order by
+        :return: True if the field is indexed, not nullable and not a relation, i.e. usable as a keyset
+        """
+        if field_name in ["pk", "id"]:
+            return True
+        try:
+            field = model._meta.get_field(field_name)
+        except FieldDoesNotExist:
+            return False
+        if not field.concrete or field.is_relation or field.null:
+            return False
+        if field.primary_key or field.unique or field.db_index:
+            return True
+        return any(index.fields[0] == field_name for index in field.model._meta.indexes)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = request.query_params.get(OrderingFilter.ordering_param)
+        if not ordering:
+            return (self.ordering,)
+        ordering = [x.strip() for x in ordering.split(",") if x.strip()]
+        if len(ordering) != 1 or not self.is_keyset_field(queryset.model, ordering[0].lstrip("-")):
+            raise ValidationError(
+                {"ordering": "Cursor pagination can only order by a single indexed column, e.g. pk or -pk."}
+            )
+        return tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        count = request.query_params.get(self.count_query_param)
+        if count == "exact":
+            self.count = queryset.count()
+        elif count == "approximate":
+            self.count = estimate_count(queryset)
+        else:
+            self.count = None
+        return super().paginate_queryset(queryset, request, view=view)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "count": self.count,
+                "limit": self.page_size,
+                "results": data,
+            }
+        )
+
+
 class CustomPagination(pagination.LimitOffsetPagination):
+    """
+    Limit/offset pagination, or keyset pagination (see KeysetPagination) if the request asks for it with
+    pagination=cursor.
+    """
+
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if KeysetPagination.is_requested(request):
+            self.keyset = KeysetPagination()
+            page = self.keyset.paginate_queryset(queryset, request, view=view)
+            self.display_page_controls = self.keyset.display_page_controls
+            return page
+        return super().paginate_queryset(queryset, request, view=view)
+
+    def to_html(self):
+        if self.keyset is not None:
+            return self.keyset.to_html()
+        return super().to_html()
+
     def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
         return Response(
             {
                 "next": self.get_next_link(),
@@ -70,6 +192,89 @@ class CustomPagination(pagination.LimitOffsetPagination):
             }
         )
 
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                "name": "pagination",
+                "required": False,
+                "in": "query",
+                "description": "Set to cursor for keyset pagination, which is fast on deep pages and does not count",
+                "schema": {"type": "string", "enum": ["offset", "cursor"]},
+            },
+            {
+                "name": "cursor",
+                "required": False,
+                "in": "query",
+                "description": "The pagination cursor value, as found in the next and previous links",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": "count",
+                "required": False,
+                "in": "query",
+                "description": "Cursor pagination only: add an exact or approximate count of the results",
+                "schema": {"type": "string", "enum": ["exact", "approximate"]},
+            },
+        ]
+
+
+def parse_requested_fields(query_params):
+    """
+    Reads the sparse fieldset parameters of a request, e.g. ?fields=id,name,start_date or ?exclude=collection,text.
+
+    :param query_params: the query parameters of the request
+    :return: tuple of the set of requested field names (None if all fields are requested) and the set of excluded
+        field names
+    """
+    fields = query_params.get("fields")
+    exclude = query_params.get("exclude")
+    if fields:
+        fields = {x.strip() for x in fields.split(",") if x.strip()}
+    else:
+        fields = None
+    if exclude:
+        exclude = {x.strip() for x in exclude.split(",") if x.strip()}
+    else:
+        exclude = set()
+    return fields, exclude
+
+
+def is_field_requested(requested_fields, name):
+    """
+    :param requested_fields: tuple as returned by parse_requested_fields
+    :param name: name of a serializer field
+    :return: True if the field is part of the response
+    """
+    fields, exclude = requested_fields
+    return (fields is None or name in fields) and name not in exclude
+
+
+sparse_fieldset_parameters = [
+    OpenApiParameter(
+        name="fields",
+        description="Comma separated list of the fields to return, e.g. id,name,start_date. Only the joins needed for these fields are done",
+        type=OpenApiTypes.STR,
+    ),
+    OpenApiParameter(
+        name="exclude",
+        description="Comma separated list of fields to leave out of the response",
+        type=OpenApiTypes.STR,
+    ),
+]
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin that builds only the fields requested with the fields and exclude query parameters. The view
+    passes them as "requested_fields" in the serializer context.
+    """
+
+    def is_field_requested(self, name):
+        return is_field_requested(self.context.get("requested_fields", (None, set())), name)
+
+    def get_field_names(self, declared_fields, info):
+        return [name for name in super().get_field_names(declared_fields, info) if self.is_field_requested(name)]
+
 
 class ApisBaseSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField()
@@ -160,9 +365,9 @@ class RelationObjectSerializer2(ApisBaseSerializer):
 
     @extend_schema_field(EntitySerializer)
     def add_related_entity(self, instance):
-        for at in dir(instance):
-            if at.startswith("related_") and at.endswith("_id") and getattr(instance, at) != self._pk_instance:
-                return EntitySerializer(getattr(instance, at[:-3]), context=self.context).data
+        for field_name in [instance.get_related_entity_field_nameA(), instance.get_related_entity_field_nameB()]:
+            if getattr(instance, f"{field_name}_id") != self._pk_instance:
+                return EntitySerializer(getattr(instance, field_name), context=self.context).data
 
     class Meta(ApisBaseSerializer.Meta):
         fields = ApisBaseSerializer.Meta.fields + ["relation_type", "related_entity"]
@@ -182,382 +387,579 @@ if "apis_highlighter" in getattr(settings, "INSTALLED_APPS"):
             fields = ["id", "start", "end", "related_object"]
 
 
-def generic_serializer_creation_factory():
-    lst_cont = GetContentTypes().get_model_classes()
-    not_allowed_filter_fields = [
-        "useradded",
-        "vocab_name",
-        "parent_class",
-        "vocab",
-        "entity",
-        "autofield",
-    ]
-    for cont in lst_cont:
-        prefetch_rel = []
-        select_related = []
-        test_search = getattr(settings, cont.__module__.split(".")[1].upper(), False)
-        entity_str = str(cont.__name__).replace(" ", "")
-        entity = cont
-        app_label = cont.__module__.split(".")[1].lower()
-        exclude_lst = []
-        if app_label == "apis_entities":
-            exclude_lst = deep_get(test_search, "{}.api_exclude".format(entity_str), [])
-        else:
-            set_prem = getattr(settings, cont.__module__.split(".")[1].upper(), {})
-            exclude_lst = deep_get(set_prem, "exclude", [])
-            exclude_lst.extend(deep_get(set_prem, "{}.exclude".format(entity_str), []))
-        entity_field_name_list = []
-        for x in entity._meta.get_fields():
-            entity_field_name_list.append(x.name)
-        exclude_lst_fin = []
-        for x in exclude_lst:
-            if x in entity_field_name_list:
-                exclude_lst_fin.append(x)
-        if entity_str.lower() == "text":
-            exclude_lst_fin.extend(["kind", "source"])
-        if app_label == "apis_relations":
-            exclude_lst_fin.extend(["text", "collection"])
-        for f in entity._meta.get_fields():
-            if f.__class__.__name__ == "ManyToManyField":
-                prefetch_rel.append(f.name)
-            elif f.__class__.__name__ == "ForeignKey":
-                select_related.append(f.name)
-
-        class TemplateSerializer(serializers.HyperlinkedModelSerializer):
-
-            id = serializers.ReadOnlyField()
-            url = serializers.HyperlinkedIdentityField(view_name=f"apis:apis_api:{entity_str.lower()}-detail")
-            # sameAs = UriSerializer(source="uri_set", many=True)
-            _entity = entity
-            _exclude_lst = exclude_lst_fin
-            _app_label = app_label
-
-            class Meta:
-
-                model = entity
-                exclude = exclude_lst_fin
-
-            def add_labels(self, obj):
-                return {"id": obj.pk, "label": str(obj)}
-
-            def add_sameas(self, instance):
-                res = []
-                for uri in instance.uri_set.all():
-                    res.append(uri.uri)
-                return res
+def iter_ndjson(queryset, serializer_class, context, chunk_size=2000):
+    """
+    Serializes a queryset as newline delimited JSON, ordered by primary key, with constant memory on every database:
+    the rows are read in keyset pages of chunk_size rows (pk greater than the last pk of the previous page), each a
+    query of its own, and the prefetches of the queryset are done per page. Unlike iterator(), this does not depend on
+    server side cursors, which mysqlclient does not provide (it buffers the whole result of a query on the client).
+
+    :param queryset: the queryset
+    :param serializer_class: serializer of a single object
+    :param context: the serializer context
+    :param chunk_size: number of objects per chunk
+    :return: generator of bytes, one line per object
+    """
+
+    lookups = queryset._prefetch_related_lookups
+    queryset = queryset.prefetch_related(None).order_by("pk")
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(page[:chunk_size])
+        if len(chunk) == 0:
+            return
+        if len(lookups) > 0:
+            prefetch_related_objects(chunk, *lookups)
+        yield b"".join(
+            json.dumps(serializer_class(obj, context=context).data, cls=JSONEncoder, ensure_ascii=False).encode("utf-8")
+            + b"\n"
+            for obj in chunk
+        )
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1].pk
+
+
+def iter_gzip(chunks):
+    """
+    :param chunks: iterable of bytes
+    :return: generator of the gzip compressed chunks
+    """
+
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+ndjson_parameters = sparse_fieldset_parameters + [
+    OpenApiParameter(
+        name="gzip",
+        description="Whether to gzip the dump, defaults to false",
+        type=OpenApiTypes.BOOL,
+    ),
+]
+
+
+ndjson_action_kwargs = {
+    "detail": False,
+    "methods": ["get"],
+    "renderer_classes": [NDJSONRenderer, renderers.JSONRenderer],
+}
+
+not_allowed_filter_fields = [
+    "useradded",
+    "vocab_name",
+    "parent_class",
+    "vocab",
+    "entity",
+    "autofield",
+    "self_contenttype",
+]
+
+_field_plans = {}
+
+
+def get_field_plan(model):
+    """
+    The related fields the generic serializers of a model add in their __init__, and whether the model has relations.
+    It is computed once per model instead of introspecting _meta.get_fields() on every serializer instantiation.
+
+    :param model: a model class
+    :return: dict with "fields", a list of (name, many, serializer class or None) tuples, and "relations"
+    """
+    if model not in _field_plans:
+        fields = []
+        for f in model._meta.get_fields():
+            related_serializer = None
+            if f.__class__.__name__ in ["ManyToManyField", "ForeignKey"]:
+                if "apis_vocabularies" not in str(f.related_model):
+                    related_serializer = ApisBaseSerializer
+                else:
+                    related_serializer = LabelSerializer
+            fields.append((f.name, f.__class__.__name__ == "ManyToManyField", related_serializer))
+        _field_plans[model] = {
+            "fields": fields,
+            "relations": any(
+                model.__name__.lower() in x.__name__.lower() for x in AbstractRelation.get_all_relation_classes()
+            ),
+        }
+    return _field_plans[model]
+
+
+def build_generic_api_classes(cont):
+    """
+    Builds the serializer, the retrieve serializer, the filterset and the viewset of the generic API of a model.
+
+    :param cont: the model class
+    :return: the viewset class
+    """
+    prefetch_rel = []
+    select_related = []
+    test_search = getattr(settings, cont.__module__.split(".")[1].upper(), False)
+    entity_str = str(cont.__name__).replace(" ", "")
+    entity = cont
+    app_label = cont.__module__.split(".")[1].lower()
+    exclude_lst = []
+    if app_label == "apis_entities":
+        exclude_lst = deep_get(test_search, "{}.api_exclude".format(entity_str), [])
+    else:
+        set_prem = getattr(settings, cont.__module__.split(".")[1].upper(), {})
+        exclude_lst = deep_get(set_prem, "exclude", [])
+        exclude_lst.extend(deep_get(set_prem, "{}.exclude".format(entity_str), []))
+    entity_field_name_list = []
+    for x in entity._meta.get_fields():
+        entity_field_name_list.append(x.name)
+    exclude_lst_fin = []
+    for x in exclude_lst:
+        if x in entity_field_name_list:
+            exclude_lst_fin.append(x)
+    if entity_str.lower() == "text":
+        exclude_lst_fin.extend(["kind", "source"])
+    if app_label == "apis_relations":
+        exclude_lst_fin.extend(["text", "collection"])
+    if "self_contenttype" in entity_field_name_list:
+        exclude_lst_fin.append("self_contenttype")
+    for f in entity._meta.get_fields():
+        if f.name == "self_contenttype":
+            continue
+        elif f.__class__.__name__ == "ManyToManyField":
+            prefetch_rel.append(f.name)
+        elif f.__class__.__name__ == "ForeignKey":
+            select_related.append(f.name)
+
+    class TemplateSerializer(SparseFieldsetMixin, serializers.HyperlinkedModelSerializer):
+
+        id = serializers.ReadOnlyField()
+        url = serializers.HyperlinkedIdentityField(view_name=f"apis:apis_api:{entity_str.lower()}-detail")
+        # sameAs = UriSerializer(source="uri_set", many=True)
+        _entity = entity
+        _exclude_lst = exclude_lst_fin
+        _app_label = app_label
 
-            if entity_str.lower() == "text":
+        class Meta:
 
-                def __init__(self, *args, **kwargs):
-                    super().__init__(*args, **kwargs)
-                    self._highlight = False
+            model = entity
+            exclude = exclude_lst_fin
+
+        def add_labels(self, obj):
+            return {"id": obj.pk, "label": str(obj)}
+
+        def add_sameas(self, instance):
+            res = []
+            for uri in instance.uri_set.all():
+                res.append(uri.uri)
+            return res
+
+        if entity_str.lower() == "text":
+
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self._highlight = False
+                if self.is_field_requested("kind"):
                     self.fields["kind"] = LabelSerializer(many=False, read_only=True)
 
-            else:
+        else:
 
-                def __init__(self, *args, **kwargs):
-                    super().__init__(*args, **kwargs)
-                    entity_str = self._entity.__name__
-                    app_label = self._app_label
-                    lst_labels_set = deep_get(
-                        getattr(settings, app_label.upper(), {}),
-                        "{}.labels".format(entity_str),
-                        [],
-                    )
-                    if app_label == "apis_entities":
-                        self.fields["sameAs"] = serializers.SerializerMethodField("add_sameas")
-                    for f in self._entity._meta.get_fields():
-                        if getattr(settings, "APIS_API_EXCLUDE_SETS", False) and str(f.name).endswith("_set"):
-                            if f.name in self.fields.keys():
-                                self.fields.pop(f.name)
-                            continue
-                        ck_many = f.__class__.__name__ == "ManyToManyField"
-                        if f.name in self._exclude_lst:
-                            continue
-                        elif f.__class__.__name__ in [
-                            "ManyToManyField",
-                            "ForeignKey",
-                        ] and "apis_vocabularies" not in str(f.related_model):
-                            self.fields[f.name] = ApisBaseSerializer(many=ck_many, read_only=True)
-                        elif f.__class__.__name__ in ["ManyToManyField", "ForeignKey"]:
-                            self.fields[f.name] = LabelSerializer(many=ck_many, read_only=True)
-
-        TemplateSerializer.__name__ = (
-            TemplateSerializer.__qualname__
-        ) = f"{entity_str.title().replace(' ', '')}Serializer"
-
-        class TemplateSerializerRetrieve(TemplateSerializer):
-
-            if entity_str.lower() == "text":
-                text = serializers.SerializerMethodField(method_name="txt_serializer_add_text")
-                if "apis_highlighter" in getattr(settings, "INSTALLED_APPS"):
-                    annotations = serializers.SerializerMethodField(method_name="txt_serializer_add_annotations")
-
-                    @extend_schema_field(AnnotationSerializer(many=True))
-                    def txt_serializer_add_annotations(self, instance):
-                        if self._highlight:
-                            return AnnotationSerializer(self._annotations, context=self.context, many=True).data
-                        else:
-                            return None
-
-                def __init__(self, *args, **kwargs):
-                    super().__init__(*args, **kwargs)
-                    highlight = self.context.get("highlight", True)
-                    self._inline_annotations = False
-                    if highlight is not None and "apis_highlighter" in getattr(settings, "INSTALLED_APPS"):
-                        self._highlight = highlight
-                        if self._highlight == "":
-                            self._highlight = True
-                        if not isinstance(self._highlight, bool):
-                            if self._highlight.lower() == "false":
-                                self._highlight = False
-                        self._ann_proj_pk = self.context.get("ann_proj_pk", None)
-                        self._types = self.context.get("types", None)
-                        self._users_show = self.context.get("users_show", None)
-                        self._inline_annotations = self.context.get("inline_annotations", True)
-                        if not isinstance(self._inline_annotations, bool):
-                            if self._inline_annotations.lower() == "false":
-                                self._inline_annotations = False
-                            elif self._inline_annotations.lower() == "true":
-                                self._inline_annotations = True
-                        try:
-                            self._txt_html, self._annotations = highlight_text_new(
-                                self.instance,
-                                set_ann_proj=self._ann_proj_pk,
-                                types=self._types,
-                                users_show=self._users_show,
-                                inline_annotations=self._inline_annotations,
-                            )
-                            qs_an = {"text": self.instance}
-                            if self._users_show is not None:
-                                qs_an["users_added__in"] = self._users_show
-                            if self._ann_proj_pk is not None:
-                                qs_an["annotation_project_id"] = self._ann_proj_pk
-                            # self._annotations = Annotation.objects.filter(
-                            #    **qs_an
-                            # )  # FIXME: Currently this QS is called twice (highlight_text_new)
-                        except Exception as e:
-                            self._txt_html = ""
-                            self._annotations = []
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                if self._app_label == "apis_entities" and self.is_field_requested("sameAs"):
+                    self.fields["sameAs"] = serializers.SerializerMethodField("add_sameas")
+                for name, many, related_serializer in get_field_plan(self._entity)["fields"]:
+                    if getattr(settings, "APIS_API_EXCLUDE_SETS", False) and name.endswith("_set"):
+                        if name in self.fields.keys():
+                            self.fields.pop(name)
+                        continue
+                    if name in self._exclude_lst or not self.is_field_requested(name):
+                        continue
+                    elif related_serializer is not None:
+                        self.fields[name] = related_serializer(many=many, read_only=True)
+
+    TemplateSerializer.__name__ = TemplateSerializer.__qualname__ = f"{entity_str.title().replace(' ', '')}Serializer"
+
+    class TemplateSerializerRetrieve(TemplateSerializer):
+
+        if entity_str.lower() == "text":
+            text = serializers.SerializerMethodField(method_name="txt_serializer_add_text")
+            if "apis_highlighter" in getattr(settings, "INSTALLED_APPS"):
+                annotations = serializers.SerializerMethodField(method_name="txt_serializer_add_annotations")
+
+                @extend_schema_field(AnnotationSerializer(many=True))
+                def txt_serializer_add_annotations(self, instance):
+                    if self._highlight:
+                        return AnnotationSerializer(self._annotations, context=self.context, many=True).data
                     else:
-                        self._highlight = False
+                        return None
+
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                highlight = self.context.get("highlight", True)
+                self._inline_annotations = False
+                if highlight is not None and "apis_highlighter" in getattr(settings, "INSTALLED_APPS"):
+                    self._highlight = highlight
+                    if self._highlight == "":
+                        self._highlight = True
+                    if not isinstance(self._highlight, bool):
+                        if self._highlight.lower() == "false":
+                            self._highlight = False
+                    self._ann_proj_pk = self.context.get("ann_proj_pk", None)
+                    self._types = self.context.get("types", None)
+                    self._users_show = self.context.get("users_show", None)
+                    self._inline_annotations = self.context.get("inline_annotations", True)
+                    if not isinstance(self._inline_annotations, bool):
+                        if self._inline_annotations.lower() == "false":
+                            self._inline_annotations = False
+                        elif self._inline_annotations.lower() == "true":
+                            self._inline_annotations = True
+                    try:
+                        self._txt_html, self._annotations = highlight_text_new(
+                            self.instance,
+                            set_ann_proj=self._ann_proj_pk,
+                            types=self._types,
+                            users_show=self._users_show,
+                            inline_annotations=self._inline_annotations,
+                        )
+                        qs_an = {"text": self.instance}
+                        if self._users_show is not None:
+                            qs_an["users_added__in"] = self._users_show
+                        if self._ann_proj_pk is not None:
+                            qs_an["annotation_project_id"] = self._ann_proj_pk
+                        # self._annotations = Annotation.objects.filter(
+                        #    **qs_an
+                        # )  # FIXME: Currently this QS is called twice (highlight_text_new)
+                    except Exception as e:
+                        self._txt_html = ""
+                        self._annotations = []
+                else:
+                    self._highlight = False
+                if self.is_field_requested("kind"):
                     self.fields["kind"] = LabelSerializer(many=False, read_only=True)
 
-                def txt_serializer_add_text(self, instance):
-                    if self._inline_annotations:
-                        return self._txt_html
-                    else:
-                        return instance.text
+            def txt_serializer_add_text(self, instance):
+                if self._inline_annotations:
+                    return self._txt_html
+                else:
+                    return instance.text
 
-            else:
+        else:
 
-                def __init__(self, *args, **kwargs):
-                    super().__init__(*args, **kwargs)
-                    entity_str = self._entity.__name__
-                    app_label = self._app_label
-                    self._include_relations = self.context["request"].query_params.get("include_relations", True)
-                    if self._include_relations in ["false", "False", "0"]:
-                        self._include_relations = False
-                    lst_labels_set = deep_get(
-                        getattr(settings, app_label.upper(), {}),
-                        "{}.labels".format(entity_str),
-                        [],
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self._include_relations = self.context["request"].query_params.get("include_relations", True)
+                if self._include_relations in ["false", "False", "0"]:
+                    self._include_relations = False
+                for name, many, related_serializer in get_field_plan(self._entity)["fields"]:
+                    if getattr(settings, "APIS_API_EXCLUDE_SETS", False) and name.endswith("_set"):
+                        if name in self.fields.keys():
+                            self.fields.pop(name)
+                        continue
+                    if name in self._exclude_lst or not self.is_field_requested(name):
+                        continue
+                    elif related_serializer is not None:
+                        self.fields[name] = related_serializer(many=many, read_only=True)
+                if (
+                    get_field_plan(self._entity)["relations"]
+                    and len(args) > 0
+                    and self._include_relations
+                    and self.is_field_requested("relations")
+                ):
+                    inst_pk2 = args[0].pk
+                    self.fields["relations"] = RelationObjectSerializer2(
+                        read_only=True,
+                        source="get_related_relation_instances",
+                        many=True,
+                        pk_instance=inst_pk2,
                     )
-                    for f in self._entity._meta.get_fields():
-                        if getattr(settings, "APIS_API_EXCLUDE_SETS", False) and str(f.name).endswith("_set"):
-                            if f.name in self.fields.keys():
-                                self.fields.pop(f.name)
-                            continue
-                        ck_many = f.__class__.__name__ == "ManyToManyField"
-                        if f.name in self._exclude_lst:
-                            continue
-                        elif f.__class__.__name__ in [
-                            "ManyToManyField",
-                            "ForeignKey",
-                        ] and "apis_vocabularies" not in str(f.related_model):
-                            self.fields[f.name] = ApisBaseSerializer(many=ck_many, read_only=True)
-                        elif f.__class__.__name__ in ["ManyToManyField", "ForeignKey"]:
-                            self.fields[f.name] = LabelSerializer(many=ck_many, read_only=True)
-                    # include = list(ContentType.objects.filter(app_label="apis_relations", model__icontains=entity_str).values_list('model', flat=True))
-                    include = [
-                        x
-                        for x in lst_cont
-                        if x.__module__ == "apis_core.apis_relations.models"
-                        and entity_str.lower() in x.__name__.lower()
-                    ]
-                    if len(include) > 0 and len(args) > 0 and self._include_relations:
-                        inst_pk2 = args[0].pk
-                        self.fields["relations"] = RelationObjectSerializer2(
-                            read_only=True,
-                            source="get_related_relation_instances",
-                            many=True,
-                            pk_instance=inst_pk2,
-                        )
 
-        TemplateSerializerRetrieve.__name__ = (
-            TemplateSerializerRetrieve.__qualname__
-        ) = f"{entity_str.title().replace(' ', '')}DetailSerializer"
+    TemplateSerializerRetrieve.__name__ = (
+        TemplateSerializerRetrieve.__qualname__
+    ) = f"{entity_str.title().replace(' ', '')}DetailSerializer"
+
+    allowed_fields_filter = {
+        "IntegerField": ["in", "range", "exact"],
+        "CharField": ["exact", "icontains", "iregex", "isnull"],
+        "DateField": ["year", "lt", "gt", "year__lt", "year__gt", "exact"],
+        "PositiveIntegerField": ["in", "range", "exact"],
+        "AutoField": ["in", "exact"],
+    }
+    filterset_dict = {}
+    filter_fields = {}
+
+    for field in entity._meta.fields + entity._meta.many_to_many:
+        if getattr(settings, "APIS_API_EXCLUDE_SETS", False) and "_set" in str(field.name.lower()):
+            continue
+        if field.name.lower() in not_allowed_filter_fields or field.name == "tempentityclass_ptr":
+            continue
+        elif field.__class__.__name__ in ["ForeignKey", "ManyToManyField"]:
+            filter_fields[field.name] = ["exact"]
+            if field.__class__.__name__ == "ForeignKey":
+                filter_fields[field.name].append("in")
+            for f2 in field.related_model._meta.fields:
+                if f2.__class__.__name__ in [
+                    "CharField",
+                    "DateField",
+                    "IntegerField",
+                    "AutoField",
+                ]:
+                    filter_fields[f"{field.name}__{f2.name}"] = allowed_fields_filter[f2.__class__.__name__]
+            if hasattr(field.related_model, "ancestor_closures"):
+                # the related vocabulary or collection or any of its descendants
+                filter_fields[f"{field.name}__ancestor_closures__ancestor"] = ["exact", "in"]
+            continue
+        if field.__class__.__name__ in allowed_fields_filter.keys():
+            filter_fields[field.name] = allowed_fields_filter[field.__class__.__name__]
+        else:
+            filter_fields[field.name] = ["exact"]
+    additional_filters = getattr(settings, "APIS_API_ADDITIONAL_FILTERS", False)
+    if additional_filters:
+        if entity_str in additional_filters.keys():
+            for f1 in additional_filters[entity_str]:
+                if f1[0] not in filter_fields.keys():
+                    filter_fields[f1[0]] = f1[1]
+
+    class MetaFilter(object):
+
+        model = entity
+        fields = filter_fields
+
+    filterset_dict["Meta"] = MetaFilter
+
+    class TemplateViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+
+        _select_related = select_related
+        _prefetch_rel = prefetch_rel
+        _app_label = app_label
+        pagination_class = CustomPagination
+        model = entity
+        # filter_backends = (DjangoFilterbackendSpectacular,)
+        filter_backends = (filters.DjangoFilterBackend, OrderingFilter)
+        filterset_fields = filter_fields
+        depth = 2
+        renderer_classes = (
+            renderers.JSONRenderer,
+            renderers.BrowsableAPIRenderer,
+            NetJsonRenderer,
+            MessagePackRenderer,
+        )
+        parser_classes = tuple(api_settings.DEFAULT_PARSER_CLASSES) + (MessagePackParser,)
+        _serializer_class = TemplateSerializer
+        _serializer_class_retrieve = TemplateSerializerRetrieve
 
-        allowed_fields_filter = {
-            "IntegerField": ["in", "range", "exact"],
-            "CharField": ["exact", "icontains", "iregex", "isnull"],
-            "DateField": ["year", "lt", "gt", "year__lt", "year__gt", "exact"],
-            "PositiveIntegerField": ["in", "range", "exact"],
-            "AutoField": ["in", "exact"],
-        }
-        filterset_dict = {}
-        filter_fields = {}
-
-        for field in entity._meta.fields + entity._meta.many_to_many:
-            if getattr(settings, "APIS_API_EXCLUDE_SETS", False) and "_set" in str(field.name.lower()):
-                continue
-            if field.name.lower() in not_allowed_filter_fields or field.name == "tempentityclass_ptr":
-                continue
-            elif field.__class__.__name__ in ["ForeignKey", "ManyToManyField"]:
-                filter_fields[field.name] = ["exact"]
-                if field.__class__.__name__ == "ForeignKey":
-                    filter_fields[field.name].append("in")
-                for f2 in field.related_model._meta.fields:
-                    if f2.__class__.__name__ in [
-                        "CharField",
-                        "DateField",
-                        "IntegerField",
-                        "AutoField",
-                    ]:
-                        filter_fields[f"{field.name}__{f2.name}"] = allowed_fields_filter[f2.__class__.__name__]
-                continue
-            if field.__class__.__name__ in allowed_fields_filter.keys():
-                filter_fields[field.name] = allowed_fields_filter[field.__class__.__name__]
+        def get_serializer_class(self, *arg, **kwargs):
+            if self.action == "list":
+                return self._serializer_class
             else:
-                filter_fields[field.name] = ["exact"]
-        additional_filters = getattr(settings, "APIS_API_ADDITIONAL_FILTERS", False)
-        if additional_filters:
-            if entity_str in additional_filters.keys():
-                for f1 in additional_filters[entity_str]:
-                    if f1[0] not in filter_fields.keys():
-                        filter_fields[f1[0]] = f1[1]
+                return self._serializer_class_retrieve
+
+        def get_requested_fields(self):
+            if not hasattr(self, "_requested_fields"):
+                self._requested_fields = parse_requested_fields(self.request.query_params)
+            return self._requested_fields
+
+        def get_serializer_context(self):
+            context = super(self.__class__, self).get_serializer_context()
+            context["requested_fields"] = self.get_requested_fields()
+            if self.action == "retrieve" and self.model.__name__.lower() == "text":
+                cont = {}
+                cont["highlight"] = self.request.query_params.get("highlight", None)
+                cont["ann_proj_pk"] = self.request.query_params.get("ann_proj_pk", None)
+                cont["types"] = self.request.query_params.get("types", None)
+                cont["users_show"] = self.request.query_params.get("users_show", None)
+                cont["inline_annotations"] = self.request.query_params.get("inline_annotations", True)
+                context.update(cont)
+            return context
+
+        def get_queryset(self):
+            qs = self.model.objects.all()
+            if callable(getattr(qs, "filter_for_user", None)):
+                qs = qs.filter_for_user(request=self.request)
+            # only the joins and columns of the requested fields are loaded
+            requested = self.get_requested_fields()
+            prefetch_rel = [x for x in self._prefetch_rel if is_field_requested(requested, x)]
+            select_related = [x for x in self._select_related if is_field_requested(requested, x)]
+            if self._app_label == "apis_entities" and is_field_requested(requested, "sameAs"):
+                prefetch_rel.append("uri_set")
+            if len(prefetch_rel) > 0:
+                qs = qs.prefetch_related(*prefetch_rel)
+            if len(select_related) > 0:
+                qs = qs.select_related(*select_related)
+            if self.request.method in ["GET", "HEAD"] and requested != (None, set()):
+                # deferred instances are not saved, so this is restricted to reading requests
+                columns = [
+                    f.name
+                    for f in self.model._meta.concrete_fields
+                    if not f.primary_key and is_field_requested(requested, f.name)
+                ]
+                qs = qs.only(*columns) if len(columns) > 0 else qs.only("pk")
+            return qs
+
+        @extend_schema(responses=TemplateSerializer(many=True))
+        def list_viewset(self, request):
+            res = super(self.__class__, self).list(request)
+            return res
+
+        @extend_schema(parameters=sparse_fieldset_parameters)
+        def list(self, request, *args, **kwargs):
+            return super(self.__class__, self).list(request, *args, **kwargs)
+
+        @extend_schema(parameters=ndjson_parameters, responses={(200, "application/x-ndjson"): TemplateSerializer})
+        @action(**ndjson_action_kwargs)
+        def ndjson(self, request):
+            """
+            Streams all objects matching the filters as newline delimited JSON ordered by primary key, optionally
+            gzipped, in constant memory (see iter_ndjson).
+            """
+            qs = self.filter_queryset(self.get_queryset())
+            lines = iter_ndjson(
+                qs,
+                self._serializer_class,
+                self.get_serializer_context(),
+                chunk_size=getattr(settings, "APIS_NDJSON_CHUNK_SIZE", 2000),
+            )
+            filename = f"{self.model.__name__.lower()}.ndjson"
+            if request.query_params.get("gzip", "false").lower() in ["true", "1"]:
+                res = StreamingHttpResponse(iter_gzip(lines), content_type="application/gzip")
+                filename += ".gz"
+            else:
+                res = StreamingHttpResponse(lines, content_type="application/x-ndjson")
+            res["Content-Disposition"] = f'attachment; filename="{filename}"'
+            return res
 
-        class MetaFilter(object):
+        def dispatch(self, request, *args, **kwargs):
+            return super(self.__class__, self).dispatch(request, *args, **kwargs)
 
-            model = entity
-            fields = filter_fields
+        if entity_str.lower() == "text":
 
-        filterset_dict["Meta"] = MetaFilter
+            @extend_schema(
+                parameters=[
+                    OpenApiParameter(
+                        name="highlight",
+                        description="Whether to add annotations or not, defaults to true",
+                        type=OpenApiTypes.BOOL,
+                    ),
+                    OpenApiParameter(
+                        name="inline_annotations",
+                        description="Whether to add html5 mark tags for annotations to the text, defaults to false",
+                        type=OpenApiTypes.BOOL,
+                    ),
+                    OpenApiParameter(
+                        name="ann_proj_pk",
+                        description="PK of the annotation project to use for annotations",
+                        type=OpenApiTypes.INT,
+                    ),
+                    OpenApiParameter(
+                        name="types",
+                        description="Content type pks of annotation types to show. E.g. PersonPlace relations (comma sperated list)",
+                        type=OpenApiTypes.STR,
+                    ),
+                    OpenApiParameter(
+                        name="users_show",
+                        description="Filter annotations for users. PKs of users, comma seperated list",
+                        type=OpenApiTypes.STR,
+                    ),
+                ]
+                + sparse_fieldset_parameters,
+                responses={200: TemplateSerializerRetrieve},
+            )
+            def retrieve(self, request, pk=None):
+                res = super(self.__class__, self).retrieve(request, pk=pk)
+                return res
 
-        class TemplateViewSet(viewsets.ModelViewSet):
+        else:
 
-            _select_related = select_related
-            _prefetch_rel = prefetch_rel
-            pagination_class = CustomPagination
-            model = entity
-            # filter_backends = (DjangoFilterbackendSpectacular,)
-            filter_backends = (filters.DjangoFilterBackend, OrderingFilter)
-            filterset_fields = filter_fields
-            depth = 2
-            renderer_classes = (
-                renderers.JSONRenderer,
-                renderers.BrowsableAPIRenderer,
-                NetJsonRenderer,
+            @extend_schema(
+                parameters=[
+                    OpenApiParameter(
+                        name="include_relations",
+                        description="Whether to include serialization of relations or not. Usefull to avoid timeouts on big objects. Defaults to true",
+                        type=OpenApiTypes.BOOL,
+                    )
+                ]
+                + sparse_fieldset_parameters
             )
-            _serializer_class = TemplateSerializer
-            _serializer_class_retrieve = TemplateSerializerRetrieve
-
-            def get_serializer_class(self, *arg, **kwargs):
-                if self.action == "list":
-                    return self._serializer_class
-                else:
-                    return self._serializer_class_retrieve
-
-            def get_serializer_context(self):
-                context = super(self.__class__, self).get_serializer_context()
-                if self.action == "retrieve" and self.model.__name__.lower() == "text":
-                    cont = {}
-                    cont["highlight"] = self.request.query_params.get("highlight", None)
-                    cont["ann_proj_pk"] = self.request.query_params.get("ann_proj_pk", None)
-                    cont["types"] = self.request.query_params.get("types", None)
-                    cont["users_show"] = self.request.query_params.get("users_show", None)
-                    cont["inline_annotations"] = self.request.query_params.get("inline_annotations", True)
-                    context.update(cont)
-                return context
-
-            def get_queryset(self):
-                if "apis_relations" in str(self.model):
-                    qs = self.model.objects.filter_for_user()
-                else:
-                    qs = self.model.objects.all()
-                if len(self._prefetch_rel) > 0:
-                    qs = qs.prefetch_related(*self._prefetch_rel)
-                if len(self._select_related) > 0:
-                    qs = qs.select_related(*self._select_related)
-                return qs
-
-            @extend_schema(responses=TemplateSerializer(many=True))
-            def list_viewset(self, request):
-                res = super(self.__class__, self).list(request)
+            def retrieve(self, request, pk=None):
+                res = super(self.__class__, self).retrieve(request, pk=pk)
                 return res
 
-            def dispatch(self, request, *args, **kwargs):
-                return super(self.__class__, self).dispatch(request, *args, **kwargs)
-
-            if entity_str.lower() == "text":
-
-                @extend_schema(
-                    parameters=[
-                        OpenApiParameter(
-                            name="highlight",
-                            description="Whether to add annotations or not, defaults to true",
-                            type=OpenApiTypes.BOOL,
-                        ),
-                        OpenApiParameter(
-                            name="inline_annotations",
-                            description="Whether to add html5 mark tags for annotations to the text, defaults to false",
-                            type=OpenApiTypes.BOOL,
-                        ),
-                        OpenApiParameter(
-                            name="ann_proj_pk",
-                            description="PK of the annotation project to use for annotations",
-                            type=OpenApiTypes.INT,
-                        ),
-                        OpenApiParameter(
-                            name="types",
-                            description="Content type pks of annotation types to show. E.g. PersonPlace relations (comma sperated list)",
-                            type=OpenApiTypes.STR,
-                        ),
-                        OpenApiParameter(
-                            name="users_show",
-                            description="Filter annotations for users. PKs of users, comma seperated list",
-                            type=OpenApiTypes.STR,
-                        ),
-                    ],
-                    responses={200: TemplateSerializerRetrieve},
-                )
-                def retrieve(self, request, pk=None):
-                    res = super(self.__class__, self).retrieve(request, pk=pk)
-                    return res
+    TemplateViewSet.__name__ = TemplateViewSet.__qualname__ = f"Generic{entity_str.title().replace(' ', '')}ViewSet"
 
-            else:
+    serializers_dict[TemplateSerializer.__name__] = TemplateSerializer
+    return TemplateViewSet
 
-                @extend_schema(
-                    parameters=[
-                        OpenApiParameter(
-                            name="include_relations",
-                            description="Whether to include serialization of relations or not. Usefull to avoid timeouts on big objects. Defaults to true",
-                            type=OpenApiTypes.BOOL,
-                        )
-                    ]
-                )
-                def retrieve(self, request, pk=None):
-                    res = super(self.__class__, self).retrieve(request, pk=pk)
-                    return res
 
-        TemplateViewSet.__name__ = TemplateViewSet.__qualname__ = f"Generic{entity_str.title().replace(' ', '')}ViewSet"
+_generic_viewsets = {}
+
+
+def get_generic_viewset(model):
+    """
+    :param model: a model class
+    :return: the generic viewset of model, built on first use
+    """
+    if model not in _generic_viewsets:
+        _generic_viewsets[model] = build_generic_api_classes(model)
+    return _generic_viewsets[model]
+
+
+def generic_serializer_creation_factory():
+    """
+    Builds the generic API classes of all models at once, which otherwise happens route by route on first use.
+    """
+    for cont in GetContentTypes().get_model_classes():
+        get_generic_viewset(cont)
+
+
+class LazyGenericViewSet(viewsets.ModelViewSet):
+    """
+    Placeholder registered with the router instead of the generic viewset of a model. It offers the same routes, but
+    building the serializers, the filterset and the viewset is deferred until the first request (or schema generation)
+    instantiates it, which returns an instance of the real viewset instead.
+    """
+
+    _model = None
+
+    def __new__(cls, *args, **kwargs):
+        return get_generic_viewset(cls._model)(*args, **kwargs)
+
+    @action(**ndjson_action_kwargs)
+    def ndjson(self, request):
+        # only declares the route, see TemplateViewSet.ndjson
+        pass
+
+
+class LazyViews(Mapping):
+    """
+    Mapping of lower case model names to LazyGenericViewSet subclasses, used by the router in apis_core.urls.
+    """
+
+    def __init__(self):
+        self._models = None
+        self._views = {}
+
+    def _get_models(self):
+        if self._models is None:
+            self._models = {
+                str(cont.__name__).replace(" ", "").lower(): cont for cont in GetContentTypes().get_model_classes()
+            }
+        return self._models
+
+    def __getitem__(self, key):
+        if key not in self._views:
+            model = self._get_models()[key]
+            name = f"Generic{model.__name__.title().replace(' ', '')}ViewSet"
+            self._views[key] = type(name, (LazyGenericViewSet,), {"_model": model, "__module__": __name__})
+        return self._views[key]
+
+    def __iter__(self):
+        return iter(self._get_models())
 
-        serializers_dict[TemplateSerializer.__name__] = TemplateSerializer
-        views[f"{entity_str.lower().replace(' ', '')}"] = TemplateViewSet
+    def __len__(self):
+        return len(self._get_models())
 
 
 serializers_dict = dict()
-views = dict()
+views = LazyViews()
 # filter_classes = dict()
 # lst_filter_classes_check = []
-generic_serializer_creation_factory()
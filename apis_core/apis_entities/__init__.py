@@ -0,0 +1 @@
+default_app_config = 'apis_core.apis_entities.apps.EntitiesConfig'
@@ -10,6 +10,8 @@ urlpatterns = [
     url(r'^savenetworkfiles/$', api_views.SaveNetworkFiles.as_view()),
     url(r'^getorcreateentity/$', api_views.GetOrCreateEntity.as_view(), name='GetOrCreateEntity'),
     path(r'entity/<int:pk>/', api_views.GetEntityGeneric.as_view(), name="GetEntityGeneric"),
+    path(r'entities/batch/', api_views.GetEntitiesBatch.as_view(), name="GetEntitiesBatch"),
+    path(r'batch/', api_views.BatchWrite.as_view(), name="BatchWrite"),
     path(r'uri/', api_views.uri_resolver, name="UriResolver"),
     path(r'getrelatedplaces/', api_views.GetRelatedPlaces.as_view(), name="GetRelatedPlaces"),
     path(r'lifepath/<int:pk>/', api_views.LifePathViewset.as_view(), name="Lifepathviewset")
@@ -7,21 +7,23 @@ from io import TextIOWrapper
 import requests
 from django.conf import settings
 from django.db.models import Q, Prefetch
-from django.http import Http404
+from django.http import Http404, HttpResponse
 from django.shortcuts import redirect
 from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, viewsets
+from rest_framework import filters, status, viewsets
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import GenericAPIView
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.parsers import FileUploadParser
-from rest_framework.permissions import DjangoObjectPermissions
+from rest_framework.permissions import DjangoObjectPermissions, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.reverse import reverse_lazy
 from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
+from apis_core.api_renderers import MessagePackParser, MessagePackRenderer
 from apis_core.apis_metainfo.api_renderers import PaginatedCSVRenderer
 from apis_core.apis_metainfo.models import TempEntityClass, Uri
 from apis_core.apis_relations.models import (
@@ -31,12 +33,14 @@ from apis_core.apis_relations.models import (
     PersonInstitution,
 )
 from apis_core.apis_vocabularies.models import (
-    VocabsBaseClass,
     PersonPlaceRelation,
     InstitutionPlaceRelation,
 )
 from apis_core.default_settings.NER_settings import autocomp_settings, stb_base
+from apis_core.helper_functions import render_cache
 from apis_core.helper_functions.RDFParser import RDFParser
+from apis_core.helper_functions.batch_write import write_batch
+from apis_core.helper_functions.conditional_get import conditional_get, get_modification_stamp
 from apis_core.helper_functions.stanbolQueries import find_loc
 from .api_renderers import (
     EntityToTEI,
@@ -59,7 +63,7 @@ from .serializers import (
     GeoJsonSerializerTheme,
     LifePathSerializer,
 )
-from .serializers_generic import EntitySerializer
+from .serializers_generic import EntitySerializer, prefetch_entities, prefetch_entity_revisions
 
 
 # from metainfo.models import TempEntityClass
@@ -81,6 +85,7 @@ class GetEntityGeneric(GenericAPIView):
         EntityToCIDOCN3,
         EntityToCIDOCNQUADS,
         EntityToCIDOCTURTLE,
+        MessagePackRenderer,
     )
     if getattr(settings, "APIS_RENDERERS", None) is not None:
         rend_add = tuple()
@@ -90,29 +95,196 @@ class GetEntityGeneric(GenericAPIView):
                 rend_add + (cls,)
         renderer_classes += rend_add
 
-    def get_object(self, pk, request):
+    def get_object(self, pk, request, prefetch=False):
+        """
+        :param pk: pk of the entity, if there is none its uri is the url of the request
+        :param request: the request
+        :param prefetch: load the entity with everything the EntitySerializer shows of it, see prefetch_entities
+        :return: the entity
+        """
         try:
-            return TempEntityClass.objects_inheritance.get_subclass(pk=pk)
-        except TempEntityClass.DoesNotExist:
-            uri2 = Uri.objects.filter(uri=request.build_absolute_uri())
-            if uri2.count() == 1:
-                return TempEntityClass.objects_inheritance.get_subclass(
-                    pk=uri2[0].entity_id
-                )
-            else:
-                raise Http404
+            pk = int(pk)
+        except (TypeError, ValueError):
+            pk = None
+        if pk is not None and prefetch:
+            res = TempEntityClass.get_subclass_instances(
+                [pk],
+                prepare=lambda qs: prefetch_entities(qs, request=request)
+                if issubclass(qs.model, AbstractEntity)
+                else qs,
+            )
+            if pk in res:
+                prefetch_entity_revisions([res[pk]])
+                return res[pk]
+        elif pk is not None:
+            try:
+                return TempEntityClass.get_subclass_instance(pk)
+            except TempEntityClass.DoesNotExist:
+                pass
+        uri2 = Uri.objects.filter(uri=request.build_absolute_uri())
+        if uri2.count() == 1:
+            return TempEntityClass.get_subclass_instance(uri2[0].entity_id)
+        else:
+            raise Http404
 
     def get(self, request, pk):
-        ent = self.get_object(pk, request)
         data_view = request.GET.get('data-view', False)
         format_param = request.GET.get('format', False)
         requested_format = request.META.get('HTTP_ACCEPT')
         if requested_format is not None:
             if requested_format.startswith('text/html') and not data_view and not format_param:
-                return redirect(ent)
+                return redirect(self.get_object(pk, request))
+        modified = get_modification_stamp(self.get_queryset(), pk=pk)
+        if modified is None:
+            # unknown pks are looked up by their uri
+            return self.render_entity(request, self.get_object(pk, request, prefetch=True))
+        renderer_format = getattr(getattr(request, "accepted_renderer", None), "format", None)
+        return conditional_get(
+            request,
+            TempEntityClass,
+            pk,
+            modified,
+            lambda: self.render_cached(request, pk, modified, renderer_format),
+            renderer_format=renderer_format,
+        )
+
+    def render_cached(self, request, pk, modified, renderer_format):
+        """
+        Returns the rendered entity from the render cache, or renders it and stores it in finalize_response.
+        """
+        key = render_cache.get_render_key(request, pk, modified, renderer_format)
+        if key is None:
+            return self.render_entity(request, self.get_object(pk, request, prefetch=True))
+        rendered = render_cache.get_rendered(key)
+        if rendered is not None:
+            content, content_type = rendered
+            return HttpResponse(content, content_type=content_type)
+        # all versions are taken before the entity is loaded, so that a change during the rendering is not lost
+        deps = [render_cache.entity_dep(pk), render_cache.VOCABS_DEP]
+        deps.extend(render_cache.entity_dep(related) for related in TempEntityClass.get_related_pks([pk]))
+        versions = render_cache.get_versions(deps)
+        response = self.render_entity(request, self.get_object(pk, request, prefetch=True))
+        # a relation added in the meantime shows a target without a version, the response is not cached then
+        if set(render_cache.get_entity_deps(pk, response.data)).issubset(versions):
+            self._render_cache_entry = (key, versions)
+        return response
+
+    def render_entity(self, request, ent):
         res = EntitySerializer(ent, context={"request": request})
         return Response(res.data)
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        entry = getattr(self, "_render_cache_entry", None)
+        if entry is not None and response.status_code == 200:
+            response.render()
+            render_cache.set_rendered(entry[0], entry[1], response.content, response["Content-Type"])
+        return response
+
+
+class GetEntitiesBatch(APIView):
+    """
+    Serializes many entities at once. The entities are given by their ids and / or uris, either as query parameters
+    (ids=1,2,3&uri=http://...&uri=http://...) or as a POST body {"ids": [...], "uris": [...]}, which is read only as
+    well. At most APIS_BATCH_READ_MAX (default 5000) ids and uris are accepted per request.
+
+    The uris are resolved with one query, the entities are loaded with one query per entity class and the serializers
+    run over prefetched uris, labels, vocabularies and relations.
+    """
+
+    # the POST does not change anything, reading just needs an authenticated user like the other api views
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = tuple(api_settings.DEFAULT_RENDERER_CLASSES) + (MessagePackRenderer,)
+    parser_classes = tuple(api_settings.DEFAULT_PARSER_CLASSES) + (MessagePackParser,)
+
+    def get_identifiers(self, request):
+        """
+        :param request: the request
+        :return: tuple of the list of ids and the list of uris
+        """
+        if request.method == "POST":
+            ids = request.data.get("ids", [])
+            uris = request.data.get("uris", [])
+        else:
+            ids = [x for param in request.query_params.getlist("ids") for x in param.split(",") if x != ""]
+            uris = request.query_params.getlist("uri")
+        if not isinstance(ids, list) or not isinstance(uris, list):
+            raise ValidationError("ids and uris have to be lists")
+        max_items = getattr(settings, "APIS_BATCH_READ_MAX", 5000)
+        if len(ids) + len(uris) > max_items:
+            raise ValidationError(f"At most {max_items} ids and uris can be requested at once")
+        try:
+            ids = [int(x) for x in ids]
+        except (TypeError, ValueError):
+            raise ValidationError("ids have to be integers")
+        return ids, [str(x) for x in uris]
+
+    def get(self, request):
+        return self.serialize(request, *self.get_identifiers(request))
+
+    def post(self, request):
+        return self.serialize(request, *self.get_identifiers(request))
+
+    def serialize(self, request, ids, uris):
+        resolved_uris = dict(Uri.objects.filter(uri__in=uris).values_list("uri", "entity_id")) if uris else {}
+        pks = list(dict.fromkeys(ids + [pk for pk in resolved_uris.values() if pk is not None]))
+        instances = TempEntityClass.get_subclass_instances(
+            pks,
+            prepare=lambda qs: prefetch_entities(qs, request=request) if issubclass(qs.model, AbstractEntity) else qs,
+            queryset=TempEntityClass.objects.filter_for_user(request=request),
+        )
+        prefetch_entity_revisions(ent for ent in instances.values() if isinstance(ent, AbstractEntity))
+        results = []
+        for pk in pks:
+            ent = instances.get(pk)
+            if ent is not None and isinstance(ent, AbstractEntity):
+                results.append(EntitySerializer(ent, context={"request": request}).data)
+        found = {res["id"] for res in results}
+        return Response(
+            {
+                "results": results,
+                "uris": {uri: pk for uri, pk in resolved_uris.items() if pk in found},
+                "not_found": {
+                    "ids": [pk for pk in dict.fromkeys(ids) if pk not in found],
+                    "uris": [uri for uri in dict.fromkeys(uris) if resolved_uris.get(uri) not in found],
+                },
+            }
+        )
+
+
+class BatchWrite(APIView):
+    """
+    Creates many entities and relations in one transaction, see helper_functions.batch_write for the format of the
+    items. The body is {"items": [...], "atomic": true}; with atomic false the valid items are written even if others
+    are invalid. At most APIS_BATCH_WRITE_MAX (default 10000) items are accepted per request.
+
+    Returns one result per item, with the id of the created object or the validation errors.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = tuple(api_settings.DEFAULT_RENDERER_CLASSES) + (MessagePackRenderer,)
+    parser_classes = tuple(api_settings.DEFAULT_PARSER_CLASSES) + (MessagePackParser,)
+
+    def post(self, request):
+        data = request.data
+        if isinstance(data, list):
+            data = {"items": data}
+        items = data.get("items")
+        if not isinstance(items, list):
+            raise ValidationError("items has to be a list")
+        max_items = getattr(settings, "APIS_BATCH_WRITE_MAX", 10000)
+        if len(items) > max_items:
+            raise ValidationError(f"At most {max_items} items can be written at once")
+        atomic = data.get("atomic", True) not in [False, "false", "0", 0]
+        results, written = write_batch(items, user=request.user, atomic=atomic)
+        if written:
+            res_status = status.HTTP_201_CREATED
+        elif any(res["status"] == "invalid" for res in results):
+            res_status = status.HTTP_400_BAD_REQUEST
+        else:
+            res_status = status.HTTP_200_OK
+        return Response({"results": results}, status=res_status)
+
 
 @api_view(["GET"])
 def uri_resolver(request):
@@ -123,7 +295,7 @@ def uri_resolver(request):
     else:
         uri = Uri.objects.get(uri=uri)
         if f == "gui":
-            ent = TempEntityClass.objects_inheritance.get_subclass(pk=uri.entity_id)
+            ent = TempEntityClass.get_subclass_instance(uri.entity_id)
             c_name = ent.__class__.__name__
             url = reverse(
                 "apis_core:apis_entities:generic_entities_detail_view",
@@ -350,16 +522,8 @@ class NetJsonViewSet(viewsets.GenericViewSet):
                 else:
                     q_dict[rel_b + "__name__icontains"] = target
         if kind:
-            kind_ids = [int(kind.strip())]
-            kind_ids_res = [int(kind.strip())]
-            while len(kind_ids) > 0:
-                id_a = kind_ids.pop()
-                ids_b = VocabsBaseClass.objects.filter(
-                    parent_class_id=id_a
-                ).values_list("pk", flat=True)
-                kind_ids.extend(ids_b)
-                kind_ids_res.extend(ids_b)
-            q_dict["relation_type_id__in"] = kind_ids_res
+            # the relation kind and all of its sub kinds, joined through the closure table
+            q_dict["relation_type__ancestor_closures__ancestor_id"] = int(kind.strip())
         if "start_date" in request.data.keys():
             if len(request.data["start_date"]) > 0:
                 start_date_d = datetime.strptime(request.data["start_date"], "%d.%m.%Y")
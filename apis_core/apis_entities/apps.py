@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class EntitiesConfig(AppConfig):
     name = 'apis_core.apis_entities'
+
+    def ready(self):
+        from apis_core.helper_functions import registry
+
+        # (re)build the model class registry once all models are loaded, so that lookups never reflect on the modules
+        registry.build_registry(force=True)
@@ -26,21 +26,17 @@ def get_object_from_pk_or_uri(request, pk):
     """ checks if the given pk exists, if not checks if a matching apis-default uri exists
     and returns its entity"""
     try:
-        instance = TempEntityClass.objects_inheritance.get_subclass(pk=pk)
+        instance = TempEntityClass.get_subclass_instance(pk)
         return instance
     except TempEntityClass.DoesNotExist:
         domain = BASE_URI
         new_uri = f"{domain}entity/{pk}/"
         uri2 = Uri.objects.filter(uri=new_uri)
         if uri2.count() == 1:
-            instance = TempEntityClass.objects_inheritance.get_subclass(
-                pk=uri2[0].entity_id
-            )
+            instance = TempEntityClass.get_subclass_instance(uri2[0].entity_id)
         elif uri2.count() == 0:
             temp_obj = get_object_or_404(Uri, uri=new_uri[:-1])
-            instance = TempEntityClass.objects_inheritance.get_subclass(
-                pk=temp_obj.entity_id
-            )
+            instance = TempEntityClass.get_subclass_instance(temp_obj.entity_id)
         else:
             raise Http404
         return instance
@@ -79,13 +75,13 @@ class GenericEntitiesDetailView(UserPassesTestMixin, View):
                 dict_1 = {'related_' + entity.lower() + 'A': instance}
                 dict_2 = {'related_' + entity.lower() + 'B': instance}
                 if 'apis_highlighter' in settings.INSTALLED_APPS:
-                    objects = rel.objects.filter_ann_proj(request=request).filter_for_user().filter(
+                    objects = rel.objects.filter_ann_proj(request=request).filter_for_user(request=request).filter(
                         Q(**dict_1) | Q(**dict_2))
                 else:
                     objects = rel.objects.filter(
                         Q(**dict_1) | Q(**dict_2))
                     if callable(getattr(objects, 'filter_for_user', None)):
-                        objects = objects.filter_for_user()
+                        objects = objects.filter_for_user(request=request)
             else:
                 if match[0].lower() == entity.lower():
                     title_card = match[1].title()
@@ -93,11 +89,11 @@ class GenericEntitiesDetailView(UserPassesTestMixin, View):
                     title_card = match[0].title()
                 dict_1 = {'related_' + entity.lower(): instance}
                 if 'apis_highlighter' in settings.INSTALLED_APPS:
-                    objects = rel.objects.filter_ann_proj(request=request).filter_for_user().filter(**dict_1)
+                    objects = rel.objects.filter_ann_proj(request=request).filter_for_user(request=request).filter(**dict_1)
                 else:
                     objects = rel.objects.filter(**dict_1)
                     if callable(getattr(objects, 'filter_for_user', None)):
-                        objects = objects.filter_for_user()
+                        objects = objects.filter_for_user(request=request)
             tb_object = table(data=objects, prefix=prefix)
             tb_object_open = request.GET.get(prefix + 'page', None)
             RequestConfig(request, paginate={"per_page": 10}).configure(tb_object)
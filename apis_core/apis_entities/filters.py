@@ -5,6 +5,7 @@ import django_filters
 from django.conf import settings
 
 from apis_core.apis_entities.models import *
+from apis_core.apis_metainfo.models import Collection
 from apis_core.apis_vocabularies.models import RelationBaseClass
 
 
@@ -6,7 +6,11 @@ from django.core.management.base import BaseCommand
 from django.core.serializers.json import DjangoJSONEncoder
 
 from apis_core.apis_entities.models import AbstractEntity
-from apis_core.apis_entities.serializers_generic import EntitySerializer
+from apis_core.apis_entities.serializers_generic import (
+    EntitySerializer,
+    prefetch_entities,
+    prefetch_entity_revisions,
+)
 
 
 class Command(BaseCommand):
@@ -61,6 +65,24 @@ class Command(BaseCommand):
             help='Set if you want to add the texts attached to the entities (Boolean, Default: False).',
         )
 
+    def serialize(self, queryset, options):
+        """
+        Serializes a chunk of entities, their relations and revisions are loaded in bulk for the whole chunk.
+
+        :param queryset: queryset of the entities
+        :param options: the options of the command
+        :return: list of the serialized entities
+        """
+        queryset = prefetch_entities(queryset, only_published=options['only-published'])
+        if options['add-texts']:
+            queryset = queryset.prefetch_related('text__kind')
+        entities = list(queryset)
+        prefetch_entity_revisions(entities)
+        return [
+            EntitySerializer(e, only_published=options['only-published'], add_texts=options['add-texts']).data
+            for e in entities
+        ]
+
     def handle(self, *args, **options):
         ent = AbstractEntity.get_entity_class_of_name(options['entity'])
         res = []
@@ -72,17 +94,14 @@ class Command(BaseCommand):
             self.stdout.write(self.style.NOTICE('More than 1000 objects, caching'))
             cnt = 0
             while (cnt * 1000) < objcts.count():
-                r = []
-                for e in objcts[1000*cnt:(1000*cnt+1000)]:
-                    r.append(EntitySerializer(e, only_published=options['only-published'], add_texts=options['add-texts']).data)
+                r = self.serialize(objcts[1000*cnt:(1000*cnt+1000)], options)
                 with open(f'serializer_cache/{cnt}.pkl', 'wb') as out:
                     pickle.dump(r, out)
                     self.stdout.write(self.style.NOTICE(f'Pickle written to: serializer_cache/{cnt}.pkl'))
                 cnt += 1
             res = '/home/sennierer/projects/apis-webpage-base/serializer_cache'
         elif not options['use-cache']:
-            for e in objcts:
-                res.append(EntitySerializer(e, only_published=options['only-published'], add_texts=options['add-texts']).data)
+            res = self.serialize(objcts, options)
         elif options['use-cache']:
             self.stdout.write(self.style.NOTICE('using cache for serializing'))
             res = '/home/sennierer/projects/apis-webpage-base/serializer_cache'
@@ -97,4 +116,4 @@ class Command(BaseCommand):
                         data_lst.extend(pickle.load(inf))
                 json.dump(data_lst, outp, cls=DjangoJSONEncoder)
             elif isinstance(res, list):
-                json.dump(res, out, pcls=DjangoJSONEncoder)
\ No newline at end of file
+                json.dump(res, outp, cls=DjangoJSONEncoder)
\ No newline at end of file
@@ -1,6 +1,4 @@
-import inspect
 import re
-import sys
 import unicodedata
 import yaml
 
@@ -10,12 +8,11 @@ from django.conf import settings
 from django.contrib.auth.models import Group
 from django.db import models
 from django.db.models import Q
-from django.db.models.signals import m2m_changed, post_save
+from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.urls import reverse
-from guardian.shortcuts import assign_perm, remove_perm
 
-from apis_core.apis_metainfo.models import Collection, TempEntityClass, Uri
+from apis_core.apis_metainfo.models import TempEntityClass, Uri
 from apis_core.apis_vocabularies.models import (
     EventType,
     InstitutionType,
@@ -24,7 +21,7 @@ from apis_core.apis_vocabularies.models import (
     Title,
     WorkType,
 )
-from apis_core.helper_functions import EntityRelationFieldGenerator
+from apis_core.helper_functions import EntityRelationFieldGenerator, registry
 
 BASE_URI = getattr(settings, "APIS_BASE_URI", "http://apis.info/")
 DOMAIN_DEFAULT = getattr(settings, "APIS_DEFAULT_DOMAIN", "apis default")
@@ -45,10 +42,21 @@ class AbstractEntity(TempEntityClass):
     class Meta:
         abstract = True
 
-    def __init__(self, *args, **kwargs):
-
-        super().__init__(*args, **kwargs)
-        self.__class__.create_relation_methods_from_manytomany_fields()
+    @classmethod
+    def bulk_create_instances(cls, instances, batch_size=1000, parse_dates=True):
+        """
+        Inserts many new entities of this class in batches and creates their default uris in bulk, see
+        TempEntityClass.bulk_create_instances.
+        """
+        instances = super().bulk_create_instances(instances, batch_size=batch_size, parse_dates=parse_dates)
+        if len(instances) > 0:
+            uri_template = get_default_uri(0)
+            prefix, suffix = uri_template[: uri_template.rindex("0")], uri_template[uri_template.rindex("0") + 1 :]
+            Uri.objects.bulk_create(
+                [Uri(uri=f"{prefix}{obj.pk}{suffix}", domain=DOMAIN_DEFAULT, entity_id=obj.pk) for obj in instances],
+                batch_size=batch_size,
+            )
+        return instances
 
     # Methods dealing with individual data retrievals of instances
     ####################################################################################################################
@@ -119,6 +127,9 @@ class AbstractEntity(TempEntityClass):
         It was not possible to my understanding to change managers in such a way that two (the A and the B) could be combined
         into one manager. Hence these additional shortcut methods.
 
+        This is called once per entity class in 'generate_all_fields' of the EntityRelationFieldGenerator, and not on
+        instantiation, so that iterating over large querysets does not pay for it on every row.
+
         :return: None
         """
 
@@ -219,37 +230,13 @@ class AbstractEntity(TempEntityClass):
     # Methods dealing with all entities
     ####################################################################################################################
 
-    _all_entity_classes = None
-    _all_entity_names = None
-
     @classmethod
     def get_all_entity_classes(cls):
         """
         :return: list of all python classes of the entities defined within this models' module
         """
 
-        if cls._all_entity_classes == None:
-
-            entity_classes = []
-            entity_names = []
-
-            for entity_name, entity_class in inspect.getmembers(
-                sys.modules[__name__], inspect.isclass
-            ):
-
-                if (
-                    entity_class.__module__ == "apis_core.apis_entities.models"
-                    and entity_name != "ent_class"
-                    and entity_name != "AbstractEntity"
-                ):
-
-                    entity_classes.append(entity_class)
-                    entity_names.append(entity_name.lower())
-
-            cls._all_entity_classes = entity_classes
-            cls._all_entity_names = entity_names
-
-        return cls._all_entity_classes
+        return registry.get_entity_classes()
 
     @classmethod
     def get_entity_class_of_name(cls, entity_name):
@@ -258,11 +245,11 @@ class AbstractEntity(TempEntityClass):
         :return: The model class of the entity respective to the given name
         """
 
-        for entity_class in cls.get_all_entity_classes():
-            if entity_class.__name__.lower() == entity_name.lower():
-                return entity_class
+        entity_class = registry.get_entity_class(entity_name)
+        if entity_class is None:
+            raise Exception("Could not find entity class of name:", entity_name)
 
-        raise Exception("Could not find entity class of name:", entity_name)
+        return entity_class
 
     @classmethod
     def get_all_entity_names(cls):
@@ -270,11 +257,7 @@ class AbstractEntity(TempEntityClass):
         :return: list of all class names in lower case of the entities defined within this models' module
         """
 
-        if cls._all_entity_names == None:
-
-            cls.get_all_entity_classes()
-
-        return cls._all_entity_names
+        return registry.get_entity_names()
 
     # Methods dealing with related entities
     ####################################################################################################################
@@ -362,6 +345,10 @@ class AbstractEntity(TempEntityClass):
 
     def get_related_relation_instances(self):
         """
+        Loads the relations together with their relation types, the entities of both sides and the uris of these
+        entities, so that serializing them costs a fixed number of queries (three) per relation class instead of
+        several queries per relation.
+
         :return: list of queryset of all relation instances which are somehow related to the calling entity instance
         """
 
@@ -370,14 +357,20 @@ class AbstractEntity(TempEntityClass):
         for relation_class in self.get_related_relation_classes():
 
             q_args = Q()
+            field_nameA = relation_class.get_related_entity_field_nameA()
+            field_nameB = relation_class.get_related_entity_field_nameB()
 
             if relation_class.get_related_entity_classA() == self.__class__:
-                q_args |= Q(**{relation_class.get_related_entity_field_nameA(): self})
+                q_args |= Q(**{field_nameA: self})
 
             if relation_class.get_related_entity_classB() == self.__class__:
-                q_args |= Q(**{relation_class.get_related_entity_field_nameB(): self})
+                q_args |= Q(**{field_nameB: self})
 
-            queryset = relation_class.objects.filter(q_args)
+            queryset = (
+                relation_class.objects.filter(q_args)
+                .select_related("relation_type", field_nameA, field_nameB)
+                .prefetch_related(f"{field_nameA}__uri_set", f"{field_nameB}__uri_set")
+            )
             queryset_list.extend(list(queryset))
 
         return queryset_list
@@ -604,17 +597,22 @@ if a_ents:
             reversion.register(ent_class, follow=["tempentityclass_ptr"])
 
 
+def get_default_uri(pk):
+    """
+    :param pk: primary key of an entity
+    :return: the default uri of the entity, pointing to the generic entity endpoint
+    """
+    if BASE_URI.endswith("/"):
+        base1 = BASE_URI[:-1]
+    else:
+        base1 = BASE_URI
+    return "{}{}".format(base1, reverse("GetEntityGenericRoot", kwargs={"pk": pk}))
+
+
 @receiver(post_save, dispatch_uid="create_default_uri")
 def create_default_uri(sender, instance, **kwargs):
     if kwargs["created"] and sender in [Person, Institution, Place, Work, Event] + ents_cls_list:
-        if BASE_URI.endswith("/"):
-            base1 = BASE_URI[:-1]
-        else:
-            base1 = BASE_URI
-        uri_c = "{}{}".format(
-            base1, reverse("GetEntityGenericRoot", kwargs={"pk": instance.pk}),
-        )
-        uri2 = Uri(uri=uri_c, domain=DOMAIN_DEFAULT, entity=instance)
+        uri2 = Uri(uri=get_default_uri(instance.pk), domain=DOMAIN_DEFAULT, entity=instance)
         uri2.save()
 
 
@@ -627,50 +625,8 @@ lst_entities_complete = [
     and globals()[x]
 ]
 lst_entities_complete = list(dict.fromkeys(lst_entities_complete))
-perm_change_senders = [
-    getattr(getattr(x, "collection"), "through") for x in lst_entities_complete
-] # TODO: Inspect. This list here will contain only duplicates if `lst_entities_complete` contains all entities
-
-
-@receiver(
-    m2m_changed, dispatch_uid="create_object_permissions",
-)
-def create_object_permissions(sender, instance, **kwargs):
-    if kwargs["action"] == "pre_add" and sender in perm_change_senders:
-        perms = []
-        for j in kwargs["model"].objects.filter(pk__in=kwargs["pk_set"]):
-            perms.extend(j.groups_allowed.all())
-        for x in perms:
-            assign_perm("change_" + instance.__class__.__name__.lower(), x, instance)
-            assign_perm("delete_" + instance.__class__.__name__.lower(), x, instance)
-    elif kwargs["action"] == "post_remove" and sender in perm_change_senders:
-        perms = []
-        perms_keep = []
-        for j in kwargs["model"].objects.filter(pk__in=kwargs["pk_set"]):
-            perms.extend(j.groups_allowed.all())
-        for u in instance.collection.all():
-            perms_keep.extend(u.groups_allowed.all())
-        rm_perms = set(perms) - set(perms_keep)
-        for x in rm_perms:
-            remove_perm("change_" + instance.__class__.__name__.lower(), x, instance)
-            remove_perm("delete_" + instance.__class__.__name__.lower(), x, instance)
-
-
-@receiver(
-    m2m_changed,
-    sender=Collection.groups_allowed.through,
-    dispatch_uid="add_usergroup_collection",
-)
-def add_usergroup_collection(sender, instance, **kwargs):
-    if kwargs["action"] == "pre_add":
-        for x in kwargs["model"].objects.filter(pk__in=kwargs["pk_set"]):
-            for z in ["change", "delete"]:
-                for y in [Person, Institution, Place, Event, Work]:
-                    assign_perm(
-                        z + "_" + y.__name__.lower(),
-                        x,
-                        y.objects.filter(collection=instance),
-                    )
+# the change and delete permissions of entities follow from their collections at query time, see
+# apis_core.apis_metainfo.permissions, so collection changes no longer write per-object permission rows
 
 
 if "registration" in getattr(settings, "INSTALLED_APPS", []):
@@ -1,12 +1,15 @@
 import re
 
+from django.apps import apps
 from django.conf import settings
-from django.contrib.contenttypes.models import ContentType
+from django.db import models
+from django.db.models import Prefetch
 from django.db.models.query import QuerySet
-from django.urls import reverse
+from django.urls import get_script_prefix, get_urlconf, reverse
 from rest_framework import serializers
 from reversion.models import Version
 
+from apis_core.apis_labels.models import Label
 from apis_core.apis_labels.serializers import LabelSerializerLegacy as LabelSerializer
 
 base_uri = getattr(settings, "APIS_BASE_URI", "http://apis.info")
@@ -14,6 +17,361 @@ if base_uri.endswith("/"):
     base_uri = base_uri[:-1]
 
 
+_url_templates = {}
+
+
+def _reverse_pk(viewname, pk):
+    """
+    Same as reverse(viewname, kwargs={"pk": pk}), but the url is only resolved once per view name (and url conf and
+    script prefix), the serializers need it for every entity and relation.
+
+    :param viewname: name of a url pattern with a numeric pk as its only argument
+    :param pk: the pk
+    :return: the path
+    """
+    key = (viewname, get_urlconf(), get_script_prefix())
+    template = _url_templates.get(key)
+    if template is None:
+        marker = "987654321987654321"
+        template = tuple(reverse(viewname, kwargs={"pk": marker}).split(marker, 1))
+        _url_templates[key] = template
+    return f"{template[0]}{pk}{template[1]}"
+
+
+def _is_vocab_field(field):
+    return field.is_relation and str(field.related_model.__module__).endswith("apis_vocabularies.models")
+
+
+def _prefetched(obj, accessor):
+    """
+    :param obj: a model instance
+    :param accessor: name of a to-many accessor of obj, e.g. "uri_set"
+    :return: the list of related objects loaded by prefetch_entities, or None if they were not prefetched
+    """
+    return getattr(obj, "_apis_" + accessor, None)
+
+
+def _related(obj, accessor):
+    """
+    :param obj: a model instance
+    :param accessor: name of a to-many accessor of obj, e.g. "uri_set"
+    :return: the related objects, taken from the prefetched ones if there are some
+    """
+    res = _prefetched(obj, accessor)
+    if res is None:
+        return getattr(obj, accessor).all()
+    return res
+
+
+def _visible_relations(obj, accessor):
+    """
+    :param obj: an entity
+    :param accessor: name of a reverse accessor of relations of the entity, e.g. "personplace_set"
+    :return: the relations visible in the current request, taken from the prefetched ones if there are some
+    """
+    res = _prefetched(obj, accessor)
+    if res is not None:
+        # prefetched by prefetch_entities, which applied the visibility rule already
+        return res
+    return getattr(obj, accessor).all().filter_for_user()
+
+
+def _entity_lookups(model, prefix="", through=""):
+    """
+    lookups of the fields the EntitySerializer shows of an entity of model, except its relations. The to-many
+    lookups are stored in plain lists (see _prefetched), which spares Django a related manager per object, through
+    is prepended to them.
+    """
+    select = [prefix + f.name for f in model._meta.fields if _is_vocab_field(f)]
+    prefix = through + prefix
+    prefetch = [
+        Prefetch(prefix + "uri_set", to_attr="_apis_uri_set"),
+        Prefetch(
+            prefix + "label_set",
+            queryset=Label._default_manager.select_related("label_type"),
+            to_attr="_apis_label_set",
+        ),
+    ]
+    for f in model._meta.many_to_many:
+        if f.name.endswith("relationtype_set"):
+            continue
+        if f.name == "collection" or _is_vocab_field(f):
+            prefetch.append(Prefetch(prefix + f.name, to_attr="_apis_" + f.name))
+    return select, prefetch
+
+
+def prefetch_entities(queryset, request=None, only_published=True):
+    """
+    Prepares a queryset of one entity class for the EntitySerializer: the uris, labels, vocabularies, collections and
+    relations (with their relation types and related entities) of all entities are loaded with a fixed number of
+    queries, instead of some queries per entity and relation.
+
+    :param queryset: queryset of an entity class
+    :param request: the request, the relations are restricted to the ones visible in it
+    :param only_published: same as the only_published argument of the EntitySerializer
+    :return: the queryset with the select_related and prefetch_related lookups added
+    """
+    # local import: apis_metainfo.models imports this module, and apis_relations.models imports apis_metainfo.models
+    from apis_core.apis_relations.models import AbstractRelation
+
+    model = queryset.model
+    select, prefetch = _entity_lookups(model)
+    for relation_class in AbstractRelation.get_relation_classes_of_entity_class(model):
+        field_names = [
+            (relation_class.get_related_entity_field_nameA(), relation_class.get_related_entity_field_nameB()),
+            (relation_class.get_related_entity_field_nameB(), relation_class.get_related_entity_field_nameA()),
+        ]
+        for own_field_name, target_field_name in field_names:
+            own_field = relation_class._meta.get_field(own_field_name)
+            if own_field.related_model != model:
+                continue
+            accessor = own_field.remote_field.get_accessor_name()
+            target_model = relation_class._meta.get_field(target_field_name).related_model
+            target_select, target_prefetch = _entity_lookups(
+                target_model, prefix=target_field_name + "__", through=f"_apis_{accessor}__"
+            )
+            if only_published or target_model == model:
+                # add_relations filters the relations between entities of the same class in any case
+                rel_qs = relation_class.objects.filter_for_user(request=request)
+            else:
+                rel_qs = relation_class.objects.all()
+            prefetch.append(
+                Prefetch(
+                    accessor,
+                    queryset=rel_qs.select_related("relation_type", target_field_name, *target_select),
+                    to_attr="_apis_" + accessor,
+                )
+            )
+            prefetch.extend(target_prefetch)
+    return queryset.select_related(*select).prefetch_related(*prefetch)
+
+
+def prefetch_revisions(objs):
+    """
+    Loads the reversion history of entities and relations with one query per class, instead of one query per object
+    in add_revisions. The versions are stored on the objects, objects which have them already are skipped.
+
+    :param objs: iterable of entities and / or relations
+    """
+    by_model = {}
+    for obj in objs:
+        if obj is not None and not hasattr(obj, "_apis_revisions"):
+            by_model.setdefault(type(obj), {}).setdefault(str(obj.pk), []).append(obj)
+    for model, model_objs in by_model.items():
+        versions = {}
+        for v in (
+            Version.objects.get_for_model(model).filter(object_id__in=list(model_objs)).select_related("revision__user")
+        ):
+            versions.setdefault(v.object_id, []).append(v)
+        for object_id, same_objs in model_objs.items():
+            for obj in same_objs:
+                obj._apis_revisions = versions.get(object_id, [])
+
+
+def _relation_entities(rel):
+    """
+    :param rel: a relation
+    :return: list of the entities of rel which are loaded already
+    """
+    return [
+        f.get_cached_value(rel)
+        for f in rel._meta.fields
+        if f.name.startswith("related_") and f.is_relation and f.is_cached(rel)
+    ]
+
+
+def prefetch_entity_revisions(entities):
+    """
+    Loads the revisions of entities, of their prefetched relations (see prefetch_entities) and of the entities these
+    relations point to, with one query per class.
+
+    :param entities: iterable of entities
+    """
+    objs = list(entities)
+    for ent in list(objs):
+        for key, accessors in get_serializer_plan(type(ent))["relations"]:
+            for accessor, own_class, is_reverse, same_class in accessors:
+                for rel in _prefetched(ent, accessor) or []:
+                    objs.append(rel)
+                    objs.extend(_relation_entities(rel))
+    prefetch_revisions(objs)
+
+
+def _serialize_revisions(obj):
+    """
+    :param obj: an entity or relation
+    :return: list of dicts describing the revisions of obj, newest first
+    """
+    ver = getattr(obj, "_apis_revisions", None)
+    if ver is None:
+        ver = Version.objects.get_for_object(obj).select_related("revision__user")
+    res = []
+    for v in ver:
+        usr_1 = getattr(v.revision, "user", None)
+        if usr_1 is not None:
+            usr_1 = usr_1.username
+        else:
+            usr_1 = "Not specified"
+        res.append(
+            {
+                "id": v.id,
+                "date_created": v.revision.date_created,
+                "user_created": usr_1,
+            }
+        )
+    return res
+
+
+_serializer_plans = {}
+_relation_plans = {}
+
+
+def _get_field_plan(serializer):
+    """
+    :param serializer: serializer whose fields are bound once and then reused for every object, see _represent
+    :return: list of tuples of field name, kind ("method", "many" or "value") and field
+    """
+    res = []
+    for name, field in serializer.fields.items():
+        if isinstance(field, serializers.SerializerMethodField):
+            res.append((name, "method", field))
+        elif isinstance(field, serializers.ListSerializer) and len(field.source_attrs) == 1:
+            res.append((name, "many", field))
+        else:
+            res.append((name, "value", field))
+    return res
+
+
+def _represent(serializer, field_plan, instance):
+    """
+    Serializes instance like Serializer.to_representation does, but with the fields of a plan instead of fields built
+    per serializer. The methods of SerializerMethodFields are called on serializer, to-many fields use the lists
+    loaded by prefetch_entities if there are some.
+
+    :param serializer: the serializer which serializes instance
+    :param field_plan: list as returned by _get_field_plan
+    :param instance: the object
+    :return: dict of the representation
+    """
+    ret = {}
+    for name, kind, field in field_plan:
+        if kind == "method":
+            ret[name] = getattr(serializer, field.method_name)(instance)
+        elif kind == "many":
+            ret[name] = field.to_representation(_related(instance, field.source))
+        else:
+            attribute = field.get_attribute(instance)
+            ret[name] = None if attribute is None else field.to_representation(attribute)
+    return ret
+
+
+def _get_relation_accessors(model):
+    """
+    :param model: an entity class
+    :return: list of tuples of the key in the relations of the serialization (e.g. "places") and a list of tuples of
+        the accessor of the relations, the own class to pass to the RelationEntitySerializer, whether the entity is on
+        the reverse side and whether the relations are between entities of the same class
+    """
+    mk = model.__name__
+    res = []
+    for relation_class in apps.get_app_config("apis_relations").get_models():
+        rel_name = relation_class._meta.model_name
+        if mk.lower() not in rel_name:
+            continue
+        mk2 = re.match(r"{}([A-Za-z]+)".format(mk.lower()), rel_name)
+        is_reverse = False
+        if not mk2:
+            mk2 = re.match(r"([A-Za-z]+){}".format(mk.lower()), rel_name)
+            is_reverse = True
+        if mk2.group(1).lower() != mk.lower():
+            accessors = [("{}_set".format(rel_name), mk, is_reverse, False)]
+        else:
+            accessors = [
+                ("related_{}A".format(mk.lower()), "{}B".format(mk.lower()), True, True),
+                ("related_{}B".format(mk.lower()), "{}A".format(mk.lower()), False, True),
+            ]
+        res.append(("{}s".format(mk2.group(1)), accessors))
+    return res
+
+
+def get_serializer_plan(model):
+    """
+    The EntitySerializer works through a plan per entity class, which is computed once: the bound fields to emit
+    (scalar fields, vocabularies, collections, uris, labels ...) and the relation classes with their accessors.
+
+    :param model: an entity class
+    :return: dict with the field plan ("fields", see _get_field_plan) without relations and texts, the field plan
+        entry of the texts ("text") and the relation accessors ("relations", see _get_relation_accessors)
+    """
+    plan = _serializer_plans.get(model)
+    if plan is None:
+        template = EntitySerializer(depth_ent=0, add_texts=True)
+        template._model = model
+        fields = _get_field_plan(template)
+        plan = {
+            "fields": [x for x in fields if x[0] != "text"],
+            "text": [x for x in fields if x[0] == "text"],
+            "relations": _get_relation_accessors(model),
+        }
+        _serializer_plans[model] = plan
+    return plan
+
+
+def get_relation_plan(model, own_class):
+    """
+    :param model: a relation class
+    :param own_class: the own class as passed to the RelationEntitySerializer
+    :return: dict with the name of the target entity ("entity_type", e.g. "place" for related_place) and the field
+        plan ("fields", see _get_field_plan)
+    """
+    key = (model, own_class.lower())
+    plan = _relation_plans.get(key)
+    if plan is None:
+        entity_type = None
+        for f in model._meta.fields:
+            if f.name.startswith("related_"):
+                mk2 = f.name.replace("related_", "")
+                if mk2.lower() != own_class.lower():
+                    entity_type = mk2
+        template = RelationEntitySerializer(own_class=own_class)
+        template.entity_type = entity_type
+        plan = {"entity_type": entity_type, "fields": _get_field_plan(template)}
+        _relation_plans[key] = plan
+    return plan
+
+
+def _get_model_fields(model):
+    """
+    :param model: an entity class
+    :return: dict of the fields the EntitySerializer shows of model in addition to its declared ones
+    """
+    res = {}
+    for f in model._meta.fields:
+        field_name = f.__class__.__name__
+        if field_name in [
+            "CharField",
+            "DateField",
+            "DateTimeField",
+            "IntegerField",
+            "FloatField",
+        ]:
+            res[f.name] = getattr(serializers, field_name)()
+        elif field_name in ["ForeignKey", "ManyToMany"]:
+            if str(f.related_model.__module__).endswith("apis_vocabularies.models"):
+                many = False
+                if f.many_to_many or f.one_to_many:
+                    many = True
+                res[f.name] = VocabsSerializer(many=many)
+    for f in model._meta.many_to_many:
+        if f.name.endswith("relationtype_set"):
+            continue
+        elif f.name == "collection":
+            res["collection"] = CollectionSerializer(many=True)
+        elif str(f.related_model.__module__).endswith("apis_vocabularies.models"):
+            res[f.name] = VocabsSerializer(many=True)
+    return res
+
+
 class CollectionSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     name = serializers.CharField()
@@ -47,81 +405,35 @@ class EntitySerializer(serializers.Serializer):
     revisions = serializers.SerializerMethodField(method_name="add_revisions")
 
     def add_revisions(self, obj):
-        ver = Version.objects.get_for_object(obj)
-        res = []
-        for v in ver:
-            usr_1 = getattr(v.revision, "user", None)
-            if usr_1 is not None:
-                usr_1 = usr_1.username
-            else:
-                usr_1 = "Not specified"
-            res.append(
-                {
-                    "id": v.id,
-                    "date_created": v.revision.date_created,
-                    "user_created": usr_1,
-                }
-            )
-        return res
+        return _serialize_revisions(obj)
 
     def add_relations(self, obj):
         res = {}
-        mk = obj.__class__.__name__
-        for rel in ContentType.objects.filter(
-            app_label="apis_relations", model__icontains=mk.lower()
-        ):
-            mk2 = re.match(r"{}([A-Za-z]+)".format(mk.lower()), rel.model)
-            reverse = False
-            if not mk2:
-                mk2 = re.match(r"([A-Za-z]+){}".format(mk.lower()), rel.model)
-                reverse = True
-            res["{}s".format(mk2.group(1))] = []
-            if mk2.group(1).lower() != mk.lower():
-                if self._only_published:
-                    rel_qs = (
-                        getattr(obj, "{}_set".format(rel.model)).all().filter_for_user()
-                    )
+        for key, accessors in get_serializer_plan(type(obj))["relations"]:
+            res[key] = []
+            for accessor, own_class, is_reverse, same_class in accessors:
+                if self._only_published or same_class:
+                    # the relations between entities of the same class are filtered in any case
+                    rel_qs = list(_visible_relations(obj, accessor))
                 else:
-                    rel_qs = getattr(obj, "{}_set".format(rel.model)).all()
-                for rel2 in rel_qs:
-                    res["{}s".format(mk2.group(1))].append(
-                        RelationEntitySerializer(
-                            rel2,
-                            own_class=mk,
-                            read_only=True,
-                            context=self.context,
-                            reverse=reverse,
-                        ).data
-                    )
-            else:
-                for t in ["A", "B"]:
-                    for rel2 in (
-                        getattr(obj, "related_{}{}".format(mk.lower(), t))
-                        .all()
-                        .filter_for_user()
-                    ):
-                        if t == "A":
-                            ok = "{}B".format(mk.lower())
-                            reverse = True
-                        else:
-                            ok = "{}A".format(mk.lower())
-                            reverse = False
-                        res["{}s".format(mk2.group(1))].append(
-                            RelationEntitySerializer(
-                                rel2,
-                                own_class=ok,
-                                read_only=True,
-                                context=self.context,
-                                reverse=reverse,
-                            ).data
-                        )
+                    rel_qs = list(_related(obj, accessor))
+                if len(rel_qs) == 0:
+                    continue
+                prefetch_revisions(rel_qs + [ent for rel2 in rel_qs for ent in _relation_entities(rel2)])
+                rel_serializer = RelationEntitySerializer(
+                    own_class=own_class,
+                    read_only=True,
+                    context=self.context,
+                    reverse=is_reverse,
+                )
+                res[key].extend(rel_serializer.to_representation(rel2) for rel2 in rel_qs)
         return res
 
     def add_entity_type(self, obj):
         return str(obj.__class__.__name__)
 
     def add_url(self, obj):
-        url = f"{base_uri}{reverse('GetEntityGenericRoot', kwargs={'pk': obj.pk})}"
+        url = f"{base_uri}{_reverse_pk('GetEntityGenericRoot', obj.pk)}"
         return url
 
     def __init__(
@@ -129,44 +441,39 @@ class EntitySerializer(serializers.Serializer):
     ):
         super(EntitySerializer, self).__init__(*args, **kwargs)
         self._only_published = only_published
-        if type(self.instance) == QuerySet:
-            inst = self.instance[0]
+        self._depth_ent = depth_ent
+        self._add_texts = add_texts
+        if isinstance(self.instance, QuerySet):
+            self._model = self.instance.model
+        elif isinstance(self.instance, models.Model):
+            self._model = type(self.instance)
         else:
-            inst = self.instance
-        if inst is None:
-            return
-        for f in inst._meta.fields:
-            field_name = re.search(r"([A-Za-z]+)\'>", str(f.__class__)).group(1)
-            if field_name in [
-                "CharField",
-                "DateField",
-                "DateTimeField",
-                "IntegerField",
-                "FloatField",
-            ]:
-                self.fields[f.name] = getattr(serializers, field_name)()
-            elif field_name in ["ForeignKey", "ManyToMany"]:
-                if str(f.related_model.__module__).endswith("apis_vocabularies.models"):
-                    many = False
-                    if f.many_to_many or f.one_to_many:
-                        many = True
-                    self.fields[f.name] = VocabsSerializer(many=many)
-        for f in inst._meta.many_to_many:
-            if f.name.endswith("relationtype_set"):
-                continue
-            elif f.name == "collection":
-                self.fields["collection"] = CollectionSerializer(many=True)
-            elif str(f.related_model.__module__).endswith("apis_vocabularies.models"):
-                self.fields[f.name] = VocabsSerializer(many=True)
-        self.fields["entity_type"] = serializers.SerializerMethodField(
+            self._model = None
+
+    def get_fields(self):
+        fields = super(EntitySerializer, self).get_fields()
+        if self._model is None:
+            return fields
+        fields.update(_get_model_fields(self._model))
+        fields["entity_type"] = serializers.SerializerMethodField(
             method_name="add_entity_type"
         )
-        if depth_ent == 1:
-            self.fields["relations"] = serializers.SerializerMethodField(
+        if self._depth_ent == 1:
+            fields["relations"] = serializers.SerializerMethodField(
                 method_name="add_relations"
             )
-        if add_texts:
-            self.fields["text"] = TextSerializer(many=True)
+        if self._add_texts:
+            fields["text"] = TextSerializer(many=True)
+        return fields
+
+    def to_representation(self, instance):
+        plan = get_serializer_plan(type(instance))
+        ret = _represent(self, plan["fields"], instance)
+        if self._depth_ent == 1:
+            ret["relations"] = self.add_relations(instance)
+        if self._add_texts:
+            ret.update(_represent(self, plan["text"], instance))
+        return ret
 
 
 class RelationEntitySerializer(serializers.Serializer):
@@ -180,22 +487,7 @@ class RelationEntitySerializer(serializers.Serializer):
     revisions = serializers.SerializerMethodField(method_name="add_revisions")
 
     def add_revisions(self, obj):
-        ver = Version.objects.get_for_object(obj)
-        res = []
-        for v in ver:
-            usr_1 = getattr(v.revision, "user", None)
-            if usr_1 is not None:
-                usr_1 = usr_1.username
-            else:
-                usr_1 = "Not specified"
-            res.append(
-                {
-                    "id": v.id,
-                    "date_created": v.revision.date_created,
-                    "user_created": usr_1,
-                }
-            )
-        return res
+        return _serialize_revisions(obj)
 
     def add_annotations(self, obj):
         if "apis_highlighter" in settings.INSTALLED_APPS:
@@ -231,14 +523,14 @@ class RelationEntitySerializer(serializers.Serializer):
                 # )
                 r1[
                     "text_url"
-                ] = f"{base_uri}{reverse('apis_core:apis_api:text-detail', kwargs={'pk': an.text_id})}"
+                ] = f"{base_uri}{_reverse_pk('apis_core:apis_api:text-detail', an.text_id)}"
                 res.append(r1)
             return res
 
     def add_entity(self, obj):
-        return EntitySerializer(
-            getattr(obj, "related_{}".format(self.entity_type)), depth_ent=0
-        ).data
+        if self._entity_serializer is None:
+            self._entity_serializer = EntitySerializer(depth_ent=0)
+        return self._entity_serializer.to_representation(getattr(obj, "related_{}".format(self.entity_type)))
 
     def add_relation_label(self, obj):
         cm = obj.__class__.__name__
@@ -246,7 +538,7 @@ class RelationEntitySerializer(serializers.Serializer):
         res_1["id"] = obj.relation_type.pk
         res_1[
             "url"
-        ] = f"{base_uri}{reverse('apis_core:apis_api:{}relation-detail'.format(cm).lower(), kwargs={'pk': obj.relation_type.pk},)}"
+        ] = f"{base_uri}{_reverse_pk('apis_core:apis_api:{}relation-detail'.format(cm).lower(), obj.relation_type.pk)}"
         if self.reverse and len(obj.relation_type.label_reverse) > 0:
             res_1["label"] = obj.relation_type.label_reverse
         elif self.reverse:
@@ -259,13 +551,18 @@ class RelationEntitySerializer(serializers.Serializer):
         super(RelationEntitySerializer, self).__init__(*args, **kwargs)
         self.own_class = own_class
         self.reverse = reverse
+        self.entity_type = None
+        self._entity_serializer = None
         if self.instance is not None:
-            for f in self.instance._meta.fields:
-                if f.name.startswith("related_"):
-                    mk2 = f.name.replace("related_", "")
-
-                    if mk2.lower() != own_class.lower():
-                        self.entity_type = mk2
-                        self.fields["target"] = serializers.SerializerMethodField(
-                            method_name="add_entity"
-                        )
+            self.entity_type = get_relation_plan(type(self.instance), own_class)["entity_type"]
+
+    def get_fields(self):
+        fields = super(RelationEntitySerializer, self).get_fields()
+        if self.entity_type is not None:
+            fields["target"] = serializers.SerializerMethodField(method_name="add_entity")
+        return fields
+
+    def to_representation(self, instance):
+        plan = get_relation_plan(type(instance), self.own_class)
+        self.entity_type = plan["entity_type"]
+        return _represent(self, plan["fields"], instance)
@@ -1,11 +1,32 @@
+import gzip
+import json
+import os
+import tempfile
+import time
+from unittest import mock, skipUnless
+
+import msgpack
 from django.contrib.auth.models import User
-from django.test import TestCase
-from django.urls import reverse
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from django.contrib.contenttypes.models import ContentType
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from reversion import revisions as reversion
 
+from apis_core.api_renderers import MessagePackRenderer
+from apis_core.apis_labels.models import Label
+from apis_core.apis_metainfo.models import Collection, Uri
+from apis_core.apis_relations.models import PersonPerson, PersonPlace
+from apis_core.apis_vocabularies.models import LabelType, PersonPersonRelation, PersonPlaceRelation, ProfessionType
+from apis_core.helper_functions import render_cache
+from .api_views import GetEntityGeneric
+from .management.commands.serialize_to_json import Command as SerializeToJson
 from .models import Place, Person
 
 
@@ -71,3 +92,834 @@ class GetTestCase(TestCase):
                 )
                 res2 = self.c.get(d["results"][0]["url"])
                 self.assertEqual(res2.status_code, status.HTTP_200_OK)
+
+
+class SparseFieldsetTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username="sparse", password="pas_1234$")
+        cls.token = Token.objects.create(user=user).key
+        col = Collection.objects.create(name="sparse collection")
+        profession = ProfessionType.objects.create(name="sparse profession")
+        for i in range(20):
+            person = Person.objects.create(name=f"sparse {i}", start_date_written="1900")
+            person.collection.add(col)
+            person.profession.add(profession)
+
+    def setUp(self):
+        self.c = APIClient()
+        self.c.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+
+    def get(self, params):
+        url = reverse("apis:apis_core:person-list") + "?format=json&limit=20&name__icontains=sparse" + params
+        with CaptureQueriesContext(connection) as queries:
+            res = self.c.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.json()["results"], queries
+
+    def test_fields(self):
+        full, full_queries = self.get("")
+        results, queries = self.get("&fields=id,name,start_date")
+        self.assertEqual(len(results), 20)
+        self.assertEqual(set(results[0].keys()), {"id", "name", "start_date"})
+        self.assertEqual(results[0]["start_date"], full[0]["start_date"])
+        self.assertLess(len(queries), len(full_queries))
+        sql = " ".join(q["sql"] for q in queries)
+        self.assertNotIn("apis_metainfo_collection", sql)
+        self.assertNotIn('"apis_entities_person"."first_name"', sql)
+        print(f"full: {len(full_queries)} queries, fields=id,name,start_date: {len(queries)} queries")
+
+    def test_related_fields(self):
+        results, queries = self.get("&fields=id,collection,sameAs")
+        self.assertEqual(set(results[0].keys()), {"id", "collection", "sameAs"})
+        self.assertEqual(results[0]["collection"][0]["label"], "sparse collection")
+        self.assertEqual(len(results[0]["sameAs"]), 1)
+        sql = " ".join(q["sql"] for q in queries)
+        self.assertNotIn("apis_vocabularies_professiontype", sql)
+
+    def test_exclude(self):
+        results, queries = self.get("&exclude=collection,profession,text,sameAs")
+        self.assertNotIn("collection", results[0])
+        self.assertNotIn("sameAs", results[0])
+        self.assertIn("first_name", results[0])
+        self.assertNotIn("profession", results[0])
+        sql = " ".join(q["sql"] for q in queries)
+        self.assertNotIn("apis_vocabularies_professiontype", sql)
+
+    def test_retrieve(self):
+        person = Person.objects.filter(name="sparse 0").first()
+        res = self.c.get(
+            reverse("apis:apis_core:person-detail", kwargs={"pk": person.pk}) + "?format=json&fields=id,name"
+        )
+        self.assertEqual(res.json(), {"id": person.pk, "name": "sparse 0"})
+
+
+class KeysetPaginationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username="keyset", password="pas_1234$")
+        cls.token = Token.objects.create(user=user).key
+        cls.persons = Person.bulk_create_instances([Person(name=f"keyset {i}") for i in range(45)])
+
+    def setUp(self):
+        self.c = APIClient()
+        self.c.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+
+    def walk(self, url):
+        """follows the next links and returns the pks of all pages and the queries of the requests"""
+        pks = []
+        queries = []
+        while url is not None:
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.c.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            queries.extend(q["sql"] for q in ctx.captured_queries)
+            data = res.json()
+            pks.extend(x["id"] for x in data["results"])
+            url = data["next"]
+        return pks, queries
+
+    def test_walk(self):
+        url = reverse("apis:apis_core:person-list") + "?format=json&fields=id&name__icontains=keyset&pagination=cursor&limit=10"
+        pks, queries = self.walk(url)
+        self.assertEqual(pks, sorted(p.pk for p in self.persons))
+        self.assertFalse(any("COUNT(" in q for q in queries))
+        pks, queries = self.walk(url + "&ordering=-pk")
+        self.assertEqual(pks, sorted((p.pk for p in self.persons), reverse=True))
+
+    def test_count(self):
+        url = reverse("apis:apis_core:person-list") + "?format=json&name__icontains=keyset&pagination=cursor&limit=10"
+        self.assertIsNone(self.c.get(url).json()["count"])
+        self.assertEqual(self.c.get(url + "&count=exact").json()["count"], 45)
+        self.assertEqual(self.c.get(url + "&count=approximate").json()["count"], 45)
+
+    def test_unindexed_ordering(self):
+        url = reverse("apis:apis_core:person-list") + "?format=json&pagination=cursor&ordering=first_name"
+        self.assertEqual(self.c.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+
+    @skipUnless(os.environ.get("APIS_PAGINATION_BENCHMARK_ROWS"), "APIS_PAGINATION_BENCHMARK_ROWS is not set")
+    def test_benchmark(self):
+        # pages through a table of APIS_PAGINATION_BENCHMARK_ROWS persons, e.g. one million
+        n_rows = int(os.environ["APIS_PAGINATION_BENCHMARK_ROWS"])
+        persons = Person.bulk_create_instances(
+            (Person(name=f"benchmark {i}") for i in range(n_rows)), batch_size=10000, parse_dates=False
+        )
+        base_url = reverse("apis:apis_core:person-list") + "?format=json&fields=id&limit=1000"
+        for depth in [0, n_rows // 2, n_rows - 1000]:
+            start = time.perf_counter()
+            res = self.c.get(base_url + f"&offset={depth}")
+            offset_duration = time.perf_counter() - start
+            self.assertEqual(res.json()["results"][0]["id"], Person.objects.order_by("pk")[depth].pk)
+            print(f"offset page at {depth}: {offset_duration * 1000:.1f}ms")
+        start = time.perf_counter()
+        pks, queries = self.walk(base_url + "&pagination=cursor")
+        duration = time.perf_counter() - start
+        self.assertEqual(len(pks), Person.objects.count())
+        self.assertEqual(pks[-1], persons[-1].pk)
+        print(
+            f"walked {len(pks)} persons in {len(pks) // 1000 + 1} cursor pages in {duration:.1f}s, "
+            f"{duration / (len(pks) // 1000 + 1) * 1000:.1f}ms per page"
+        )
+
+
+class RelationSerializationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username="relations", password="pas_1234$")
+        cls.token = Token.objects.create(user=user).key
+        cls.person = Person.objects.create(name="prominent person")
+        cls.place_type = PersonPlaceRelation.objects.create(name="lived in")
+        cls.person_type = PersonPersonRelation.objects.create(name="knows", name_reverse="known by")
+
+    def setUp(self):
+        self.c = APIClient()
+        self.c.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+
+    def add_relations(self, n):
+        places = Place.bulk_create_instances([Place(name=f"place {i}") for i in range(n)])
+        PersonPlace.bulk_create_instances(
+            [PersonPlace(related_person=self.person, related_place=p, relation_type=self.place_type) for p in places]
+        )
+        persons = Person.bulk_create_instances([Person(name=f"friend {i}") for i in range(n)])
+        PersonPerson.bulk_create_instances(
+            [
+                PersonPerson(related_personA=self.person, related_personB=p, relation_type=self.person_type)
+                for p in persons[: n // 2]
+            ]
+            + [
+                PersonPerson(related_personA=p, related_personB=self.person, relation_type=self.person_type)
+                for p in persons[n // 2 :]
+            ]
+        )
+
+    def get_detail(self):
+        url = reverse("apis:apis_core:person-detail", kwargs={"pk": self.person.pk}) + "?format=json"
+        with CaptureQueriesContext(connection) as queries:
+            res = self.c.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.json(), len(queries)
+
+    def test_relations(self):
+        self.add_relations(4)
+        data, n_queries = self.get_detail()
+        self.assertEqual(len(data["relations"]), 8)
+        related = {r["related_entity"]["label"] for r in data["relations"]}
+        self.assertIn("place 0", related)
+        self.assertEqual(len([x for x in related if x.startswith("friend")]), 4)
+        rel = [r for r in data["relations"] if r["related_entity"]["type"] == "Place"][0]
+        self.assertEqual(rel["relation_type"]["label"], "lived in")
+        self.assertEqual(len(rel["related_entity"]["sameAs"]), 1)
+
+    def test_query_count(self):
+        self.add_relations(5)
+        data, few = self.get_detail()
+        self.add_relations(50)
+        data, many = self.get_detail()
+        print(f"detail with {len(data['relations'])} relations: {many} queries")
+        self.assertEqual(len(data["relations"]), 110)
+        self.assertEqual(few, many)
+
+
+class ConditionalGetTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username="conditional", password="pas_1234$")
+        cls.token = Token.objects.create(user=user).key
+        cls.person = Person.objects.create(name="conditional person")
+        cls.place = Place.objects.create(name="conditional place")
+        cls.relation_type = PersonPlaceRelation.objects.create(name="born in", name_reverse="birth place of")
+
+    def setUp(self):
+        self.c = APIClient()
+        self.c.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        self.url = reverse("apis:apis_core:person-detail", kwargs={"pk": self.person.pk}) + "?format=json"
+
+    def get_etag(self):
+        res = self.c.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn("Last-Modified", res)
+        self.assertIn("max-age", res["Cache-Control"])
+        return res["ETag"]
+
+    def test_not_modified(self):
+        etag = self.get_etag()
+        with CaptureQueriesContext(connection) as queries:
+            res = self.c.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res["ETag"], etag)
+        sql = " ".join(q["sql"] for q in queries)
+        self.assertNotIn("apis_metainfo_uri", sql)
+        self.assertNotIn("apis_relations", sql)
+        res = self.c.get(self.url + "&fields=id,name", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_stamp_follows_related_objects(self):
+        etags = [self.get_etag()]
+        label = Label.objects.create(
+            label="conditional label", label_type=LabelType.objects.create(name="alias"), temp_entity=self.person
+        )
+        etags.append(self.get_etag())
+        Uri.objects.create(uri="http://example.org/conditional", entity=self.person)
+        etags.append(self.get_etag())
+        rel = PersonPlace.objects.create(related_person=self.person, related_place=self.place, relation_type=self.relation_type)
+        etags.append(self.get_etag())
+        rel.delete()
+        etags.append(self.get_etag())
+        label.delete()
+        etags.append(self.get_etag())
+        self.assertEqual(len(set(etags)), len(etags))
+        res = self.c.get(self.url, HTTP_IF_NONE_MATCH=etags[0])
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_merge(self):
+        duplicate = Person.objects.create(name="conditional duplicate")
+        PersonPlace.objects.create(related_person=duplicate, related_place=self.place, relation_type=self.relation_type)
+        self.url = reverse("apis:apis_core:place-detail", kwargs={"pk": self.place.pk}) + "?format=json"
+        etag = self.get_etag()
+        self.person.merge_with([duplicate])
+        res = self.c.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["ETag"], etag)
+
+    def test_many_to_many(self):
+        etags = [self.get_etag()]
+        collection = Collection.objects.create(name="conditional collection")
+        self.person.collection.add(collection)
+        etags.append(self.get_etag())
+        profession = ProfessionType.objects.create(name="conditional profession")
+        self.person.profession.add(profession)
+        etags.append(self.get_etag())
+        profession.name = "renamed profession"
+        profession.save()
+        etags.append(self.get_etag())
+        collection = Collection.objects.get(pk=collection.pk)
+        collection.name = "renamed collection"
+        collection.save()
+        etags.append(self.get_etag())
+        collection.tempentityclass_set.clear()
+        etags.append(self.get_etag())
+        self.assertEqual(len(set(etags)), len(etags))
+
+    def test_related_rename(self):
+        PersonPlace.objects.create(related_person=self.person, related_place=self.place, relation_type=self.relation_type)
+        etags = [self.get_etag()]
+        self.place.name = "renamed place"
+        self.place.save()
+        etags.append(self.get_etag())
+        Uri.objects.create(uri="http://example.org/conditional-place", entity=self.place)
+        etags.append(self.get_etag())
+        self.relation_type.name = "renamed born in"
+        self.relation_type.save()
+        etags.append(self.get_etag())
+        self.assertEqual(len(set(etags)), len(etags))
+
+    def test_moved_rows(self):
+        other = Person.objects.create(name="conditional other person")
+        rel = PersonPlace.objects.create(related_person=self.person, related_place=self.place, relation_type=self.relation_type)
+        uri = Uri.objects.create(uri="http://example.org/conditional-moved", entity=self.person)
+        label = Label.objects.create(label="conditional moved label", temp_entity=self.person)
+        for obj, field_name in [(rel, "related_person"), (uri, "entity"), (label, "temp_entity")]:
+            etag = self.get_etag()
+            obj = type(obj).objects.get(pk=obj.pk)
+            setattr(obj, field_name, other)
+            obj.save()
+            self.assertNotEqual(self.get_etag(), etag)
+
+    def test_entity_endpoint(self):
+        url = reverse("GetEntityGenericRoot", kwargs={"pk": self.person.pk}) + "?format=json"
+        res = self.c.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self.c.get(url, HTTP_IF_NONE_MATCH=res["ETag"])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+@override_settings(
+    APIS_RENDER_CACHE="render",
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "render": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "render-test"},
+    },
+)
+class RenderCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username="render", password="pas_1234$")
+        cls.token = Token.objects.create(user=user).key
+        cls.person = Person.objects.create(name="render person")
+        cls.place = Place.objects.create(name="render place")
+        cls.relation_type = PersonPlaceRelation.objects.create(name="died in", name_reverse="death place of")
+        PersonPlace.objects.create(related_person=cls.person, related_place=cls.place, relation_type=cls.relation_type)
+
+    def setUp(self):
+        caches["render"].clear()
+        self.c = APIClient()
+        self.c.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+
+    def get(self, fmt="json"):
+        url = reverse("GetEntityGenericRoot", kwargs={"pk": self.person.pk}) + f"?format={fmt}"
+        with CaptureQueriesContext(connection) as queries:
+            res = self.c.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.content, len(queries)
+
+    def test_hit(self):
+        content, miss = self.get()
+        cached, hit = self.get()
+        self.assertEqual(content, cached)
+        self.assertLess(hit, miss)
+        tei, tei_miss = self.get("tei")
+        self.assertNotEqual(tei, content)
+        print(f"render cache: {miss} queries on a miss, {hit} on a hit")
+
+    def test_invalidation(self):
+        content, miss = self.get()
+        Label.objects.create(
+            label="render label", label_type=LabelType.objects.create(name="render alias"), temp_entity=self.person
+        )
+        self.assertIn(b"render label", self.get()[0])
+        content, hit = self.get()
+        self.assertLess(hit, miss)
+        # renaming the target of a relation changes the representation of the person
+        self.place.name = "renamed place"
+        self.place.save()
+        content, n_queries = self.get()
+        self.assertIn(b"renamed place", content)
+        self.assertGreater(n_queries, hit)
+        self.relation_type.name = "buried in"
+        self.relation_type.save()
+        self.assertIn(b"buried in", self.get()[0])
+        # an unrelated entity does not invalidate the entry
+        self.get()
+        Place.objects.create(name="unrelated place")
+        self.assertEqual(self.get()[1], hit)
+
+    def test_change_while_rendering(self):
+        content, miss = self.get()
+        self.assertLess(self.get()[1], miss)
+        caches["render"].clear()
+        render_entity = GetEntityGeneric.render_entity
+
+        def render_and_change(view, request, ent):
+            response = render_entity(view, request, ent)
+            render_cache.invalidate_entities([self.place.pk])
+            return response
+
+        with mock.patch.object(GetEntityGeneric, "render_entity", render_and_change):
+            self.get()
+        # the entry was rendered from the old version of the place
+        self.assertEqual(self.get()[1], miss)
+
+
+@override_settings(
+    APIS_RENDER_CACHE="render",
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "render": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.path.join(tempfile.gettempdir(), "apis-render-cache-test"),
+        },
+    },
+)
+class FileBasedRenderCacheTestCase(RenderCacheTestCase):
+    pass
+
+
+class BatchReadTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username="batch", password="pas_1234$")
+        cls.token = Token.objects.create(user=user).key
+        relation_type = PersonPlaceRelation.objects.create(name="visited", name_reverse="visited by")
+        label_type = LabelType.objects.create(name="batch alias")
+        cls.persons = []
+        for i in range(12):
+            person = Person.objects.create(name=f"batch person {i}")
+            Label.objects.create(label=f"batch label {i}", label_type=label_type, temp_entity=person)
+            for n in range(2):
+                place = Place.objects.create(name=f"batch place {i} {n}")
+                PersonPlace.objects.create(related_person=person, related_place=place, relation_type=relation_type)
+            cls.persons.append(person)
+        cls.uri = Uri.objects.create(uri="http://example.org/batch", entity=cls.persons[5])
+
+    def setUp(self):
+        self.c = APIClient()
+        self.c.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        self.url = reverse("apis:apis_api2:GetEntitiesBatch") + "?format=json"
+
+    def post(self, data):
+        with CaptureQueriesContext(connection) as queries:
+            res = self.c.post(self.url, data, format="json")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.json(), [q["sql"] for q in queries]
+
+    def test_resolve(self):
+        pks = [p.pk for p in self.persons[:3]]
+        data, queries = self.post({"ids": pks + [0], "uris": [self.uri.uri, "http://example.org/unknown"]})
+        self.assertEqual([r["id"] for r in data["results"]], pks + [self.persons[5].pk])
+        self.assertEqual(data["uris"], {self.uri.uri: self.persons[5].pk})
+        self.assertEqual(data["not_found"], {"ids": [0], "uris": ["http://example.org/unknown"]})
+        self.assertEqual(len(data["results"][0]["relations"]["places"]), 2)
+        self.assertEqual(data["results"][0]["labels"][0]["label"], "batch label 0")
+        single = self.c.get(
+            reverse("GetEntityGenericRoot", kwargs={"pk": pks[0]}) + "?format=json"
+        ).json()
+        self.assertEqual(data["results"][0], single)
+        res = self.c.get(self.url + f"&ids={pks[0]},{pks[1]}&uri={self.uri.uri}")
+        self.assertEqual(len(res.json()["results"]), 3)
+
+    def test_query_count(self):
+        def data_queries(queries):
+            # the relation classes are still looked up per object
+            return [q for q in queries if "django_content_type" not in q]
+
+        few, few_queries = self.post({"ids": [p.pk for p in self.persons[:3]]})
+        many, many_queries = self.post({"ids": [p.pk for p in self.persons]})
+        self.assertEqual(len(many["results"]), 12)
+        self.assertEqual(len(data_queries(few_queries)), len(data_queries(many_queries)))
+        print(f"batch read of 12 persons: {len(many_queries)} queries, {len(data_queries(many_queries))} data queries")
+
+    def test_limit(self):
+        with self.settings(APIS_BATCH_READ_MAX=2):
+            res = self.c.post(self.url, {"ids": [1, 2, 3]}, format="json")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class NDJSONStreamTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username="ndjson", password="pas_1234$")
+        cls.token = Token.objects.create(user=user).key
+        col = Collection.objects.create(name="ndjson collection")
+        profession = ProfessionType.objects.create(name="ndjson profession")
+        for i in range(25):
+            person = Person.objects.create(name=f"ndjson {i}", start_date_written="1900")
+            person.collection.add(col)
+            person.profession.add(profession)
+
+    def setUp(self):
+        self.c = APIClient()
+        self.c.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        self.url = reverse("apis:apis_core:person-ndjson")
+
+    def stream(self, params):
+        with self.settings(APIS_NDJSON_CHUNK_SIZE=10), CaptureQueriesContext(connection) as queries:
+            res = self.c.get(self.url + params)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertTrue(res.streaming)
+            content = b"".join(res.streaming_content)
+        return res, content, len(queries)
+
+    def test_stream(self):
+        res, content, n_queries = self.stream("?name__icontains=ndjson&ordering=id")
+        self.assertEqual(res["Content-Type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in content.decode("utf-8").splitlines()]
+        self.assertEqual(len(lines), 25)
+        self.assertEqual(lines[0]["name"], "ndjson 0")
+        self.assertEqual(lines[0]["collection"][0]["label"], "ndjson collection")
+        self.assertEqual(lines[0]["profession"][0]["label"], "ndjson profession")
+        res, content, n_queries = self.stream("?name__icontains=ndjson 1&fields=id,name")
+        self.assertEqual({x["name"] for x in map(json.loads, content.splitlines())}, {"ndjson 1"} | {f"ndjson 1{i}" for i in range(10)})
+        self.assertEqual(set(json.loads(content.splitlines()[0]).keys()), {"id", "name"})
+        # the pages are keyset pages over the primary key, whatever the requested ordering
+        res, content, n_queries = self.stream("?name__icontains=ndjson&ordering=-id&fields=id")
+        ids = [json.loads(line)["id"] for line in content.splitlines()]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 25)
+
+    def test_gzip(self):
+        res, content, n_queries = self.stream("?name__icontains=ndjson&gzip=true")
+        self.assertEqual(res["Content-Type"], "application/gzip")
+        self.assertEqual(len(gzip.decompress(content).splitlines()), 25)
+
+    def test_queries_per_chunk(self):
+        one_chunk = self.stream("?name__icontains=ndjson 1")[2]
+        three_chunks = self.stream("?name__icontains=ndjson")[2]
+        self.assertLessEqual(three_chunks, 3 * one_chunk)
+
+
+class BatchWriteTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_superuser(username="batchwrite", password="pas_1234$")
+        cls.token = Token.objects.create(user=user).key
+        cls.relation_type = PersonPlaceRelation.objects.create(name="worked in", name_reverse="workplace of")
+        cls.profession = ProfessionType.objects.create(name="batch writer")
+        cls.place = Place.objects.create(name="existing place")
+        cls.place_uri = Uri.objects.create(uri="http://example.org/batch-place", entity=cls.place).uri
+
+    def setUp(self):
+        self.c = APIClient()
+        self.c.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        self.url = reverse("apis:apis_api2:BatchWrite")
+
+    def items(self, n, prefix):
+        items = []
+        for i in range(n):
+            items.append(
+                {
+                    "type": "person",
+                    "ref": f"{prefix}{i}",
+                    "data": {
+                        "name": f"{prefix} {i}",
+                        "start_date_written": "1900",
+                        "profession": [self.profession.pk],
+                        "uris": [f"http://example.org/{prefix}/{i}"],
+                    },
+                }
+            )
+            items.append(
+                {
+                    "type": "personplace",
+                    "data": {
+                        "related_person": {"ref": f"{prefix}{i}"},
+                        "related_place": self.place_uri if i % 2 else self.place.pk,
+                        "relation_type": self.relation_type.pk,
+                        "start_date_written": "1910",
+                    },
+                }
+            )
+        return items
+
+    def post(self, data):
+        with CaptureQueriesContext(connection) as queries:
+            res = self.c.post(self.url, data, format="json")
+        return res, [q["sql"] for q in queries]
+
+    def test_write(self):
+        res, queries = self.post({"items": self.items(20, "batchwrite")})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        results = res.json()["results"]
+        self.assertEqual([r["status"] for r in results], ["created"] * 40)
+        person = Person.objects.get(pk=results[0]["id"])
+        self.assertEqual(person.name, "batchwrite 0")
+        self.assertEqual(person.start_date.year, 1900)
+        self.assertEqual(list(person.profession.all()), [self.profession])
+        self.assertEqual(person.uri_set.count(), 2)
+        rel = PersonPlace.objects.get(pk=results[1]["id"])
+        self.assertEqual((rel.related_person_id, rel.related_place_id), (person.pk, self.place.pk))
+        self.assertEqual(rel.start_date.year, 1910)
+        self.assertEqual(PersonPlace.objects.filter(related_place=self.place).count(), 20)
+
+    def test_query_count(self):
+        def read_queries(queries):
+            # sqlite can not return the keys of a bulk insert, so the root rows are inserted one by one there
+            return [q for q in queries if not q.startswith("INSERT") and "SAVEPOINT" not in q]
+
+        few = read_queries(self.post(self.items(5, "few"))[1])
+        many = read_queries(self.post(self.items(50, "many"))[1])
+        self.assertEqual(len(few), len(many))
+
+    def test_invalid(self):
+        items = self.items(2, "invalid")
+        items[3]["data"]["related_place"] = "http://example.org/unknown"
+        items.append({"type": "nothing", "data": {}})
+        res, queries = self.post({"items": items})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        results = res.json()["results"]
+        self.assertEqual([r["status"] for r in results], ["not written"] * 3 + ["invalid"] * 2)
+        self.assertIn("related_place", results[3]["errors"])
+        self.assertFalse(Person.objects.filter(name__icontains="invalid").exists())
+        res, queries = self.post({"items": items, "atomic": False})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Person.objects.filter(name__icontains="invalid").count(), 2)
+
+    def test_unhashable_ref(self):
+        items = self.items(1, "unhashable")
+        items[0]["ref"] = ["unhashable"]
+        items[1]["data"]["related_person"] = {"ref": {"unhashable": 0}}
+        res, queries = self.post({"items": items})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        results = res.json()["results"]
+        self.assertIn("ref", results[0]["errors"])
+        self.assertIn("related_person", results[1]["errors"])
+
+
+class LazyGenericApiTestCase(TestCase):
+    def test_lazy_viewsets(self):
+        from apis_core import api_routers
+        from apis_core.apis_vocabularies.models import EventType
+
+        view = resolve(reverse("apis:apis_core:eventtype-list")).func
+        api_routers._generic_viewsets.pop(EventType, None)
+        self.assertTrue(issubclass(view.cls, api_routers.LazyGenericViewSet))
+        self.assertNotIn(EventType, api_routers._generic_viewsets)
+        instance = view.cls(**view.initkwargs)
+        self.assertIs(type(instance), api_routers._generic_viewsets[EventType])
+        self.assertEqual(view.cls.get_extra_actions()[0].url_path, type(instance).get_extra_actions()[0].url_path)
+        self.assertIs(api_routers.get_field_plan(Person), api_routers.get_field_plan(Person))
+
+    def test_build_time(self):
+        from apis_core import api_routers
+
+        api_routers.generic_serializer_creation_factory()
+        start = time.perf_counter()
+        api_routers.generic_serializer_creation_factory()
+        cached = time.perf_counter() - start
+        models = list(api_routers._generic_viewsets)
+        api_routers._generic_viewsets.clear()
+        start = time.perf_counter()
+        api_routers.get_generic_viewset(Person)
+        one = time.perf_counter() - start
+        api_routers.generic_serializer_creation_factory()
+        everything = time.perf_counter() - start
+        self.assertEqual(set(models), set(api_routers._generic_viewsets))
+        print(f"generic api classes: {one * 1000:.1f}ms for one model, {everything * 1000:.1f}ms for all, {cached * 1000:.2f}ms when built")
+
+
+
+class MessagePackTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username="msgpack", password="pas_1234$")
+        cls.token = Token.objects.create(user=user).key
+        relation_type = PersonPlaceRelation.objects.create(name="msgpack born in", name_reverse="birthplace of")
+        persons = Person.bulk_create_instances(
+            [Person(name=f"msgpack person {i}", first_name="Jane", start_date_written="1.3.1930") for i in range(100)]
+        )
+        places = Place.bulk_create_instances([Place(name=f"msgpack place {i}") for i in range(100)])
+        PersonPlace.bulk_create_instances(
+            [
+                PersonPlace(related_person=person, related_place=place, relation_type=relation_type)
+                for person, place in zip(persons, places)
+            ]
+        )
+        cls.person = persons[0]
+
+    def setUp(self):
+        self.c = APIClient()
+        self.c.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+
+    def test_negotiation(self):
+        url = reverse("apis:apis_core:person-list") + "?name__icontains=msgpack&limit=20"
+        as_json = self.c.get(url, HTTP_ACCEPT="application/json").json()
+        res = self.c.get(url, HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(res["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(res.content, raw=False), as_json)
+        res = self.c.get(url + "&format=msgpack")
+        # the links keep the format parameter
+        self.assertEqual(msgpack.unpackb(res.content, raw=False)["count"], as_json["count"])
+        url = reverse("apis:apis_api2:GetEntityGeneric", kwargs={"pk": self.person.pk})
+        as_json = self.c.get(url + "?format=json").json()
+        res = self.c.get(url, HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(res["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(res.content, raw=False), as_json)
+
+    def test_parser(self):
+        res = self.c.post(
+            reverse("apis:apis_api2:GetEntitiesBatch"),
+            msgpack.packb({"ids": [self.person.pk]}),
+            content_type="application/msgpack",
+            HTTP_ACCEPT="application/msgpack",
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(msgpack.unpackb(res.content, raw=False)["results"][0]["id"], self.person.pk)
+        res = self.c.post(
+            reverse("apis:apis_api2:BatchWrite"), b"\xc1", content_type="application/msgpack"
+        )
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_benchmark(self):
+        pages = {
+            "persons": reverse("apis:apis_core:person-list") + "?name__icontains=msgpack&limit=100",
+            "relations": reverse("apis:apis_core:personplace-list") + "?relation_type__name=msgpack born in&limit=100",
+            "entity": reverse("apis:apis_api2:GetEntityGeneric", kwargs={"pk": self.person.pk}),
+        }
+        for name, url in pages.items():
+            data = self.c.get(url, HTTP_ACCEPT="application/json").json()
+            timings = {}
+            for renderer in [JSONRenderer(), MessagePackRenderer()]:
+                start = time.perf_counter()
+                for _ in range(50):
+                    content = renderer.render(data)
+                timings[renderer.format] = ((time.perf_counter() - start) / 50, len(content))
+            self.assertLess(timings["msgpack"][1], timings["json"][1])
+            print(
+                f"{name} page: json {timings['json'][1]} bytes in {timings['json'][0] * 1000:.2f}ms, "
+                f"msgpack {timings['msgpack'][1]} bytes in {timings['msgpack'][0] * 1000:.2f}ms"
+            )
+
+
+class RevisionSerializationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="revisions", password="pas_1234$")
+        cls.token = Token.objects.create(user=cls.user).key
+        cls.relation_type = PersonPlaceRelation.objects.create(name="revision lived in", name_reverse="revision home of")
+        with reversion.create_revision():
+            reversion.set_user(cls.user)
+            cls.person = Person.objects.create(name="revision person")
+        with reversion.create_revision():
+            cls.person.first_name = "Jane"
+            cls.person.save()
+
+    def setUp(self):
+        self.c = APIClient()
+        self.c.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+
+    def add_relations(self, n):
+        for i in range(n):
+            with reversion.create_revision():
+                place = Place.objects.create(name=f"revision place {i}")
+                PersonPlace.objects.create(related_person=self.person, related_place=place, relation_type=self.relation_type)
+
+    def get_detail(self):
+        url = reverse("apis:apis_api2:GetEntityGeneric", kwargs={"pk": self.person.pk}) + "?format=json"
+        with CaptureQueriesContext(connection) as queries:
+            res = self.c.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.json(), [q["sql"] for q in queries]
+
+    def test_revisions(self):
+        self.add_relations(2)
+        data, queries = self.get_detail()
+        self.assertEqual([r["user_created"] for r in data["revisions"]], ["Not specified", "revisions"])
+        rel = data["relations"]["places"][0]
+        self.assertEqual(len(rel["revisions"]), 1)
+        self.assertEqual(len(rel["target"]["revisions"]), 1)
+
+    def test_query_count(self):
+        self.add_relations(3)
+        data, few = self.get_detail()
+        self.add_relations(30)
+        data, many = self.get_detail()
+        self.assertEqual(len(data["relations"]["places"]), 33)
+        reversion_queries = [q for q in many if "reversion_" in q]
+        print(f"detail with 33 relations: {len(many)} queries, {len(reversion_queries)} for the revisions")
+        self.assertEqual(len(few), len(many))
+        self.assertLessEqual(len(reversion_queries), 3)
+
+    def test_serialize_to_json(self):
+        self.add_relations(4)
+        options = {"only-published": False, "add-texts": True}
+        with CaptureQueriesContext(connection) as queries:
+            data = SerializeToJson().serialize(Person.objects.filter(name__icontains="revision"), options)
+        self.assertEqual(len(data), 1)
+        self.assertEqual(len(data[0]["relations"]["places"]), 4)
+        self.assertEqual(len(data[0]["relations"]["places"][0]["revisions"]), 1)
+        self.assertEqual(len([q for q in queries if "reversion_" in q["sql"]]), 3)
+
+
+class SerializerPlanTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.place_type = PersonPlaceRelation.objects.create(name="plan born in", name_reverse="plan birthplace of")
+        cls.person_type = PersonPersonRelation.objects.create(name="plan knows", name_reverse="plan known by")
+        cls.profession = ProfessionType.objects.create(name="plan profession")
+
+    def create_persons(self, n):
+        places = Place.bulk_create_instances([Place(name=f"plan place {i}") for i in range(max(n // 10, 1))])
+        persons = Person.bulk_create_instances(
+            [Person(name=f"plan person {i}", first_name="Jane", start_date_written="1.3.1930") for i in range(n)]
+        )
+        PersonPlace.bulk_create_instances(
+            [
+                PersonPlace(related_person=p, related_place=places[i % len(places)], relation_type=self.place_type)
+                for i, p in enumerate(persons)
+            ]
+        )
+        PersonPerson.bulk_create_instances(
+            [
+                PersonPerson(related_personA=p, related_personB=persons[i - 1], relation_type=self.person_type)
+                for i, p in enumerate(persons)
+                if i % 2 == 1
+            ]
+        )
+        Person.profession.through.objects.bulk_create(
+            [Person.profession.through(person_id=p.pk, professiontype_id=self.profession.pk) for p in persons]
+        )
+        return persons
+
+    def test_plan(self):
+        from .serializers_generic import EntitySerializer, get_serializer_plan
+
+        persons = self.create_persons(4)
+        plan = get_serializer_plan(Person)
+        self.assertIs(plan, get_serializer_plan(Person))
+        self.assertIn("profession", [name for name, kind, field in plan["fields"]])
+        self.assertIn("places", [key for key, accessors in plan["relations"]])
+        person = Person.objects.get(pk=persons[1].pk)
+        serializer = EntitySerializer(person)
+        data = serializer.data
+        self.assertEqual(list(data), list(serializer.fields))
+        self.assertEqual(data["profession"][0]["name"], "plan profession")
+        self.assertEqual(data["relations"]["places"][0]["target"]["name"], "plan place 0")
+        self.assertEqual(data["relations"]["persons"][0]["target"]["id"], persons[0].pk)
+        self.assertEqual(data["relations"]["persons"][0]["relation_type"]["label"], "plan knows")
+        self.assertEqual(EntitySerializer(Person.objects.get(pk=persons[0].pk)).data["relations"]["persons"][0]["target"]["id"], persons[1].pk)
+        self.assertEqual(list(EntitySerializer().fields), list(EntitySerializer._declared_fields))
+
+    @skipUnless(os.environ.get("APIS_SERIALIZER_BENCHMARK_ROWS"), "APIS_SERIALIZER_BENCHMARK_ROWS is not set")
+    def test_benchmark(self):
+        # serializes APIS_SERIALIZER_BENCHMARK_ROWS persons with their relations, e.g. 10000
+        n_rows = int(os.environ["APIS_SERIALIZER_BENCHMARK_ROWS"])
+        self.create_persons(n_rows)
+        options = {"only-published": False, "add-texts": False}
+        queryset = Person.objects.filter(name__icontains="plan person").order_by("pk")
+        start = time.perf_counter()
+        data = []
+        for offset in range(0, n_rows, 1000):
+            data.extend(SerializeToJson().serialize(queryset[offset : offset + 1000], options))
+        duration = time.perf_counter() - start
+        self.assertEqual(len(data), n_rows)
+        self.assertEqual(len(data[1]["relations"]["persons"]), 1)
+        print(f"serialized {n_rows} persons with relations in {duration:.1f}s, {n_rows / duration:.0f} persons/s")
@@ -1,16 +1,59 @@
-from django.test import TestCase
-from django.contrib.auth.models import User, Group
-from django.urls import reverse
+import io
+import os
+import random
+import tempfile
+import time
+from unittest import mock, skipUnless
 
-from .models import Person, Event
-from apis_core.apis_metainfo.models import Text, Collection
-from apis_core.apis_vocabularies.models import ProfessionType
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import AnonymousUser, User, Group
+from django.urls import resolve, reverse
+
+from .models import AbstractEntity, Person, Event, Place, get_default_uri
+from apis_core.api_routers import get_generic_viewset
+from apis_core.apis_relations.models import (
+    AbstractRelation,
+    PersonPerson,
+    PersonPlace,
+)
+from apis_core.context_processors.custom_context_processors import (
+    add_entities,
+    add_relations,
+)
+from apis_core.apis_labels.models import Label
+from apis_core.apis_metainfo.management.commands.drop_object_permissions import drop_object_permissions
+from apis_core.apis_metainfo.management.commands.reparse_dates import reparse_dates
+from apis_core.helper_functions import DateParser, registry
+from apis_core.helper_functions.closure import rebuild_closure
+from apis_core.helper_functions.ContentType import GetContentTypes
+from apis_core.helper_functions.merge import merge_entities, merge_entity_clusters
+from apis_core.helper_functions.text_diff import map_spans
+from apis_core.helper_functions.utils import get_child_classes
+from apis_core.apis_metainfo.models import Text, Collection, CollectionClosure, TempEntityClass, Uri
+from apis_core.apis_metainfo.permissions import CollectionPermissionChecker
+from apis_core.apis_metainfo.visibility import get_visibility_filter
+from apis_core.apis_vocabularies import vocab_tree
+from apis_core.apis_vocabularies.bulk_import import import_terms, read_csv
+from apis_core.apis_vocabularies.models import (
+    LabelType,
+    PersonPersonRelation,
+    PersonPlaceRelation,
+    ProfessionType,
+    VocabsBaseClass,
+    VocabsClosure,
+)
 from reversion import revisions as reversion
+from reversion.models import Version
 
 from datetime import datetime
 from rest_framework.authtoken.models import Token
+from rest_framework.permissions import AllowAny
 from rest_framework.test import APIClient
 from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
 
 
 class PersonModelTestCase(TestCase):
@@ -209,4 +252,671 @@ class PermissionsModelTestCase(TestCase):
         )
         print(f"permissions revoked, patch: {res.status_code}")
         self.assertEqual(res.status_code, 403)
- 
\ No newline at end of file
+ 
+
+class ModelRegistryTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.pers = Person.objects.create(name="test name")
+        user = User.objects.create_user(username="registry", password="pas_1234$")
+        cls.c = APIClient()
+        cls.c.credentials(
+            HTTP_AUTHORIZATION="Token " + Token.objects.create(user=user).key
+        )
+
+    def test_lookups(self):
+        self.assertEqual(AbstractEntity.get_entity_class_of_name("PERSON"), Person)
+        self.assertEqual(
+            AbstractRelation.get_relation_class_of_name("personplace"), PersonPlace
+        )
+        self.assertIn("person", AbstractEntity.get_all_entity_names())
+        self.assertRaises(Exception, AbstractEntity.get_entity_class_of_name, "foo")
+
+    def test_lookups_per_request(self):
+        """counts the reflective scans of the model modules caused by lookups and requests"""
+        scans_before = registry.scan_count
+        for entity_name in AbstractEntity.get_all_entity_names():
+            AbstractEntity.get_entity_class_of_name(entity_name)
+        for relation_name in AbstractRelation.get_all_relation_names():
+            AbstractRelation.get_relation_class_of_name(relation_name)
+        add_entities(None)
+        add_relations(None)
+        GetContentTypes()
+        for entity_name in AbstractEntity.get_all_entity_names():
+            res = self.c.get(reverse(f"apis:apis_core:{entity_name}-list"))
+            self.assertEqual(res.status_code, 200)
+        res = self.c.get(
+            reverse("apis:apis_core:person-detail", kwargs={"pk": self.pers.pk})
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(registry.scan_count, scans_before)
+
+
+class EntityInstantiationTestCase(TestCase):
+    def test_relation_methods_defined_on_class(self):
+        for method in [
+            "get_related_place_instances",
+            "get_related_person_instances",
+            "get_related_personA_instances",
+            "get_related_personB_instances",
+        ]:
+            self.assertTrue(callable(getattr(Person, method)))
+
+    def test_instantiation(self):
+        """instantiating entities must not redo the per-class relation method wiring"""
+        with mock.patch.object(
+            Person,
+            "create_relation_methods_from_manytomany_fields",
+            wraps=Person.create_relation_methods_from_manytomany_fields,
+        ) as create_methods:
+            for i in range(5):
+                Person(name="test name", first_name="test first name")
+        self.assertEqual(create_methods.call_count, 0)
+
+
+class SubclassDiscriminatorTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.persons = [Person.objects.create(name=f"person {i}") for i in range(5)]
+        cls.events = [Event.objects.create(name=f"event {i}") for i in range(5)]
+
+    def test_discriminator_set_on_save(self):
+        self.assertEqual(
+            self.persons[0].self_contenttype, ContentType.objects.get_for_model(Person)
+        )
+        self.assertEqual(
+            TempEntityClass.objects.get(pk=self.events[0].pk).get_child_entity(),
+            self.events[0],
+        )
+
+    def test_resolve_batch(self):
+        pks = [x.pk for x in self.persons + self.events]
+        ContentType.objects.get_for_models(Person, Event)
+        # one query for the discriminators plus one per concrete class
+        with self.assertNumQueries(3):
+            res = TempEntityClass.get_subclass_instances(pks)
+        self.assertEqual(len(res), len(pks))
+        self.assertIsInstance(res[self.persons[0].pk], Person)
+        self.assertIsInstance(res[self.events[0].pk], Event)
+
+    def test_resolve_single(self):
+        self.assertEqual(
+            TempEntityClass.get_subclass_instance(str(self.persons[1].pk)),
+            self.persons[1],
+        )
+        self.assertRaises(
+            TempEntityClass.DoesNotExist, TempEntityClass.get_subclass_instance, 0
+        )
+
+
+class MergeEngineTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.col = Collection.objects.create(name="merge collection")
+        cls.place = Place.objects.create(name="merge place")
+        cls.rel_type = PersonPlaceRelation.objects.create(name="lived in")
+        cls.pers_rel_type = PersonPersonRelation.objects.create(name="knows")
+
+    def create_duplicate(self, n_relations):
+        dup = Person.objects.create(name="duplicate", first_name="first name")
+        dup.collection.add(self.col)
+        for i in range(n_relations):
+            PersonPlace.objects.create(
+                related_person=dup, related_place=self.place, relation_type=self.rel_type
+            )
+        PersonPerson.objects.create(
+            related_personA=Person.objects.create(name="other"),
+            related_personB=dup,
+            relation_type=self.pers_rel_type,
+        )
+        return dup
+
+    def merge_and_count_queries(self, n_relations):
+        keep = Person.objects.create(name="keep")
+        dup = self.create_duplicate(n_relations)
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            merge_entities(keep, [dup])
+            duration = time.perf_counter() - start
+        print(f"merged duplicate with {n_relations} relations in {duration:.3f}s")
+        self.assertEqual(PersonPlace.objects.filter(related_person=keep).count(), n_relations)
+        self.assertEqual(PersonPerson.objects.filter(related_personB=keep).count(), 1)
+        self.assertEqual(keep.collection.count(), 1)
+        self.assertEqual(keep.label_set.count(), 1)
+        self.assertFalse(Person.objects.filter(pk=dup.pk).exists())
+        return len(ctx.captured_queries)
+
+    def test_constant_queries(self):
+        # the first merge creates the legacy label type and fills the content type cache
+        self.merge_and_count_queries(1)
+        self.assertEqual(self.merge_and_count_queries(5), self.merge_and_count_queries(50))
+
+    def test_merge_clusters(self):
+        clusters = []
+        for i in range(3):
+            keep = Person.objects.create(name=f"keep {i}")
+            clusters.append((keep, [self.create_duplicate(2).pk, self.create_duplicate(2)]))
+        merge_entity_clusters(clusters)
+        for keep, dups in clusters:
+            self.assertEqual(PersonPlace.objects.filter(related_person=keep).count(), 4)
+
+
+class CollectionPublishedTestCase(TestCase):
+    def setUp(self):
+        self.col = Collection.objects.create(name="published collection")
+        self.other = Person.objects.create(name="not in collection")
+        self.members = [Person.objects.create(name=f"member {i}") for i in range(20)]
+        place = Place.objects.create(name="member place")
+        place.collection.add(self.col)
+        self.members.append(place)
+        rel = PersonPlace.objects.create(
+            related_person=self.members[0],
+            related_place=place,
+            relation_type=PersonPlaceRelation.objects.create(name="born in"),
+        )
+        rel.collection.add(self.col)
+        self.members.append(rel)
+        for member in self.members[:20]:
+            member.collection.add(self.col)
+
+    def test_propagation(self):
+        col = Collection.objects.get(pk=self.col.pk)
+        col.published = True
+        with mock.patch.object(TempEntityClass, "save") as save:
+            with self.assertNumQueries(2):
+                col.save()
+        self.assertEqual(save.call_count, 0)
+        self.assertEqual(
+            TempEntityClass.objects.filter(pk__in=[m.pk for m in self.members], published=True).count(),
+            len(self.members),
+        )
+        self.assertFalse(TempEntityClass.objects.get(pk=self.other.pk).published)
+        with self.assertNumQueries(1):
+            col.save()
+
+    def test_propagation_revision(self):
+        col = Collection.objects.get(pk=self.col.pk)
+        col.published = True
+        with reversion.create_revision():
+            col.save()
+        version = Version.objects.get_for_object(TempEntityClass.objects.get(pk=self.members[0].pk)).first()
+        self.assertTrue(version.field_dict["published"])
+
+
+class TextDiffTestCase(TestCase):
+    def make_text(self, n_words):
+        rnd = random.Random(n_words)
+        vocab = ["".join(rnd.choice("abcdefghijklmnop") for _ in range(rnd.randint(2, 9))) for _ in range(3000)]
+        weights = [1 / (i + 1) for i in range(len(vocab))]
+        words = rnd.choices(vocab, weights, k=n_words)
+        text_old = " ".join(words)
+        spans = []
+        start = 0
+        for i, word in enumerate(words):
+            if i % 10 == 0:
+                spans.append((start, start + len(word)))
+            start += len(word) + 1
+        edited = set(rnd.sample(range(n_words), n_words // 200))
+        text_new = " ".join(f"inserted {w}" if i in edited else w for i, w in enumerate(words))
+        return text_old, text_new, spans
+
+    def test_map_spans(self):
+        text_old = "Anna Muster was born in Vienna and died in Graz."
+        text_new = "Dr. Anna Muster was born in Wien and died in Graz in 1900."
+        res = map_spans(text_old, text_new, [(0, 11), (24, 30), (43, 47)])
+        self.assertEqual(res, [(4, 15), None, (45, 49)])
+
+    def test_long_text(self):
+        for n_words in (2000, 20000):
+            text_old, text_new, spans = self.make_text(n_words)
+            res = map_spans(text_old, text_new, spans)
+            for (s, e), span in zip(spans, res):
+                self.assertIsNotNone(span)
+                self.assertEqual(text_old[s:e], text_new[span[0] : span[1]])
+
+    def test_repetitive_text(self):
+        # no token occurs only once, so the ranges between the edits are diffed without anchors
+        rnd = random.Random(1)
+        vocab = ["der", "die", "das", "und", "in", "von", "zu", "mit"]
+        for n_words, n_edits in ((30000, 100), (30000, 1500)):
+            words = [rnd.choice(vocab) for _ in range(n_words)]
+            spans = []
+            start = 0
+            for i, word in enumerate(words):
+                if i % 30 == 0:
+                    spans.append((start, start + len(word), i))
+                start += len(word) + 1
+            # every odd edited word is deleted, every even one replaced
+            edited = set(rnd.sample(range(n_words), n_edits))
+            text_new = " ".join(
+                rnd.choice(vocab) if i in edited else w for i, w in enumerate(words) if i not in edited or i % 2 == 0
+            )
+            res = map_spans(" ".join(words), text_new, [(s, e) for s, e, i in spans])
+            lost = [i for (s, e, i), span in zip(spans, res) if span is None and i not in edited]
+            for (s, e, i), span in zip(spans, res):
+                if span is not None:
+                    self.assertEqual(words[i], text_new[span[0] : span[1]])
+            self.assertLessEqual(len(lost), len(spans) // 100)
+
+
+class BulkCreateTestCase(TestCase):
+    def test_bulk_create_persons(self):
+        persons = [
+            Person(name=f"bulk person {i}", first_name="first", start_date_written="1900", end_date_written="<1950")
+            for i in range(2000)
+        ]
+        start = time.perf_counter()
+        Person.bulk_create_instances(persons)
+        print(f"bulk created {len(persons)} persons in {time.perf_counter() - start:.3f}s")
+        self.assertEqual(Person.objects.filter(name__startswith="bulk person").count(), 2000)
+        person = Person.objects.get(pk=persons[10].pk)
+        self.assertEqual(person.first_name, "first")
+        self.assertEqual(person.start_date, datetime(1900, 7, 2).date())
+        saved = Person.objects.create(name="saved", start_date_written="1900", end_date_written="<1950")
+        saved.refresh_from_db()
+        for field in ["start_date", "start_start_date", "start_end_date", "end_date", "end_start_date", "end_end_date"]:
+            self.assertEqual(getattr(person, field), getattr(saved, field))
+        self.assertEqual(person.self_contenttype, ContentType.objects.get_for_model(Person))
+        self.assertEqual(person.uri_set.get().uri, get_default_uri(person.pk))
+        self.assertEqual(Uri.objects.filter(entity__in=[p.pk for p in persons]).count(), 2000)
+
+    def test_bulk_create_relations(self):
+        person = Person.objects.create(name="person")
+        place = Place.objects.create(name="place")
+        rel_type = PersonPlaceRelation.objects.create(name="visited")
+        relations = [
+            PersonPlace(related_person=person, related_place=place, relation_type=rel_type, start_date_written="1920")
+            for i in range(100)
+        ]
+        PersonPlace.bulk_create_instances(relations)
+        self.assertEqual(PersonPlace.objects.filter(related_person=person).count(), 100)
+        self.assertFalse(Uri.objects.filter(entity__in=[r.pk for r in relations]).exists())
+        self.assertEqual(TempEntityClass.get_subclass_instance(relations[0].pk), relations[0])
+
+
+class DateParserTestCase(TestCase):
+    def test_parse_dates(self):
+        written = ["1890", "ab 1914", "<1850-01-01>", "", None, "1890"]
+        res = DateParser.parse_dates(written)
+        self.assertEqual(res[0], DateParser.parse_date("1890"))
+        self.assertEqual(res[1], DateParser.parse_date("ab 1914"))
+        self.assertEqual(res[2][0], datetime(1850, 1, 1))
+        self.assertEqual(res[3], (None, None, None))
+        self.assertEqual(res[4], (None, None, None))
+        self.assertIs(res[5], res[0])
+
+    def corpus(self, size):
+        rnd = random.Random(1)
+        distinct = [str(y) for y in range(1000, 1950)]
+        distinct += [f"ab {y}" for y in range(1800, 1950)]
+        distinct += [f"<{y}-01-01>" for y in range(1800, 1950)]
+        distinct += [f"{d}.{m}.{y}" for d, m, y in zip(range(1, 29), range(1, 13), range(1850, 1900))]
+        return distinct, rnd.choices(distinct, k=size)
+
+    def test_cache_misses(self):
+        distinct, corpus = self.corpus(5000)
+        DateParser.parse_date.cache_clear()
+        res = DateParser.parse_dates(corpus)
+        self.assertEqual(len(res), len(corpus))
+        self.assertLessEqual(DateParser.parse_date.cache_info().misses, len(distinct))
+
+    @skipUnless(os.environ.get("APIS_DATES_BENCHMARK_ROWS"), "APIS_DATES_BENCHMARK_ROWS is not set")
+    def test_benchmark(self):
+        # parses APIS_DATES_BENCHMARK_ROWS written dates, e.g. 1000000
+        distinct, corpus = self.corpus(int(os.environ["APIS_DATES_BENCHMARK_ROWS"]))
+        DateParser.parse_date.cache_clear()
+        start = time.perf_counter()
+        DateParser.parse_dates(corpus)
+        duration = time.perf_counter() - start
+        print(f"parsed {len(corpus)} written dates in {duration:.3f}s")
+
+    def test_reparse_command(self):
+        persons = [Person.objects.create(name=f"reparse {i}", start_date_written="1900") for i in range(10)]
+        label = Label.objects.create(label="reparse", temp_entity=persons[0], end_date_written="1901")
+        Person.objects.filter(pk__in=[p.pk for p in persons[:5]]).update(start_date=None)
+        Label.objects.filter(pk=label.pk).update(end_date=None)
+        call_command("reparse_dates", batch_size=3, stdout=io.StringIO())
+        self.assertEqual(Person.objects.filter(name__startswith="reparse", start_date__isnull=True).count(), 0)
+        self.assertEqual(Label.objects.get(pk=label.pk).end_date, datetime(1901, 7, 2).date())
+        with self.assertNumQueries(2):
+            self.assertEqual(reparse_dates(Label.objects.all()), (1, 0))
+
+
+class VocabTreeTestCase(TestCase):
+    def setUp(self):
+        vocab_tree.invalidate()
+        self.root = ProfessionType.objects.create(name="root")
+        self.child = ProfessionType.objects.create(name="child", parent_class=self.root)
+        self.grandchild = ProfessionType.objects.create(name="grandchild", parent_class=self.child)
+        self.rel_root = PersonPlaceRelation.objects.create(name="located in", name_reverse="location of")
+        self.rel_child = PersonPlaceRelation.objects.create(name="born in", name_reverse="", parent_class=self.rel_root)
+
+    def test_labels(self):
+        grandchild = ProfessionType.objects.get(pk=self.grandchild.pk)
+        rel_child = PersonPlaceRelation.objects.get(pk=self.rel_child.pk)
+        vocab_tree.get_tree()
+        with self.assertNumQueries(0):
+            self.assertEqual(grandchild.label, "root >> child >> grandchild")
+            self.assertEqual(rel_child.label, "located in >> born in")
+            self.assertEqual(rel_child.label_reverse, "location of >> born in [REVERSE]")
+            self.assertEqual(grandchild.get_ancestors(), [self.child.pk, self.root.pk])
+            self.assertEqual(self.root.get_descendants(), [self.child.pk, self.grandchild.pk])
+
+    def test_invalidation(self):
+        vocab_tree.get_tree()
+        self.root.name = "renamed root"
+        self.root.save()
+        grandchild = ProfessionType.objects.get(pk=self.grandchild.pk)
+        self.assertEqual(grandchild.label, "renamed root >> child >> grandchild")
+        self.child.delete()
+        self.assertEqual(vocab_tree.get_tree().get_descendants(self.root.pk), [])
+
+    def count_autocomplete_queries(self):
+        url = reverse(
+            "apis:apis_vocabularies:generic_vocabularies_autocomplete",
+            kwargs={"vocab": "professiontype", "direct": "normal"},
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url, {"q": "child"})
+        self.assertEqual(res.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_autocomplete_queries(self):
+        self.count_autocomplete_queries()
+        few = self.count_autocomplete_queries()
+        for i in range(10):
+            ProfessionType.objects.create(name=f"child {i}", parent_class=self.grandchild)
+        vocab_tree.get_tree()
+        self.assertEqual(self.count_autocomplete_queries(), few)
+
+
+class ClosureTableTestCase(TestCase):
+    def setUp(self):
+        self.root = PersonPlaceRelation.objects.create(name="located in")
+        self.child = PersonPlaceRelation.objects.create(name="lived in", parent_class=self.root)
+        self.grandchild = PersonPlaceRelation.objects.create(name="born in", parent_class=self.child)
+        self.other = PersonPlaceRelation.objects.create(name="visited")
+
+    def assertSubtree(self, node, expected):
+        self.assertEqual(set(node.get_subtree().values_list("pk", flat=True)), {n.pk for n in expected})
+
+    def test_subtree(self):
+        with self.assertNumQueries(1):
+            self.assertSubtree(self.root, [self.root, self.child, self.grandchild])
+        self.assertEqual(
+            get_child_classes([self.root.pk], PersonPlaceRelation), [self.root.pk, self.child.pk, self.grandchild.pk]
+        )
+        objids, labels = get_child_classes([self.child.pk], PersonPlaceRelation, labels=True)
+        self.assertEqual(labels, [(self.grandchild.pk, "located in >> lived in >> born in")])
+
+    def test_move(self):
+        self.child.parent_class = self.other
+        self.child.save()
+        self.assertSubtree(self.root, [self.root])
+        self.assertSubtree(self.other, [self.other, self.child, self.grandchild])
+        self.assertEqual(
+            VocabsClosure.objects.get(ancestor=self.other, descendant=self.grandchild).depth, 2
+        )
+        self.other.parent_class = self.grandchild
+        with self.assertRaises(ValueError):
+            self.other.save()
+        self.other.refresh_from_db()
+        self.assertIsNone(self.other.parent_class_id)
+        self.assertSubtree(self.grandchild, [self.grandchild])
+
+    def test_filter(self):
+        person = Person.objects.create(name="person")
+        place = Place.objects.create(name="place")
+        rel = PersonPlace.objects.create(related_person=person, related_place=place, relation_type=self.grandchild)
+        PersonPlace.objects.create(related_person=person, related_place=place, relation_type=self.other)
+        qs = PersonPlace.objects.filter(relation_type__ancestor_closures__ancestor=self.root)
+        self.assertEqual(list(qs), [rel])
+
+    def test_collections_and_rebuild(self):
+        root = Collection.objects.create(name="root collection")
+        child = Collection.objects.create(name="child collection", parent_class=root)
+        self.assertSubtree(root, [root, child])
+        root.parent_class = child
+        with self.assertRaises(ValueError):
+            root.save()
+        root.refresh_from_db()
+        self.assertIsNone(root.parent_class_id)
+        CollectionClosure.objects.all().delete()
+        rebuild_closure(CollectionClosure, Collection)
+        self.assertSubtree(root, [root, child])
+        rebuild_closure(VocabsClosure, VocabsBaseClass)
+        self.assertSubtree(self.root, [self.root, self.child, self.grandchild])
+
+
+class VocabImportTestCase(TestCase):
+    skos = """
+@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+@prefix ex: <http://example.org/vocabs/> .
+
+ex:1 a skos:Concept ; skos:prefLabel "located in"@de, "liegt in"@fr ; skos:altLabel "reverse name: location of"@de .
+ex:2 a skos:Concept ; skos:prefLabel "born in"@de ; skos:broader ex:1 .
+ex:3 a skos:Concept ; skos:prefLabel "born in hospital"@de ; skos:broader ex:2, ex:1 .
+"""
+
+    def write_file(self, content, suffix):
+        f = tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False, encoding="utf-8")
+        f.write(content)
+        f.close()
+        self.addCleanup(os.remove, f.name)
+        return f.name
+
+    def test_skos(self):
+        path = self.write_file(self.skos, ".ttl")
+        before = PersonPlaceRelation.objects.count()
+        call_command("import_vocabs", "PersonPlaceRelation", path, stdout=io.StringIO())
+        rel = PersonPlaceRelation.objects.get(name="born in hospital")
+        self.assertEqual(rel.label, "located in >> born in >> born in hospital")
+        self.assertEqual(rel.label_reverse, "location of >> born in [REVERSE] >> born in hospital [REVERSE]")
+        self.assertEqual(rel.vocabsuri_set.get().uri, "http://example.org/vocabs/3")
+        self.assertEqual(rel.vocab_name.name, "PersonPlaceRelation")
+        self.assertEqual(PersonPlaceRelation.objects.get(name="located in").get_subtree().count(), 3)
+        call_command("import_vocabs", "PersonPlaceRelation", path, stdout=io.StringIO())
+        self.assertEqual(PersonPlaceRelation.objects.count(), before + 3)
+
+    @skipUnless(os.environ.get("APIS_VOCABS_BENCHMARK_TERMS"), "APIS_VOCABS_BENCHMARK_TERMS is not set")
+    def test_benchmark(self):
+        # imports a tree of APIS_VOCABS_BENCHMARK_TERMS terms with 50 roots, e.g. 50000
+        n_terms = int(os.environ["APIS_VOCABS_BENCHMARK_TERMS"])
+        rows = ["id,name,parent_class"]
+        for i in range(n_terms):
+            parent = "" if i < 50 else str(i // 50 - 1 if i >= 100 else i - 50)
+            rows.append(f"{i},profession {i},{parent}")
+        path = self.write_file("\n".join(rows), ".csv")
+        terms = read_csv(path)
+        queries = []
+
+        def count_queries(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            created, existing = import_terms(ProfessionType, terms, batch_size=1000)
+        self.assertEqual((created, existing), (n_terms, 0))
+        self.assertEqual(ProfessionType.objects.filter(name__startswith="profession ", parent_class__isnull=True).count(), 50)
+        profession = ProfessionType.objects.get(name=f"profession {n_terms - 1}")
+        self.assertEqual(profession.get_subtree().count(), 1)
+        if connection.features.can_return_rows_from_bulk_insert:
+            self.assertLess(len(queries), n_terms // 50)
+
+
+class CollectionPermissionTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = Group.objects.create(name="collection editors")
+        cls.col = Collection.objects.create(name="editable collection")
+        cls.col.groups_allowed.add(cls.group)
+        cls.other_col = Collection.objects.create(name="other collection")
+        cls.user = User.objects.create_user("collection editor", "apisdev16")
+        cls.user.groups.add(cls.group)
+        cls.editable = Person.bulk_create_instances([Person(name=f"editable {i}") for i in range(30)])
+        cls.others = Person.bulk_create_instances([Person(name=f"other {i}") for i in range(30)])
+        TempEntityClass.collection.through.objects.bulk_create(
+            [TempEntityClass.collection.through(tempentityclass_id=p.pk, collection_id=cls.col.pk) for p in cls.editable]
+            + [
+                TempEntityClass.collection.through(tempentityclass_id=p.pk, collection_id=cls.other_col.pk)
+                for p in cls.others
+            ]
+        )
+
+    def get_user(self):
+        # a fresh user object per test, the allowed collections are cached on it
+        return User.objects.get(pk=self.user.pk)
+
+    def test_backend(self):
+        user = self.get_user()
+        self.assertTrue(user.has_perm("apis_entities.change_person", self.editable[0]))
+        self.assertTrue(user.has_perm("delete_person", self.editable[0]))
+        self.assertFalse(user.has_perm("apis_entities.change_person", self.others[0]))
+        self.assertFalse(user.has_perm("apis_entities.change_place", self.editable[0]))
+        self.assertFalse(user.has_perm("apis_entities.change_person"))
+        self.assertEqual(
+            user.get_all_permissions(self.editable[0]), {"apis_entities.change_person", "apis_entities.delete_person"}
+        )
+
+    def test_collection_changes(self):
+        person = self.others[0]
+        self.assertFalse(self.get_user().has_perm("change_person", person))
+        person.collection.add(self.col)
+        self.assertTrue(self.get_user().has_perm("change_person", person))
+        self.col.groups_allowed.remove(self.group)
+        self.assertFalse(self.get_user().has_perm("change_person", person))
+
+    def test_checker_queries(self):
+        persons = list(Person.objects.filter(pk__in=[p.pk for p in self.editable + self.others]))
+        checker = CollectionPermissionChecker(self.get_user())
+        # two for the collections, two for the guardian rows of the objects which are not editable through them
+        with self.assertNumQueries(4):
+            checker.prefetch_perms(persons)
+            res = [checker.has_perm(f"{action}_person", p) for p in persons for action in ["change", "delete"]]
+        self.assertEqual(res.count(True), 2 * len(self.editable))
+        checker = CollectionPermissionChecker(self.get_user())
+        with self.assertNumQueries(2):
+            checker.has_perm("change_person", self.editable[0])
+            checker.has_perm("delete_person", self.editable[0])
+
+    def test_guardian_rows(self):
+        from guardian.shortcuts import assign_perm
+
+        assign_perm("change_person", self.user, self.others[0])
+        self.assertTrue(self.get_user().has_perm("change_person", self.others[0]))
+        self.assertFalse(self.get_user().has_perm("delete_person", self.others[0]))
+        checker = CollectionPermissionChecker(self.get_user())
+        checker.prefetch_perms(self.editable[:2] + self.others[:2])
+        self.assertTrue(checker.has_perm("change_person", self.others[0]))
+        self.assertFalse(checker.has_perm("change_person", self.others[1]))
+        self.assertTrue(checker.has_perm("change_person", self.editable[1]))
+
+    def test_drop_object_permissions(self):
+        from guardian.models import GroupObjectPermission, UserObjectPermission
+        from guardian.shortcuts import assign_perm
+
+        assign_perm("change_person", self.group, self.editable[0])
+        assign_perm("delete_person", self.group, self.editable[0])
+        assign_perm("change_person", self.group, self.others[0])
+        assign_perm("change_person", self.user, self.editable[1])
+        assign_perm("view_group", self.group, self.group)
+        self.assertEqual(drop_object_permissions(dry_run=True)["GroupObjectPermission"], 2)
+        self.assertEqual(GroupObjectPermission.objects.count(), 4)
+        self.assertEqual(drop_object_permissions()["GroupObjectPermission"], 2)
+        self.assertEqual(GroupObjectPermission.objects.count(), 2)
+        self.assertEqual(UserObjectPermission.objects.count(), 1)
+        self.assertTrue(self.get_user().has_perm("change_person", self.editable[0]))
+        self.assertTrue(self.get_user().has_perm("change_person", self.others[0]))
+
+
+@override_settings(APIS_SHOW_ONLY_PUBLISHED=True)
+class VisibilityTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("visibility", password="pas_1234$")
+        cls.token = Token.objects.create(user=cls.user).key
+        cls.persons = Person.bulk_create_instances(
+            [Person(name=f"visible {i}", published=i % 2 == 0) for i in range(200)]
+        )
+        cls.place = Place.objects.create(name="visibility place", published=True)
+        rel_type = PersonPlaceRelation.objects.create(name="visibility relation")
+        cls.published_rel = PersonPlace.objects.create(
+            related_person=cls.persons[0], related_place=cls.place, relation_type=rel_type, published=True
+        )
+        cls.hidden_rel = PersonPlace.objects.create(
+            related_person=cls.persons[1], related_place=cls.place, relation_type=rel_type
+        )
+        cls.published_text = Text.objects.create(text="text of a published person")
+        cls.persons[0].text.add(cls.published_text)
+        cls.hidden_text = Text.objects.create(text="text of a hidden person")
+        cls.persons[1].text.add(cls.hidden_text)
+        cls.label_type = LabelType.objects.create(name="visibility label")
+        cls.published_label = Label.objects.create(label="l1", temp_entity=cls.persons[0], label_type=cls.label_type)
+        cls.hidden_label = Label.objects.create(label="l2", temp_entity=cls.persons[1], label_type=cls.label_type)
+
+    def get_request(self, user):
+        request = RequestFactory().get("/")
+        request.user = user
+        return request
+
+    def test_rule(self):
+        anonymous = self.get_request(AnonymousUser())
+        authenticated = self.get_request(self.user)
+        for qs, published, hidden in [
+            (Person.objects.all(), self.persons[0], self.persons[1]),
+            (PersonPlace.objects.all(), self.published_rel, self.hidden_rel),
+            (Text.objects.all(), self.published_text, self.hidden_text),
+            (Label.objects.all(), self.published_label, self.hidden_label),
+        ]:
+            pks = set(qs.filter_for_user(request=anonymous).values_list("pk", flat=True))
+            self.assertIn(published.pk, pks)
+            self.assertNotIn(hidden.pk, pks)
+            pks = set(qs.filter_for_user(request=authenticated).values_list("pk", flat=True))
+            self.assertTrue({published.pk, hidden.pk} <= pks)
+            # outside of a request only published objects are visible
+            self.assertNotIn(hidden.pk, set(qs.filter_for_user().values_list("pk", flat=True)))
+            self.assertIn(published.pk, set(qs.published().values_list("pk", flat=True)))
+        with override_settings(APIS_SHOW_ONLY_PUBLISHED=False):
+            self.assertEqual(Person.objects.filter_for_user().count(), Person.objects.count())
+
+    def test_rule_cached_per_request(self):
+        request = self.get_request(AnonymousUser())
+        first = get_visibility_filter(Person, request)
+        self.assertIs(get_visibility_filter(Person, request), first)
+        self.assertIsNone(get_visibility_filter(Person, self.get_request(self.user)))
+
+    def test_benchmark(self):
+        published_count = Person.objects.filter(published=True).count()
+        for name, user, expected in [
+            ("anonymous list", AnonymousUser(), published_count),
+            ("authenticated list", self.user, Person.objects.count()),
+        ]:
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                for i in range(10):
+                    qs = Person.objects.filter_for_user(request=self.get_request(user)).order_by("pk")
+                    count = qs.count()
+                    page = list(qs[:25])
+            duration = time.perf_counter() - start
+            print(f"{name}: {duration / 10 * 1000:.1f}ms and {len(queries) / 10:.0f} queries per page")
+            self.assertEqual(count, expected)
+            self.assertEqual(len(page), 25)
+        api_url = reverse("apis:apis_core:person-list") + "?format=json&limit=50"
+        # the router holds a lazy placeholder, the permissions are looked up on the real viewset
+        api_view = get_generic_viewset(resolve(reverse("apis:apis_core:person-list")).func.cls._model)
+        authenticated = APIClient()
+        authenticated.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        with mock.patch.object(api_view, "permission_classes", (AllowAny,)):
+            for name, client, expected in [
+                ("anonymous api", APIClient(), published_count),
+                ("authenticated api", authenticated, Person.objects.count()),
+            ]:
+                client.get(api_url)
+                start = time.perf_counter()
+                with CaptureQueriesContext(connection) as queries:
+                    for i in range(10):
+                        res = client.get(api_url)
+                duration = time.perf_counter() - start
+                print(f"{name}: {duration / 10 * 1000:.1f}ms and {len(queries) / 10:.0f} queries per request")
+                self.assertEqual(res.status_code, 200)
+                self.assertEqual(res.json()["count"], expected)
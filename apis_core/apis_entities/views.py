@@ -141,7 +141,7 @@ class GenericListViewNew(UserPassesTestMixin, ExportMixin, SingleTableView):
                 app_label__startswith="apis_", model=self.entity.lower()
             )
             .model_class()
-            .objects.all()
+            .objects.filter_for_user(request=self.request)
         )
         self.filter = get_list_filter_of_entity(self.entity.title())(
             self.request.GET, queryset=qs
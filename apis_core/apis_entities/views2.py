@@ -11,13 +11,13 @@ from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.generic import DeleteView
 from django_tables2 import RequestConfig
-from guardian.core import ObjectPermissionChecker
 from reversion.models import Version
 import importlib
 
 from apis_core.apis_entities.models import AbstractEntity
 from apis_core.apis_labels.models import Label
 from apis_core.apis_metainfo.models import Uri
+from apis_core.apis_metainfo.permissions import CollectionPermissionChecker
 from apis_core.apis_relations.models import AbstractRelation
 from apis_core.apis_relations.tables import get_generic_relations_table, LabelTableEdit
 from .forms import get_entities_form, FullTextForm, GenericEntitiesStanbolForm
@@ -98,7 +98,7 @@ class GenericEntitiesEditView(View):
         tb_label_open = request.GET.get('PL-page', None)
         side_bar.append(('Label', tb_label, 'PersonLabel', tb_label_open))
         RequestConfig(request, paginate={"per_page": 10}).configure(tb_label)
-        perm = ObjectPermissionChecker(request.user)
+        perm = CollectionPermissionChecker(request.user)
         permissions = {'change': perm.has_perm('change_{}'.format(entity), instance),
                        'delete': perm.has_perm('delete_{}'.format(entity), instance),
                        'create': request.user.has_perm('entities.add_{}'.format(entity))}
@@ -140,7 +140,7 @@ class GenericEntitiesEditView(View):
         else:
             template = select_template(['apis_entities/{}_create_generic.html'.format(entity),
                                         'apis_entities/entity_create_generic.html'])
-            perm = ObjectPermissionChecker(request.user)
+            perm = CollectionPermissionChecker(request.user)
             permissions = {'change': perm.has_perm('change_{}'.format(entity), instance),
                            'delete': perm.has_perm('delete_{}'.format(entity), instance),
                            'create': request.user.has_perm('entities.add_{}'.format(entity))}
@@ -4,7 +4,9 @@ import unicodedata
 # from reversion import revisions as reversion
 import reversion
 from django.db import models
+from django.db.models import Q
 
+from apis_core.apis_metainfo.visibility import VisibilityManager
 from apis_core.apis_vocabularies.models import LabelType
 from apis_core.helper_functions import DateParser
 
@@ -42,6 +44,21 @@ class Label(models.Model):
     # TODO __sresch__ add related_name="label_set" here to be consistent with other usages throughout django
     temp_entity = models.ForeignKey("apis_metainfo.TempEntityClass", on_delete=models.CASCADE)
 
+    objects = VisibilityManager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    @classmethod
+    def get_published_filter(cls):
+        """
+        :return: Q object selecting the labels of published entities
+        """
+        return Q(temp_entity__published=True)
+
     def get_web_object(self):
         result = {
             'relation_pk': self.pk,
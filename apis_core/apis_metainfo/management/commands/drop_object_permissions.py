@@ -0,0 +1,67 @@
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, IntegerField, OuterRef
+from django.db.models.functions import Cast
+from guardian.models import GroupObjectPermission
+
+from apis_core.apis_metainfo.models import Collection, TempEntityClass
+from apis_core.apis_metainfo.permissions import object_actions
+
+
+def get_collection_perm_content_types():
+    """
+    :return: list of the content types of TempEntityClass and all its subclasses
+    """
+    models = [m for m in apps.get_models() if issubclass(m, TempEntityClass)]
+    return list(ContentType.objects.get_for_models(*models, for_concrete_models=False).values())
+
+
+def drop_object_permissions(dry_run=False):
+    """
+    Deletes the guardian group object permission rows which grant change or delete on an entity or relation to a group
+    that is in groups_allowed of one of the collections of the object. The CollectionPermissionBackend grants these
+    already. All other guardian rows are kept, in particular the ones of single users and the ones of groups which do
+    not follow from the collections.
+
+    :param dry_run: only count the rows
+    :return: dict of guardian model name -> number of deleted (or, with dry_run, matching) rows
+    """
+    # object_pk of the guardian rows is a text column
+    covered = Collection.groups_allowed.through.objects.filter(
+        group_id=OuterRef("group_id"),
+        collection__tempentityclass=Cast(OuterRef("object_pk"), IntegerField()),
+    )
+    res = 0
+    with transaction.atomic():
+        for ct in get_collection_perm_content_types():
+            qs = GroupObjectPermission.objects.filter(
+                Exists(covered),
+                content_type=ct,
+                permission__codename__in=["{}_{}".format(action, ct.model) for action in object_actions],
+            )
+            if dry_run:
+                res += qs.count()
+            else:
+                res += qs.delete()[0]
+    return {GroupObjectPermission.__name__: res}
+
+
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = (
+        "deletes the per-object guardian group permissions of entities and relations which are granted through the "
+        "collections by apis_core.apis_metainfo.permissions.CollectionPermissionBackend as well"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true", help="only count the rows that would be deleted"
+        )
+
+    def handle(self, *args, **options):
+        for model_name, count in drop_object_permissions(dry_run=options["dry_run"]).items():
+            verb = "would delete" if options["dry_run"] else "deleted"
+            self.stdout.write(f"{model_name}: {verb} {count}")
+        return "all done"
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+
+from apis_core.apis_labels.models import Label
+from apis_core.apis_metainfo.models import TempEntityClass
+from apis_core.helper_functions import DateParser
+
+date_fields = [
+    "start_date",
+    "start_start_date",
+    "start_end_date",
+    "end_date",
+    "end_start_date",
+    "end_end_date",
+]
+
+
+def reparse_dates(queryset, batch_size=2000):
+    """
+    Re-parses the written dates of all objects in queryset and writes the changed ones back with bulk_update.
+
+    :param queryset: queryset of a model with the written and parsed date fields (TempEntityClass or Label)
+    :param batch_size: number of objects loaded, parsed and updated at once
+    :return: tuple of the number of checked and of updated objects
+    """
+    queryset = queryset.only("pk", "start_date_written", "end_date_written", *date_fields).order_by("pk")
+    checked = 0
+    updated = 0
+    last_pk = None
+    while True:
+        batch_qs = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        batch = list(batch_qs[:batch_size])
+        if len(batch) == 0:
+            break
+        last_pk = batch[-1].pk
+        written = [obj.start_date_written for obj in batch] + [obj.end_date_written for obj in batch]
+        parsed = dict(zip(written, DateParser.parse_dates(written)))
+        changed = []
+        for obj in batch:
+            old = [getattr(obj, f) for f in date_fields]
+            start = parsed[obj.start_date_written]
+            end = parsed[obj.end_date_written]
+            new = [d.date() if d is not None else None for d in start + end]
+            if old != new:
+                for f, d in zip(date_fields, new):
+                    setattr(obj, f, d)
+                changed.append(obj)
+        queryset.model.objects.bulk_update(changed, date_fields)
+        checked += len(batch)
+        updated += len(changed)
+    return checked, updated
+
+
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = "re-parses the written dates of all entities, relations and labels"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=2000, help="number of objects updated at once"
+        )
+
+    def handle(self, *args, **options):
+        for model in [TempEntityClass, Label]:
+            checked, updated = reparse_dates(model.objects.all(), batch_size=options["batch_size"])
+            self.stdout.write(f"{model.__name__}: checked {checked}, updated {updated}")
+        return "all done"
@@ -0,0 +1,20 @@
+# Generated by Django 3.1.14 on 2026-10-18 07:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('apis_metainfo', '0006_remove_text_lang'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tempentityclass',
+            name='self_contenttype',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='contenttypes.contenttype'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def backfill_self_contenttype(apps, schema_editor):
+    """Sets the self_contenttype discriminator of all existing entities and relations, one update per concrete class"""
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    TempEntityClass = apps.get_model("apis_metainfo", "TempEntityClass")
+    for model in apps.get_models():
+        if TempEntityClass not in model._meta.get_parent_list():
+            continue
+        ct, created = ContentType.objects.get_or_create(
+            app_label=model._meta.app_label, model=model._meta.model_name
+        )
+        TempEntityClass.objects.filter(
+            pk__in=model.objects.values("pk"), self_contenttype__isnull=True
+        ).update(self_contenttype=ct)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apis_metainfo", "0007_tempentityclass_self_contenttype"),
+        ("apis_entities", "0004_auto_20200722_1231"),
+        ("apis_relations", "0003_auto_20200609_0925"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_self_contenttype, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apis_metainfo', '0008_backfill_tempentityclass_self_contenttype'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionClosure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_closures', to='apis_metainfo.collection')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_closures', to='apis_metainfo.collection')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='collectionclosure',
+            index=models.Index(fields=['descendant', 'depth'], name='apis_metain_descend_057996_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='collectionclosure',
+            unique_together={('ancestor', 'descendant')},
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+from apis_core.helper_functions.closure import rebuild_closure
+
+
+def backfill_closure(apps, schema_editor):
+    """Fills the closure table from the parent_class hierarchy of all existing collections"""
+    rebuild_closure(
+        apps.get_model("apis_metainfo", "CollectionClosure"), apps.get_model("apis_metainfo", "Collection")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apis_metainfo", "0009_collectionclosure"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_closure, migrations.RunPython.noop),
+    ]
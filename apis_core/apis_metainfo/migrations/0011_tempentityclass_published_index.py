@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apis_metainfo', '0010_backfill_collectionclosure'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tempentityclass',
+            index=models.Index(fields=['published', 'self_contenttype'], name='apis_metain_publish_4bfd3c_idx'),
+        ),
+    ]
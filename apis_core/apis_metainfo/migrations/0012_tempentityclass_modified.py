@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apis_metainfo', '0011_tempentityclass_published_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tempentityclass',
+            name='modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
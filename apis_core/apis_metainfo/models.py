@@ -1,6 +1,5 @@
 import re
 import unicodedata
-from difflib import SequenceMatcher
 
 import requests
 
@@ -11,24 +10,31 @@ from django.conf import settings
 from django.contrib.auth.models import Group
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.db import models, transaction
 from django.db.models.query import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.functional import cached_property
-from math import inf
 from model_utils.managers import InheritanceManager
-import copy
 
 from apis_core.apis_entities.serializers_generic import EntitySerializer
 from apis_core.apis_labels.models import Label
-from apis_core.apis_vocabularies.models import CollectionType, LabelType, TextType
+from apis_core.apis_metainfo.visibility import VisibilityManager
+from apis_core.apis_vocabularies.models import CollectionType, LabelType, TextType, VocabsBaseClass, VocabsClosure
 
 from django.contrib.contenttypes.fields import GenericRelation
 # from helper_functions.highlighter import highlight_text
 from apis_core.default_settings.NER_settings import autocomp_settings
-from apis_core.helper_functions import DateParser
+from apis_core.helper_functions import DateParser, registry, render_cache
+from apis_core.helper_functions.bulk import bulk_insert_multi_table
+from apis_core.helper_functions.closure import update_closure
+from apis_core.helper_functions.text_diff import map_spans
 
 NEXT_PREV = getattr(settings, "APIS_NEXT_PREV", True)
+# maximum number of pks per query of TempEntityClass.touch
+TOUCH_BATCH_SIZE = 1000
 
 
 @reversion.register()
@@ -74,9 +80,19 @@ class TempEntityClass(models.Model):
     references = models.TextField(blank=True, null=True)
     notes = models.TextField(blank=True, null=True)
     published = models.BooleanField(default=False)
-    objects = models.Manager()
+    # modification stamp, also bumped when the relations, labels or uris of the object change (see touch)
+    modified = models.DateTimeField(auto_now=True)
+    # discriminator of the concrete subclass (entity or relation), filled on save
+    self_contenttype = models.ForeignKey(
+        ContentType, blank=True, null=True, editable=False, on_delete=models.SET_NULL
+    )
+    objects = VisibilityManager()
     objects_inheritance = InheritanceManager()
 
+    class Meta:
+        # backs the published filter of the visibility rule and of the typed lists of get_subclass_instances
+        indexes = [models.Index(fields=["published", "self_contenttype"])]
+
     if "apis_highlighter" in settings.INSTALLED_APPS:
         from apis_highlighter.models import Annotation
         annotation_set = GenericRelation(Annotation)
@@ -91,48 +107,97 @@ class TempEntityClass(models.Model):
         else:
             return "(ID: {})".format(self.id)
 
-    def save(self, parse_dates=True, *args, **kwargs):
-        """Adaption of the save() method of the class to automatically parse string-dates into date objects"""
+    def set_parsed_dates(self, parse_date=DateParser.parse_date):
+        """
+        Sets the date fields from the written start and end dates.
 
-        if parse_dates:
+        :param parse_date: function returning the (date, start date, end date) tuple of a written date
+        """
 
-            # overwrite every field with None as default
-            start_date = None
-            start_start_date = None
-            start_end_date = None
-            end_date = None
-            end_start_date = None
-            end_end_date = None
+        # overwrite every field with None as default
+        start_date = None
+        start_start_date = None
+        start_end_date = None
+        end_date = None
+        end_start_date = None
+        end_end_date = None
 
-            if self.start_date_written:
-                # If some textual user input of a start date is there, then parse it
+        if self.start_date_written:
+            # If some textual user input of a start date is there, then parse it
 
-                start_date, start_start_date, start_end_date = DateParser.parse_date(
-                    self.start_date_written
-                )
+            start_date, start_start_date, start_end_date = parse_date(
+                self.start_date_written
+            )
 
-            if self.end_date_written:
-                # If some textual user input of an end date is there, then parse it
+        if self.end_date_written:
+            # If some textual user input of an end date is there, then parse it
 
-                end_date, end_start_date, end_end_date = DateParser.parse_date(
-                    self.end_date_written
-                )
+            end_date, end_start_date, end_end_date = parse_date(
+                self.end_date_written
+            )
 
-            self.start_date = start_date
-            self.start_start_date = start_start_date
-            self.start_end_date = start_end_date
-            self.end_date = end_date
-            self.end_start_date = end_start_date
-            self.end_end_date = end_end_date
+        self.start_date = start_date
+        self.start_start_date = start_start_date
+        self.start_end_date = start_end_date
+        self.end_date = end_date
+        self.end_start_date = end_start_date
+        self.end_end_date = end_end_date
+
+    def save(self, parse_dates=True, *args, **kwargs):
+        """Adaption of the save() method of the class to automatically parse string-dates into date objects"""
+
+        if parse_dates:
+            self.set_parsed_dates()
 
         if self.name:
             self.name = unicodedata.normalize("NFC", self.name)
 
+        if self.self_contenttype_id is None:
+            self.self_contenttype = ContentType.objects.get_for_model(self)
+
         super(TempEntityClass, self).save(*args, **kwargs)
 
         return self
 
+    @classmethod
+    def bulk_create_instances(cls, instances, batch_size=1000, parse_dates=True):
+        """
+        Inserts many new instances of a concrete entity or relation class.
+
+        Django's bulk_create can not create multi-table inherited models, so the rows are inserted by
+        helper_functions.bulk: the rows of the subclass in batches, the TempEntityClass rows only on PostgreSQL (one
+        insert per row on MySQL/MariaDB and sqlite). The written dates are parsed in one batch.
+        save() is not called, so no post_save signals are sent and no reversion history is written.
+
+        :param instances: iterable of unsaved instances of cls
+        :param batch_size: maximum number of rows per insert
+        :param parse_dates: whether to parse the written dates, as in save()
+        :return: list of the saved instances, with their primary keys set
+        """
+        instances = list(instances)
+        if len(instances) == 0:
+            return instances
+        contenttype = ContentType.objects.get_for_model(cls)
+        if parse_dates:
+            written = [obj.start_date_written for obj in instances] + [obj.end_date_written for obj in instances]
+            parsed_dates = dict(zip(written, DateParser.parse_dates(written)))
+
+        for obj in instances:
+            if parse_dates:
+                obj.set_parsed_dates(parsed_dates.__getitem__)
+            if obj.name:
+                obj.name = unicodedata.normalize("NFC", obj.name)
+            if obj.self_contenttype_id is None:
+                obj.self_contenttype_id = contenttype.pk
+
+        return bulk_insert_multi_table(cls, instances, batch_size=batch_size)
+
     def get_child_entity(self):
+        if self.self_contenttype_id is not None:
+            model_class = ContentType.objects.get_for_id(self.self_contenttype_id).model_class()
+            if not isinstance(self, model_class):
+                return model_class.objects.filter(pk=self.pk).first()
+            return self
         for x in [x for x in apps.all_models["apis_entities"].values()]:
             if x.__name__ in list(settings.APIS_ENTITIES.keys()):
                 try:
@@ -143,6 +208,115 @@ class TempEntityClass(models.Model):
                     pass
         return None
 
+    @classmethod
+    def get_subclass_instances(cls, pks, prepare=None, queryset=None):
+        """Resolves TempEntityClass ids to instances of their concrete subclasses.
+
+        Uses the self_contenttype discriminator, so there is one query for the discriminators and one indexed
+        query per concrete class found. Rows without discriminator (not backfilled yet) are resolved via the
+        InheritanceManager.
+
+        :param pks: iterable of TempEntityClass primary keys
+        :param prepare: optional callable which takes the queryset of one concrete class and returns it with e.g.
+            prefetches added, it is not applied to rows without discriminator
+        :param queryset: optional TempEntityClass queryset restricting the objects, e.g. to the visible ones
+        :return: dict mapping the primary keys to the concrete instances; unknown pks are left out
+        """
+        if queryset is None:
+            queryset = TempEntityClass.objects.all()
+        pks_by_contenttype = {}
+        for pk, contenttype_id in queryset.filter(pk__in=list(pks)).values_list(
+            "pk", "self_contenttype_id"
+        ):
+            pks_by_contenttype.setdefault(contenttype_id, []).append(pk)
+        res = {}
+        for contenttype_id, ct_pks in pks_by_contenttype.items():
+            if contenttype_id is None:
+                qs = TempEntityClass.objects_inheritance.filter(pk__in=ct_pks).select_subclasses()
+            else:
+                model_class = ContentType.objects.get_for_id(contenttype_id).model_class()
+                qs = model_class.objects.filter(pk__in=ct_pks)
+                if prepare is not None:
+                    qs = prepare(qs)
+            res.update({inst.pk: inst for inst in qs})
+        return res
+
+    @classmethod
+    def get_subclass_instance(cls, pk):
+        """Resolves a single TempEntityClass id to an instance of its concrete subclass.
+
+        :param pk: TempEntityClass primary key
+        :return: the instance of the concrete subclass
+        :raises TempEntityClass.DoesNotExist: if there is no object with the given pk
+        """
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise TempEntityClass.DoesNotExist(f"No TempEntityClass with pk {pk}")
+        res = cls.get_subclass_instances([pk])
+        if pk not in res:
+            raise TempEntityClass.DoesNotExist(f"No TempEntityClass with pk {pk}")
+        return res[pk]
+
+    @classmethod
+    def touch(cls, pks, related=False):
+        """
+        Bumps the modification stamp of entities or relations whose serialization changed without a save() of their
+        own, e.g. because a relation, label or uri of them was saved, with one update per TOUCH_BATCH_SIZE objects.
+
+        :param pks: iterable of TempEntityClass primary keys, None values are ignored
+        :param related: also touch the objects whose serialization shows the given ones, see get_related_pks
+        :return: number of touched objects
+        """
+        pks = {pk for pk in pks if pk is not None}
+        if related:
+            pks |= cls.get_related_pks(pks)
+        if len(pks) == 0:
+            return 0
+        render_cache.invalidate_entities(pks)
+        pks = list(pks)
+        modified = timezone.now()
+        res = 0
+        for i in range(0, len(pks), TOUCH_BATCH_SIZE):
+            res += TempEntityClass.objects.filter(pk__in=pks[i : i + TOUCH_BATCH_SIZE]).update(modified=modified)
+        return res
+
+    @classmethod
+    def get_related_pks(cls, pks):
+        """
+        The serialization of an entity shows its relations and, as their targets, the name, dates, uris, labels,
+        vocabularies and collections of the entities on their other side. The serialization of a relation shows both
+        of its entities.
+
+        :param pks: iterable of TempEntityClass primary keys, None values are ignored
+        :return: set of the pks of the relations of the given entities and of the entities on their other side, and of
+            the entities of the given relations, without the given pks
+        """
+        pks = list({pk for pk in pks if pk is not None})
+        res = set()
+        for i in range(0, len(pks), TOUCH_BATCH_SIZE):
+            chunk = pks[i : i + TOUCH_BATCH_SIZE]
+            classes = set()
+            for ct_id in TempEntityClass.objects.filter(pk__in=chunk).values_list("self_contenttype_id", flat=True):
+                # rows without the discriminator could be of any class
+                classes.add(ContentType.objects.get_for_id(ct_id).model_class() if ct_id is not None else None)
+            for relation_class in registry.get_relation_classes():
+                if None not in classes and classes.isdisjoint(
+                    [
+                        relation_class,
+                        relation_class.get_related_entity_classA(),
+                        relation_class.get_related_entity_classB(),
+                    ]
+                ):
+                    continue
+                field_a = relation_class.get_related_entity_field_nameA() + "_id"
+                field_b = relation_class.get_related_entity_field_nameB() + "_id"
+                query = models.Q(pk__in=chunk)
+                query |= models.Q(**{f"{field_a}__in": chunk}) | models.Q(**{f"{field_b}__in": chunk})
+                for row in relation_class._base_manager.filter(query).values_list("pk", field_a, field_b):
+                    res.update(row)
+        return res - set(pks)
+
     @classmethod
     def get_listview_url(self):
         entity = self.__name__.lower()
@@ -251,69 +425,16 @@ class TempEntityClass(models.Model):
             return None
 
     def merge_with(self, entities):
-        e_a_pk = self.pk
-        e_a = type(self).__name__
-        self_model_class = ContentType.objects.get(
-            app_label="apis_entities", model__iexact=e_a
-        ).model_class()
-        if isinstance(entities, int):
-            entities = self_model_class.objects.get(pk=entities)
+        """Merges the given duplicates into this entity, see helper_functions.merge.merge_entities
+
+        :param entities: an entity instance or pk, or a list or queryset of them
+        """
+        # local import: merge imports apis_relations.models, which imports this module
+        from apis_core.helper_functions.merge import merge_entities
+
         if not isinstance(entities, list) and not isinstance(entities, QuerySet):
             entities = [entities]
-            entities = [
-                self_model_class.objects.get(pk=ent) if type(ent) == int else ent
-                for ent in entities
-            ]
-        rels = ContentType.objects.filter(
-            app_label="apis_relations", model__icontains=e_a
-        )
-        print(entities)
-        for ent in entities:
-            e_b = type(ent).__name__
-            e_b_pk = ent.pk
-            if e_b_pk == e_a_pk:
-                raise ValueError("You can not merge an entity with itself")
-            if e_a != e_b:
-                continue
-            lt, created = LabelType.objects.get_or_create(name="Legacy name (merge)")
-            col_list = list(self.collection.all())
-            for col2 in ent.collection.all():
-                if col2 not in col_list:
-                    self.collection.add(col2)
-            for f in ent._meta.local_many_to_many:
-                if not f.name.endswith("_set"):
-                    sl = list(getattr(self, f.name).all())
-                    for s in getattr(ent, f.name).all():
-                        if s not in sl:
-                            getattr(self, f.name).add(s)
-            Label.objects.create(label=str(ent), label_type=lt, temp_entity=self)
-            for u in Uri.objects.filter(entity=ent):
-                u.entity = self
-                u.save()
-            for l in Label.objects.filter(temp_entity=ent):
-                l.temp_entity = self
-                l.save()
-            for r in rels.filter(model__icontains=e_b):
-                lst_ents_rel = str(r).split()
-                if lst_ents_rel[-1] == lst_ents_rel[-2]:
-                    q_d = {"related_{}A".format(e_b.lower()): ent}
-                    k = r.model_class().objects.filter(**q_d)
-                    for t in k:
-                        setattr(t, "related_{}A".format(e_a.lower()), self)
-                        t.save()
-                    q_d = {"related_{}B".format(e_b.lower()): ent}
-                    k = r.model_class().objects.filter(**q_d)
-                    for t in k:
-                        setattr(t, "related_{}B".format(e_a.lower()), self)
-                        t.save()
-                else:
-                    q_d = {"related_{}".format(e_b.lower()): ent}
-                    k = r.model_class().objects.filter(**q_d)
-                    for t in k:
-                        setattr(t, "related_{}".format(e_a.lower()), self)
-                        t.save()
-
-            ent.delete()
+        merge_entities(self, entities)
 
     def get_serialization(self):
         return EntitySerializer(self).data
@@ -360,13 +481,70 @@ class Collection(models.Model):
     def __str__(self):
         return self.name
 
+    def propagate_published(self, published=None):
+        """
+        Sets the published flag of all entities and relations in the collection with one update over TempEntityClass.
+
+        No save() is called on the members, so the dates are not re-parsed and no post_save signals are sent. If a
+        reversion revision is active, the changed members are added to it in chunks.
+
+        :param published: the value to set, defaults to the published flag of the collection
+        :return: number of updated entities and relations
+        """
+        if published is None:
+            published = self.published
+        members = TempEntityClass.objects.filter(collection=self).exclude(published=published)
+        if reversion.is_active():
+            for ent in members.iterator(chunk_size=2000):
+                ent.published = published
+                reversion.add_to_revision(ent)
+        return members.update(published=published, modified=timezone.now())
+
     def save(self, *args, **kwargs):
+        propagate = False
+        moved = True
         if hasattr(self, "_loaded_values"):
-            if self.published != self._loaded_values["published"]:
-                for ent in self.tempentityclass_set.all():
-                    ent.published = self.published
-                    ent.save()
-        super().save(*args, **kwargs)
+            propagate = self.published != self._loaded_values["published"]
+            moved = self.parent_class_id != self._loaded_values.get("parent_class_id")
+        if moved:
+            # the closure update raises on a cycle, the new parent_class must be rolled back with it
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                update_closure(CollectionClosure, self.pk, self.parent_class_id)
+        else:
+            super().save(*args, **kwargs)
+        if propagate:
+            self.propagate_published()
+        if hasattr(self, "_loaded_values"):
+            self._loaded_values["published"] = self.published
+            self._loaded_values["parent_class_id"] = self.parent_class_id
+            self._loaded_values["name"] = self.name
+
+    def get_subtree(self, include_self=True):
+        """
+        :param include_self: whether the collection itself is part of the result
+        :return: queryset of the collection and all its descendants, resolved with one join on the closure table
+        """
+        qs = Collection.objects.filter(ancestor_closures__ancestor_id=self.pk)
+        if not include_self:
+            qs = qs.exclude(pk=self.pk)
+        return qs
+
+
+class CollectionClosure(models.Model):
+    """Closure table of the parent_class hierarchy of Collection, see helper_functions.closure"""
+
+    ancestor = models.ForeignKey(
+        Collection, related_name="descendant_closures", on_delete=models.CASCADE
+    )
+    descendant = models.ForeignKey(
+        Collection, related_name="ancestor_closures", on_delete=models.CASCADE
+    )
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = [["ancestor", "descendant"]]
+        indexes = [models.Index(fields=["descendant", "depth"])]
 
 
 @reversion.register()
@@ -378,6 +556,17 @@ class Text(models.Model):
     text = models.TextField(blank=True)
     source = models.ForeignKey(Source, blank=True, null=True, on_delete=models.SET_NULL)
 
+    objects = VisibilityManager()
+
+    @classmethod
+    def get_published_filter(cls):
+        """
+        :return: Q object selecting the texts of published entities or relations
+        """
+        return models.Q(
+            pk__in=TempEntityClass.text.through.objects.filter(tempentityclass__published=True).values("text_id")
+        )
+
     def __str__(self):
         if self.text != "":
             return "ID: {} - {}".format(self.id, self.text[:25])
@@ -391,24 +580,9 @@ class Text(models.Model):
             deleted = []
             orig = Text.objects.get(pk=self.pk)
             if orig.text != self.text and "apis_highlighter" in settings.INSTALLED_APPS:
-                ann = Annotation.objects.filter(text_id=self.pk).order_by("start")
-                min_ann_len = min([x.end-x.start for x in ann])
-                seq = SequenceMatcher(lambda x: len(x) > min_ann_len, orig.text, self.text)
-                for a in ann:
-                    changed = False
-                    count = 0
-                    for s in seq.get_matching_blocks():
-                        count += 1
-                        if s.a <= a.start and (s.a + s.size) >= a.end:
-                            old_start = copy.deepcopy(a.start)
-                            old_end = copy.deepcopy(a.end)
-                            new_start = a.start + (s.b - s.a)
-                            new_end =  a.end + (s.b - s.a)
-                            if orig.text[old_start:old_end] == self.text[new_start:new_end]:
-                                changed = True
-                                break
-                    if not changed:
-                        deleted.append(a.id)
+                ann = list(Annotation.objects.filter(text_id=self.pk).order_by("start"))
+                spans = map_spans(orig.text, self.text, [(a.start, a.end) for a in ann])
+                deleted = [a.id for a, span in zip(ann, spans) if span is None]
         else:
             deleted = None
         return deleted
@@ -419,93 +593,20 @@ class Text(models.Model):
             orig = Text.objects.get(pk=self.pk)
             if orig.text != self.text and "apis_highlighter" in settings.INSTALLED_APPS:
                 from apis_highlighter.models import Annotation
-                def calculate_context_weights(text, i_start, i_end):
-
-                    def calculate_word_dict(text, direction):
-
-                        word_list = re.split(" |\\n", text)
-                        word_list = [w for w in word_list if w != ""]
-
-                        word_dict = {}
-
-                        if word_list != []:
-
-                            value_step = 1 / len(word_list)
-                            value_current = 1
-                            for word in word_list[::direction]:
-                                word_value = word_dict.get(word, 0)
-                                word_dict[word] = word_value + value_current
-                                value_current -= value_step
-
-                        return word_dict
-
-                    text_left = text[:i_start]
-                    text_right = text[i_end:]
-                    word_dict_left = calculate_word_dict(text=text_left, direction=-1)
-                    word_dict_right = calculate_word_dict(text=text_right, direction=1)
-
-                    return {
-                        "word_dict_left": word_dict_left,
-                        "word_dict_right": word_dict_right,
-                    }
-
-                def make_diff(word_dict_a, word_dict_b):
-
-                    words_all = set(word_dict_a.keys()).union(set(word_dict_b.keys()))
-                    diff_all = 0
-                    for word in words_all:
-                        word_value_a = word_dict_a.get(word, 0)
-                        word_value_b = word_dict_b.get(word, 0)
-                        diff_all += abs(word_value_a - word_value_b)
-
-                    return diff_all
-
-                def correlate_annotations(text_old, text_new, annotations_old):
-
-                    for ann in annotations_old:
-                        i_old_start = ann.start
-                        i_old_end = ann.end
-                        context_weights_dict_old = calculate_context_weights(
-                            text=text_old,
-                            i_start=i_old_start,
-                            i_end=i_old_end
-                        )
-                        ann_text = text_old[ann.start:ann.end]
-                        diff_min = inf
-                        i_new_start = None
-                        i_new_end = None
-                        for i in re.finditer(f"(?={re.escape(ann_text)})", text_new):
-                            i_candidate_start = i.start()
-                            i_candidate_end = i_candidate_start + len(ann_text)
-                            context_weights_dict_new = calculate_context_weights(
-                                text=text_new, i_start=i_candidate_start, i_end=i_candidate_end
-                            )
-                            diff_left = make_diff(
-                                context_weights_dict_new["word_dict_left"],
-                                context_weights_dict_old["word_dict_left"]
-                            )
-                            diff_right = make_diff(
-                                context_weights_dict_new["word_dict_right"],
-                                context_weights_dict_old["word_dict_right"]
-                            )
-                            diff_current = diff_left + diff_right
-                            if diff_current < diff_min:
-                                diff_min = diff_current
-                                i_new_start = i_candidate_start
-                                i_new_end = i_candidate_end
-
-                        if diff_min != inf:
-                            ann.start = i_new_start
-                            ann.end = i_new_end
-                            ann.save()
-                        else:
-                            ann.delete() # TODO: we might want to delete relations as well.
-
-                correlate_annotations(
-                    text_old=orig.text,
-                    text_new=self.text,
-                    annotations_old=Annotation.objects.filter(text_id=self.pk).order_by("start")
-                )
+                # all annotations are re-anchored with one diff of the old and the new text
+                ann = list(Annotation.objects.filter(text_id=self.pk).order_by("start"))
+                spans = map_spans(orig.text, self.text, [(a.start, a.end) for a in ann])
+                moved = []
+                deleted = []
+                for a, span in zip(ann, spans):
+                    if span is None:
+                        deleted.append(a.pk)
+                    elif span != (a.start, a.end):
+                        a.start, a.end = span
+                        moved.append(a)
+                Annotation.objects.bulk_update(moved, ["start", "end"], batch_size=500)
+                # TODO: we might want to delete relations as well.
+                Annotation.objects.filter(pk__in=deleted).delete()
 
         super().save(*args, **kwargs)
 
@@ -523,6 +624,12 @@ class Uri(models.Model):
     # Timestamp when file was loaded and parsed
     loaded_time = models.DateTimeField(blank=True, null=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def __str__(self):
         return str(self.uri)
 
@@ -569,9 +676,7 @@ class UriCandidate(models.Model):
     @cached_property
     def description(self):
         headers = {"accept": "application/json"}
-        cn = TempEntityClass.objects_inheritance.get_subclass(
-            id=self.entity_id
-        ).__class__.__name__
+        cn = TempEntityClass.get_subclass_instance(self.entity_id).__class__.__name__
         for endp in autocomp_settings[cn.title()]:
             url = re.sub(r"/[a-z]+$", "/entity", endp["url"])
             params = {"id": self.uri}
@@ -593,3 +698,109 @@ class UriCandidate(models.Model):
 # def remove_default_uri(sender, instance, **kwargs):
 #    if Uri.objects.filter(entity=instance.entity).count() > 1:
 #        Uri.objects.filter(entity=instance.entity, domain="apis default").delete()
+
+
+@receiver([post_save, post_delete], sender=Uri, dispatch_uid="touch_entity_of_uri")
+@receiver([post_save, post_delete], sender=Label, dispatch_uid="touch_entity_of_label")
+def touch_entity(sender, instance, **kwargs):
+    # the uris and labels are shown with the targets of the relations as well, a moved one was shown by its old entity
+    field_name = "entity_id" if sender is Uri else "temp_entity_id"
+    loaded_values = getattr(instance, "_loaded_values", {})
+    TempEntityClass.touch([getattr(instance, field_name), loaded_values.get(field_name)], related=True)
+    if hasattr(instance, "_loaded_values"):
+        instance._loaded_values[field_name] = getattr(instance, field_name)
+
+
+@receiver(post_save, dispatch_uid="invalidate_rendered_entity_save")
+@receiver(post_delete, dispatch_uid="invalidate_rendered_entity_delete")
+def invalidate_rendered_entity(sender, instance, **kwargs):
+    if isinstance(instance, TempEntityClass):
+        render_cache.invalidate_entities([instance.pk])
+
+
+@receiver(post_save, dispatch_uid="touch_related_of_entity")
+def touch_related_of_entity(sender, instance, created=False, **kwargs):
+    # the relations touch their entities on save, an entity is shown by its relations and related entities
+    if created or not isinstance(instance, TempEntityClass) or type(instance) in registry.get_relation_classes():
+        return
+    TempEntityClass.touch(TempEntityClass.get_related_pks([instance.pk]))
+
+
+@receiver(post_save, sender=Text, dispatch_uid="touch_entities_of_text_save")
+@receiver(pre_delete, sender=Text, dispatch_uid="touch_entities_of_text_delete")
+def touch_entities_of_text(sender, instance, **kwargs):
+    # pre_delete, the rows linking the text to its entities are gone in post_delete
+    TempEntityClass.touch(
+        TempEntityClass.text.through.objects.filter(text_id=instance.pk).values_list("tempentityclass_id", flat=True)
+    )
+
+
+@receiver(m2m_changed, dispatch_uid="touch_entities_of_m2m")
+def touch_entities_of_m2m(sender, instance, action, reverse, model, pk_set, **kwargs):
+    # the ManyToMany fields through the relation classes are changed by saving relations, which touch their entities
+    if issubclass(sender, TempEntityClass):
+        return
+    # the texts are not shown with the targets of the relations
+    related = sender is not TempEntityClass.text.through
+    if not reverse:
+        if isinstance(instance, TempEntityClass) and action in ["post_add", "post_remove", "post_clear"]:
+            TempEntityClass.touch([instance.pk], related=related)
+    elif issubclass(model, TempEntityClass):
+        if action == "pre_clear":
+            # the rows are gone in post_clear
+            fields = [f for f in sender._meta.fields if f.is_relation]
+            target = next(f for f in fields if f.related_model is model)
+            source = next(f for f in fields if f is not target)
+            instance._apis_cleared_pks = list(
+                sender.objects.filter(**{source.attname: instance.pk}).values_list(target.attname, flat=True)
+            )
+        elif action == "post_clear":
+            TempEntityClass.touch(instance.__dict__.pop("_apis_cleared_pks", []), related=related)
+        elif action in ["post_add", "post_remove"]:
+            TempEntityClass.touch(pk_set or [], related=related)
+
+
+def get_referencing_pks(instance):
+    """
+    :param instance: a vocabulary or a collection
+    :return: set of the pks of the entities and relations whose serialization shows instance: the ones referencing it
+        or one of its descendants (whose labels contain its name) by a ForeignKey or ManyToMany field, by a label or by
+        a text
+    """
+    pks = [instance.pk]
+    if isinstance(instance, VocabsBaseClass):
+        pks += VocabsClosure.objects.filter(ancestor_id=instance.pk, depth__gt=0).values_list("descendant_id", flat=True)
+    res = set()
+    for model in [TempEntityClass] + registry.get_entity_classes() + registry.get_relation_classes():
+        for f in model._meta.get_fields(include_parents=False):
+            if f.concrete and (f.many_to_one or f.many_to_many) and isinstance(instance, f.related_model):
+                res.update(model._base_manager.filter(**{f"{f.name}__in": pks}).values_list("pk", flat=True))
+    if isinstance(instance, LabelType):
+        res.update(Label.objects.filter(label_type_id__in=pks).values_list("temp_entity_id", flat=True))
+    if isinstance(instance, TextType):
+        res.update(
+            TempEntityClass.text.through.objects.filter(text__kind_id__in=pks).values_list(
+                "tempentityclass_id", flat=True
+            )
+        )
+    return res
+
+
+@receiver(post_save, dispatch_uid="touch_entities_of_vocabulary_save")
+@receiver(pre_delete, dispatch_uid="touch_entities_of_vocabulary_pre_delete")
+@receiver(post_delete, dispatch_uid="touch_entities_of_vocabulary_delete")
+def touch_entities_of_vocabulary(sender, instance, signal, created=False, **kwargs):
+    if created or not isinstance(instance, (VocabsBaseClass, Collection)):
+        return
+    if signal is post_save and isinstance(instance, Collection):
+        # the collections are shown with their id and name only
+        if instance.name == getattr(instance, "_loaded_values", {}).get("name"):
+            return
+    if signal is pre_delete:
+        # the rows referencing instance are changed or gone in post_delete
+        instance._apis_referencing_pks = get_referencing_pks(instance)
+    elif signal is post_delete:
+        TempEntityClass.touch(instance.__dict__.pop("_apis_referencing_pks", []), related=True)
+    else:
+        TempEntityClass.touch(get_referencing_pks(instance), related=True)
+
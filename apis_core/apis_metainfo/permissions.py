@@ -0,0 +1,146 @@
+"""
+Object permissions of entities and relations derived from their collections.
+
+A user may change or delete an entity or relation if one of the user's groups is in groups_allowed of one of the
+collections of the object. Instead of copying this into one guardian row per object, group and permission, it is
+resolved at query time: the pks of the collections allowed for a user are loaded with one query and cached on the user
+object, the collections of an object are one more query (none if they were prefetched).
+
+To use it, add "apis_core.apis_metainfo.permissions.CollectionPermissionBackend" to AUTHENTICATION_BACKENDS, before
+"guardian.backends.ObjectPermissionBackend". guardian's backend stays in place for the per-object rows which do not
+follow from the collections, e.g. granted by hand to single users. The group rows written by earlier versions for the
+collections can be deleted with the drop_object_permissions command.
+"""
+
+from guardian.core import ObjectPermissionChecker
+
+from apis_core.apis_metainfo.models import Collection, TempEntityClass
+
+object_actions = ("change", "delete")
+
+
+def _split_perm(perm):
+    """
+    :param perm: permission as "app_label.codename" or "codename"
+    :return: tuple of the app label (or None) and the codename
+    """
+    if "." in perm:
+        return tuple(perm.split(".", 1))
+    return None, perm
+
+
+def is_collection_perm(perm, obj):
+    """
+    :param perm: permission as "app_label.codename" or "codename"
+    :param obj: model instance
+    :return: True if perm is one of the object permissions granted through the collections of obj
+    """
+    if not isinstance(obj, TempEntityClass):
+        return False
+    app_label, codename = _split_perm(perm)
+    if app_label is not None and app_label != obj._meta.app_label:
+        return False
+    return codename in ["{}_{}".format(action, obj._meta.model_name) for action in object_actions]
+
+
+def get_allowed_collection_pks(user):
+    """
+    :param user: the user
+    :return: frozenset of the pks of the collections the groups of the user are allowed to edit, cached on the user
+    """
+    if not user.is_active or user.is_anonymous:
+        return frozenset()
+    if not hasattr(user, "_collection_perm_cache"):
+        user._collection_perm_cache = frozenset(
+            Collection.objects.filter(groups_allowed__user=user).values_list("pk", flat=True)
+        )
+    return user._collection_perm_cache
+
+
+def _get_collection_pks(obj):
+    prefetched = getattr(obj, "_prefetched_objects_cache", {}).get("collection")
+    if prefetched is not None:
+        return {col.pk for col in prefetched}
+    return set(obj.collection.values_list("pk", flat=True))
+
+
+class CollectionPermissionBackend:
+    """
+    Authentication backend that only answers object permissions, see the module docstring. Model permissions are
+    left to the ModelBackend.
+    """
+
+    def authenticate(self, request, **credentials):
+        return None
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if obj is None or not isinstance(obj, TempEntityClass):
+            return set()
+        if get_allowed_collection_pks(user_obj).isdisjoint(_get_collection_pks(obj)):
+            return set()
+        return {"{}.{}_{}".format(obj._meta.app_label, action, obj._meta.model_name) for action in object_actions}
+
+    def has_perm(self, user_obj, perm, obj=None):
+        if obj is None or not is_collection_perm(perm, obj):
+            return False
+        allowed = get_allowed_collection_pks(user_obj)
+        if len(allowed) == 0:
+            return False
+        return not allowed.isdisjoint(_get_collection_pks(obj))
+
+
+class CollectionPermissionChecker:
+    """
+    Drop-in replacement of guardian's ObjectPermissionChecker for entities and relations.
+
+    The permissions granted through the collections cost at most one query per object, which is shared by all
+    permissions checked on it. prefetch_perms answers a whole page of objects with one query. Objects which are not
+    editable through their collections are checked against the guardian rows as well.
+
+    :param user: the user
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._allowed_objects = {}
+        self._guardian_checker = ObjectPermissionChecker(user)
+
+    def prefetch_perms(self, objects):
+        """
+        Loads the permissions of all objects with one query, plus the ones of guardian for the objects which are not
+        editable through their collections.
+
+        :param objects: iterable of TempEntityClass instances
+        """
+        objects = [obj for obj in objects if obj.pk not in self._allowed_objects]
+        if len(objects) == 0:
+            return
+        allowed = get_allowed_collection_pks(self.user)
+        granted = set()
+        if len(allowed) > 0:
+            granted = set(
+                TempEntityClass.collection.through.objects.filter(
+                    tempentityclass_id__in=[obj.pk for obj in objects], collection_id__in=allowed
+                ).values_list("tempentityclass_id", flat=True)
+            )
+        others = {}
+        for obj in objects:
+            self._allowed_objects[obj.pk] = obj.pk in granted
+            if obj.pk not in granted:
+                others.setdefault(type(obj), []).append(obj)
+        for model_objects in others.values():
+            self._guardian_checker.prefetch_perms(model_objects)
+
+    def has_perm(self, perm, obj):
+        """
+        :param perm: permission as "app_label.codename" or "codename", e.g. "change_person"
+        :param obj: the object
+        :return: True if the user has perm on obj
+        """
+        if self.user.is_active and self.user.is_superuser:
+            return True
+        if not is_collection_perm(perm, obj):
+            return self._guardian_checker.has_perm(perm, obj)
+        if obj.pk not in self._allowed_objects:
+            self.prefetch_perms([obj])
+        return self._allowed_objects[obj.pk] or self._guardian_checker.has_perm(perm, obj)
@@ -0,0 +1,69 @@
+"""
+Shared visibility rule of entities, relations, texts and labels.
+
+With APIS_SHOW_ONLY_PUBLISHED set, anonymous requests (and code running outside of a request) only see published
+objects, authenticated users see everything. Every model states what "published" means for it with the classmethod
+get_published_filter (default: its own published flag), e.g. labels follow the published flag of their entity.
+
+The rule is evaluated once per request: the filter of every model is built on first use and cached on the request,
+filter_for_user then only adds it to the queryset.
+"""
+
+from crum import get_current_request
+from django.conf import settings
+from django.db import models
+from django.db.models import Q
+
+
+def get_published_filter(model):
+    """
+    :param model: a model class
+    :return: Q object selecting the published objects of model
+    """
+    model_filter = getattr(model, "get_published_filter", None)
+    if model_filter is not None:
+        return model_filter()
+    return Q(published=True)
+
+
+def get_visibility_filter(model, request=None):
+    """
+    :param model: a model class
+    :param request: the request, defaults to the current request
+    :return: Q object restricting model to the objects visible in request, or None if everything is visible
+    """
+    if not getattr(settings, "APIS_SHOW_ONLY_PUBLISHED", False):
+        return None
+    if request is None:
+        request = get_current_request()
+    if request is None:
+        return get_published_filter(model)
+    cache = getattr(request, "_apis_visibility_filters", None)
+    if cache is None:
+        cache = {"only_published": not request.user.is_authenticated}
+        request._apis_visibility_filters = cache
+    if model not in cache:
+        cache[model] = get_published_filter(model) if cache["only_published"] else None
+    return cache[model]
+
+
+class VisibilityQuerySet(models.QuerySet):
+    def published(self):
+        """
+        :return: queryset of the published objects, regardless of the user
+        """
+        return self.filter(get_published_filter(self.model))
+
+    def filter_for_user(self, request=None):
+        """
+        :param request: the request, defaults to the current request
+        :return: queryset of the objects visible in the request
+        """
+        visibility_filter = get_visibility_filter(self.model, request=request)
+        if visibility_filter is None:
+            return self
+        return self.filter(visibility_filter)
+
+
+class VisibilityManager(models.Manager.from_queryset(VisibilityQuerySet)):
+    pass
@@ -1,16 +1,17 @@
-import inspect
-import sys
 import yaml
 
 # from reversion import revisions as reversion
 import reversion
-from crum import get_current_request
 from django.conf import settings
 from django.db import models
 from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 
 from apis_core.apis_entities.models import Person
 from apis_core.apis_metainfo.models import TempEntityClass
+from apis_core.apis_metainfo.visibility import VisibilityQuerySet
+from apis_core.helper_functions import registry
 
 
 #######################################################################
@@ -19,33 +20,7 @@ from apis_core.apis_metainfo.models import TempEntityClass
 #
 #######################################################################
 
-def find_if_user_accepted():
-    request = get_current_request()
-    if request is not None:
-        print('running through request')
-        if request.user.is_authenticated:
-            print('authenticated')
-            return {}
-        else:
-            return {'published': True}
-    else:
-        return {}
-
-
-class RelationPublishedQueryset(models.QuerySet):
-    def filter_for_user(self, *args, **kwargs):
-        if getattr(settings, "APIS_SHOW_ONLY_PUBLISHED", False):
-            request = get_current_request()
-            if request is not None:
-                if request.user.is_authenticated:
-                    return self
-                else:
-                    return self.filter(published=True)
-            else:
-                return self.filter(published=True)
-        else:
-            return self
-
+class RelationPublishedQueryset(VisibilityQuerySet):
     def filter_ann_proj(self, request=None, ann_proj=1, include_all=True):
         """The filter function provided by the manager class.
 
@@ -75,11 +50,8 @@ class BaseRelationManager(models.Manager):
     def filter_ann_proj(self, request=None, ann_proj=1, include_all=True):
         return self.get_queryset().filter_ann_proj(request=request, ann_proj=ann_proj, include_all=include_all)
 
-    def filter_for_user(self):
-        if hasattr(settings, "APIS_SHOW_ONLY_PUBLISHED") or "apis_highlighter" in getattr(settings, "INSTALLED_APPS"):
-            return self.get_queryset().filter_for_user()
-        else:
-            return self.get_queryset()
+    def filter_for_user(self, request=None):
+        return self.get_queryset().filter_for_user(request=request)
 
 #######################################################################
 #
@@ -101,6 +73,12 @@ class AbstractRelation(TempEntityClass):
         abstract = True
         default_manager_name = 'objects'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def save(self, *args, **kwargs):
 
         if (
@@ -111,6 +89,14 @@ class AbstractRelation(TempEntityClass):
             raise Exception("One or more of the necessary related models are None")
 
         super().save(*args, **kwargs)
+        # the relation is part of the serialization of both entities, and was of the ones it was moved away from
+        field_names = [self.get_related_entity_field_nameA() + "_id", self.get_related_entity_field_nameB() + "_id"]
+        loaded_values = getattr(self, "_loaded_values", {})
+        TempEntityClass.touch(
+            [getattr(self, name) for name in field_names] + [loaded_values.get(name) for name in field_names]
+        )
+        if hasattr(self, "_loaded_values"):
+            self._loaded_values.update({name: getattr(self, name) for name in field_names})
 
 
     # Methods dealing with individual data retrievals of instances
@@ -187,45 +173,13 @@ class AbstractRelation(TempEntityClass):
     ####################################################################################################################
 
 
-    _all_relation_classes = None
-    _all_relation_names = None
-
-
     @classmethod
     def get_all_relation_classes(cls):
         """
-        Instantiates both lists: '_all_relation_classes' and '_all_relation_names'
-
         :return: list of all python classes of the relations defined within this models' module
         """
 
-        # check if not yet instantiated
-        if cls._all_relation_classes == None:
-            # if not, then instantiate the private lists
-
-            relation_classes = []
-            relation_names = []
-
-            # using python's reflective logic, the following loop iterates over all classes of this current module.
-            for relation_name, relation_class in inspect.getmembers(
-                    sys.modules[__name__], inspect.isclass):
-                print('inspecting classes')
-                # check for python classes not to be used.
-                if \
-                        relation_class.__module__ == "apis_core.apis_relations.models" and \
-                        relation_class.__name__ != "AnnotationRelationLinkManager" and \
-                        relation_class.__name__ != "BaseRelationManager" and \
-                        relation_class.__name__ != "RelationPublishedQueryset" and \
-                        relation_class.__name__ != "AbstractRelation" and \
-                        relation_name != "ent_class":
-
-                    relation_classes.append(relation_class)
-                    relation_names.append(relation_name.lower())
-
-            cls._all_relation_classes = relation_classes
-            cls._all_relation_names = relation_names
-
-        return cls._all_relation_classes
+        return registry.get_relation_classes()
 
 
     @classmethod
@@ -235,11 +189,11 @@ class AbstractRelation(TempEntityClass):
         :return: The model class of the relation respective to the given name
         """
 
-        for relation_class in cls.get_all_relation_classes():
-            if relation_class.__name__.lower() == relation_name.lower():
-                return relation_class
+        relation_class = registry.get_relation_class(relation_name)
+        if relation_class is None:
+            raise Exception("Could not find relation class of name:", relation_name)
 
-        raise Exception("Could not find relation class of name:", relation_name)
+        return relation_class
 
 
     @classmethod
@@ -248,13 +202,7 @@ class AbstractRelation(TempEntityClass):
         :return: list of all class names in lower case of the relations defined within this models' module
         """
 
-        if cls._all_relation_classes == None:
-
-            # The instantion logic of relation_names list is coupled to the instantiation logic of the relation_classes
-            # list done in the method 'get_all_relation_classes'; hence just calling that is sufficient.
-            cls.get_all_relation_classes()
-
-        return cls._all_relation_names
+        return registry.get_relation_names()
 
 
 
@@ -541,6 +489,17 @@ class WorkWork(AbstractRelation):
     pass
 
 
+@receiver(post_delete, dispatch_uid="touch_entities_of_deleted_relation")
+def touch_entities_of_deleted_relation(sender, instance, **kwargs):
+    if isinstance(instance, AbstractRelation):
+        TempEntityClass.touch(
+            [
+                getattr(instance, instance.get_related_entity_field_nameA() + "_id", None),
+                getattr(instance, instance.get_related_entity_field_nameB() + "_id", None),
+            ]
+        )
+
+
 a_ents = getattr(settings, 'APIS_ADDITIONAL_ENTITIES', False)
 
 
@@ -21,14 +21,11 @@ class GenericRelationView(GenericListViewNew):
 
     def get_queryset(self, **kwargs):
         self.entity = self.kwargs.get('entity')
-        qs = AbstractRelation.get_relation_class_of_name(self.entity).objects.all()
+        qs = AbstractRelation.get_relation_class_of_name(self.entity).objects.filter_for_user(request=self.request)
         self.filter = get_generic_relation_filter(
             self.entity.title())(self.request.GET, queryset=qs)
         self.filter.form.helper = self.formhelper_class()
-        if callable(getattr(self.filter.qs, 'filter_for_user', None)):
-            return self.filter.qs.filter_for_user().distinct()
-        else:
-            return self.filter.qs.distinct()
+        return self.filter.qs.distinct()
 
 
     def get_table(self, **kwargs):
@@ -12,6 +12,7 @@ from apis_core.apis_metainfo.tables import (
     generic_render_end_date_written
 )
 from apis_core.apis_relations.models import AbstractRelation
+from apis_core.apis_vocabularies import vocab_tree
 empty_text_default = 'There are currently no relations'
 
 
@@ -237,11 +238,15 @@ def get_generic_relations_table(relation_class, entity_instance, detail=None):
                 }),
             )
             )
+            # the labels come from the in-memory vocabulary tree, so that the relation types are not fetched per row
+            tree = vocab_tree.get_tree()
             for an in data:
+                if an.relation_type_id not in tree:
+                    tree = vocab_tree.get_tree(an.relation_type_id)
                 if getattr(an, f"{related_entity_field_name_a}_id") == entity_instance.pk:
-                    an.other_relation_type = getattr(an.relation_type, "label")
+                    an.other_relation_type = tree.get_label(an.relation_type_id)
                 else:
-                    an.other_relation_type = getattr(an.relation_type, "label_reverse")
+                    an.other_relation_type = tree.get_label_reverse(an.relation_type_id)
 
  
             super().__init__(data, *args, **kwargs)
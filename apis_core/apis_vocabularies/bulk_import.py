@@ -0,0 +1,212 @@
+"""
+Bulk import of vocabularies from SKOS or CSV files.
+
+The readers turn a file into a list of term dicts with the keys key, name, name_reverse, description, parent_key and
+uri. import_terms resolves the parents in memory and writes the terms, their VocabNames row, the uris and the closure
+rows in batches, one level of the hierarchy after the other. The number of queries thus depends on the depth of the
+hierarchy, not on the number of terms, apart from the one insert per term on databases which can not return bulk
+inserted keys, i.e. all but PostgreSQL (see helper_functions.bulk).
+"""
+
+import csv
+import unicodedata
+
+from django.db import transaction
+
+from apis_core.apis_vocabularies import vocab_tree
+from apis_core.apis_vocabularies.models import (
+    RelationBaseClass,
+    VocabNames,
+    VocabsClosure,
+    VocabsUri,
+)
+from apis_core.helper_functions.bulk import bulk_insert_multi_table
+from apis_core.helper_functions.closure import add_closure_nodes
+
+
+def _literal_by_lang(literals, lang):
+    """returns the literal in lang, or else one without language, or else any of them"""
+    literals = sorted(literals, key=str)
+    for lit in literals:
+        if getattr(lit, "language", None) == lang:
+            return str(lit)
+    for lit in literals:
+        if getattr(lit, "language", None) is None:
+            return str(lit)
+    return str(literals[0]) if literals else None
+
+
+def read_skos(path, rdf_format=None, lang="de"):
+    """
+    Reads the concepts of a SKOS file (Turtle, RDF/XML or any other format rdflib knows).
+
+    The skos:prefLabel becomes the name and skos:broader the parent. An altLabel "reverse name: ..." as written by
+    the VocabToSkos renderer becomes the reverse name, skos:definition or dc:description the description. If a
+    concept has several broader concepts, the most specific one is used.
+
+    :param path: path of the file
+    :param rdf_format: rdflib format, guessed from the file extension if None
+    :param lang: preferred language of the labels
+    :return: list of term dicts
+    """
+    from rdflib import Graph
+    from rdflib.namespace import DC, RDF, SKOS
+    from rdflib.util import guess_format
+
+    g = Graph()
+    g.parse(path, format=rdf_format or guess_format(path) or "turtle")
+    concepts = set(g.subjects(RDF.type, SKOS.Concept))
+    broader = {c: [b for b in g.objects(c, SKOS.broader) if b in concepts] for c in concepts}
+    terms = []
+    for c in sorted(concepts, key=str):
+        name_reverse = None
+        for alt in g.objects(c, SKOS.altLabel):
+            if str(alt).startswith("reverse name: "):
+                name_reverse = str(alt)[len("reverse name: "):]
+        candidates = broader[c]
+        parent = None
+        if candidates:
+            # a broader concept which is itself broader of another candidate is not the direct parent
+            direct = [b for b in candidates if not any(b in broader[o] for o in candidates if o != b)]
+            parent = sorted(direct or candidates, key=str)[0]
+        terms.append(
+            {
+                "key": str(c),
+                "name": _literal_by_lang(list(g.objects(c, SKOS.prefLabel)), lang) or str(c),
+                "name_reverse": name_reverse,
+                "description": _literal_by_lang(
+                    list(g.objects(c, SKOS.definition)) + list(g.objects(c, DC.description)), lang
+                ),
+                "parent_key": str(parent) if parent is not None else None,
+                "uri": str(c),
+            }
+        )
+    return terms
+
+
+def read_csv(path, delimiter=","):
+    """
+    Reads terms from a CSV file with a header row.
+
+    Only the column name is required. The optional columns are id (key of the term within the file), parent_class
+    (id, name or label of the parent term), name_reverse, description and uri, so that files written by the dl-vocabs
+    download can be imported again.
+
+    :param path: path of the file
+    :param delimiter: the column delimiter
+    :return: list of term dicts
+    """
+    terms = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for n, row in enumerate(csv.DictReader(f, delimiter=delimiter)):
+            terms.append(
+                {
+                    "key": row.get("id") or f"row-{n}",
+                    "name": row["name"],
+                    "name_reverse": row.get("name_reverse") or None,
+                    "description": row.get("description") or "",
+                    "parent_key": row.get("parent_class") or None,
+                    "uri": row.get("uri") or None,
+                }
+            )
+    return terms
+
+
+def import_terms(vocab_class, terms, user=None, batch_size=1000):
+    """
+    Writes terms into vocab_class.
+
+    Parents are looked up by key within the terms first, then by name among the terms and the existing vocabularies
+    of vocab_class. A term with the same name and parent as an existing vocabulary is not created again, so that an
+    import can be repeated.
+
+    :param vocab_class: the vocabulary class, e.g. ProfessionType
+    :param terms: list of term dicts as returned by read_skos or read_csv
+    :param user: optional user stored as userAdded
+    :param batch_size: maximum number of rows per insert or update
+    :return: tuple of the number of created and of already existing terms
+    """
+    is_relation = issubclass(vocab_class, RelationBaseClass)
+    with transaction.atomic():
+        vocab_name, created = VocabNames.objects.get_or_create(name=vocab_class.__name__)
+        existing = {}
+        existing_by_name = {}
+        for pk, name, parent_pk in vocab_class.objects.values_list("pk", "name", "parent_class_id"):
+            existing[(name, parent_pk)] = pk
+            existing_by_name.setdefault(name, pk)
+
+        by_key = {}
+        by_name = {}
+        for term in terms:
+            term["name"] = unicodedata.normalize("NFC", term["name"])
+            by_key[term["key"]] = term
+            by_name.setdefault(term["name"], term)
+
+        def resolve(term, visiting):
+            """sets term["pk"] to the pk of an existing vocabulary or to None for a term to be created"""
+            if "pk" in term:
+                return
+            parent_pk = None
+            parent_term = None
+            parent_key = term["parent_key"]
+            if parent_key is not None:
+                # labels as written by the csv download ("a >> b") are looked up by their last name
+                parent_name = parent_key.split(" >> ")[-1]
+                parent_term = by_key.get(parent_key) or by_name.get(parent_name)
+                if parent_term is not None and parent_term is not term and parent_term["key"] not in visiting:
+                    resolve(parent_term, visiting | {term["key"]})
+                    parent_pk = parent_term["pk"]
+                elif parent_name in existing_by_name:
+                    parent_term = None
+                    parent_pk = existing_by_name[parent_name]
+                else:
+                    parent_term = None
+            term["parent_term"] = parent_term
+            term["pk"] = existing.get((term["name"], parent_pk)) if parent_pk is not None or parent_term is None else None
+            term["parent_pk"] = parent_pk
+
+        for term in terms:
+            resolve(term, frozenset())
+
+        new_terms = [t for t in terms if t["pk"] is None]
+
+        def get_level(term):
+            """number of new ancestors of a new term, terms are inserted level by level to know the parent pks"""
+            if "level" not in term:
+                parent_term = term["parent_term"]
+                term["level"] = 0 if parent_term is None or parent_term["pk"] is not None else get_level(parent_term) + 1
+            return term["level"]
+
+        levels = {}
+        for term in new_terms:
+            levels.setdefault(get_level(term), []).append(term)
+        closure_nodes = []
+        for level in sorted(levels):
+            instances = []
+            for term in levels[level]:
+                parent_pk = term["parent_pk"]
+                if parent_pk is None and term["parent_term"] is not None:
+                    parent_pk = term["parent_term"]["instance"].pk
+                obj = vocab_class(
+                    name=term["name"],
+                    description=term["description"] or "",
+                    parent_class_id=parent_pk,
+                    vocab_name=vocab_name,
+                    userAdded=user,
+                    status="ac",
+                )
+                if is_relation:
+                    name_reverse = term["name_reverse"] or term["name"] + " [REVERSE]"
+                    obj.name_reverse = unicodedata.normalize("NFC", name_reverse)
+                term["instance"] = obj
+                instances.append(obj)
+            bulk_insert_multi_table(vocab_class, instances, batch_size=batch_size)
+            closure_nodes.extend((obj.pk, obj.parent_class_id) for obj in instances)
+
+        VocabsUri.objects.bulk_create(
+            [VocabsUri(uri=t["uri"], vocab_id=t["instance"].pk) for t in new_terms if t["uri"]],
+            batch_size=batch_size,
+        )
+        add_closure_nodes(VocabsClosure, closure_nodes, batch_size=batch_size)
+    vocab_tree.invalidate()
+    return len(new_terms), len(terms) - len(new_terms)
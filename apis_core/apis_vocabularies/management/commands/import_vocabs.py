@@ -0,0 +1,35 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from apis_core.apis_vocabularies.bulk_import import import_terms, read_csv, read_skos
+from apis_core.apis_vocabularies.models import VocabsBaseClass
+
+
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = "bulk imports a vocabulary (e.g. ProfessionType) with its hierarchy from a SKOS or CSV file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("vocab", type=str, help="name of the vocabulary class, e.g. ProfessionType")
+        parser.add_argument("file", type=str, help="location of the SKOS (ttl, rdf, xml, ...) or CSV file")
+        parser.add_argument(
+            "--format", default=None, help="rdflib format of a SKOS file or 'csv', guessed from the extension by default"
+        )
+        parser.add_argument("--lang", default="de", help="preferred language of SKOS labels. Defaults to de")
+        parser.add_argument("--batch-size", type=int, default=1000, help="number of rows written at once")
+
+    def handle(self, *args, **options):
+        try:
+            vocab_class = apps.get_model("apis_vocabularies", options["vocab"])
+        except LookupError:
+            raise CommandError(f"Unknown vocabulary: {options['vocab']}")
+        if not issubclass(vocab_class, VocabsBaseClass) or vocab_class == VocabsBaseClass:
+            raise CommandError(f"{options['vocab']} is not a vocabulary class")
+        file_format = options["format"]
+        if file_format == "csv" or (file_format is None and options["file"].lower().endswith(".csv")):
+            terms = read_csv(options["file"])
+        else:
+            terms = read_skos(options["file"], rdf_format=file_format, lang=options["lang"])
+        created, existing = import_terms(vocab_class, terms, batch_size=options["batch_size"])
+        self.stdout.write(f"{vocab_class.__name__}: created {created}, already existing {existing}")
+        return "all done"
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apis_vocabularies', '0002_texttype_lang'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VocabsClosure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_closures', to='apis_vocabularies.vocabsbaseclass')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_closures', to='apis_vocabularies.vocabsbaseclass')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='vocabsclosure',
+            index=models.Index(fields=['descendant', 'depth'], name='apis_vocabu_descend_ad9ab0_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='vocabsclosure',
+            unique_together={('ancestor', 'descendant')},
+        ),
+    ]
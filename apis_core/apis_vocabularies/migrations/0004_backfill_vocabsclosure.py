@@ -0,0 +1,21 @@
+from django.db import migrations
+
+from apis_core.helper_functions.closure import rebuild_closure
+
+
+def backfill_closure(apps, schema_editor):
+    """Fills the closure table from the parent_class hierarchy of all existing vocabularies"""
+    rebuild_closure(
+        apps.get_model("apis_vocabularies", "VocabsClosure"), apps.get_model("apis_vocabularies", "VocabsBaseClass")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apis_vocabularies", "0003_vocabsclosure"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apis_vocabularies', '0004_backfill_vocabsclosure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vocabsbaseclass',
+            name='modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -1,16 +1,20 @@
-import inspect
 import re
-import sys
 import unicodedata
 import yaml
 
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils.functional import cached_property
 from reversion import revisions as reversion
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericRelation
 
+from apis_core.apis_vocabularies import vocab_tree
+from apis_core.helper_functions import registry, render_cache
+from apis_core.helper_functions.closure import update_closure
+
 
 @reversion.register()
 class VocabNames(models.Model):
@@ -22,6 +26,10 @@ class VocabNames(models.Model):
         return re.sub(r"([A-Z])", r" \1", self.name).strip()
 
 
+# VocabNames pks per vocabulary class name, filled by VocabsBaseClass.save
+_vocab_name_pks = {}
+
+
 @reversion.register()
 class VocabsBaseClass(models.Model):
     """ An abstract base class for other classes which contain so called
@@ -50,6 +58,8 @@ class VocabsBaseClass(models.Model):
         VocabNames, blank=True, null=True,
         on_delete=models.SET_NULL
     )
+    # modification stamp, used for the ETag and Last-Modified headers of the API
+    modified = models.DateTimeField(auto_now=True)
     if 'apis_highlighter' in settings.INSTALLED_APPS:
         from apis_highlighter.models import Annotation
         annotation_set = GenericRelation(Annotation)
@@ -58,22 +68,70 @@ class VocabsBaseClass(models.Model):
         return self.label
 
     def save(self, *args, **kwargs):
-        d, created = VocabNames.objects.get_or_create(name=type(self).__name__)
-        self.vocab_name = d
+        vocab_name_pk = _vocab_name_pks.get(type(self).__name__)
+        if vocab_name_pk is None:
+            d, created = VocabNames.objects.get_or_create(name=type(self).__name__)
+            vocab_name_pk = d.pk
+            # only remembered once it is committed, a rolled back VocabNames row must not be reused
+            transaction.on_commit(lambda: _vocab_name_pks.setdefault(d.name, d.pk))
+        self.vocab_name_id = vocab_name_pk
         if self.name != unicodedata.normalize('NFC', self.name):  # secure correct unicode encoding
             self.name = unicodedata.normalize('NFC', self.name)
-        super(VocabsBaseClass, self).save(*args, **kwargs)
+        # the closure update raises on a cycle, the new parent_class must be rolled back with it
+        with transaction.atomic():
+            super(VocabsBaseClass, self).save(*args, **kwargs)
+            update_closure(VocabsClosure, self.pk, self.parent_class_id)
         return self
 
     @cached_property
     def label(self):
-        d = self
         res = self.name
-        while d.parent_class:
-            res = d.parent_class.name + ' >> ' + res
-            d = d.parent_class
+        if self.parent_class_id is not None:
+            parent_label = vocab_tree.get_tree(self.parent_class_id).get_label(self.parent_class_id)
+            if parent_label is not None:
+                res = parent_label + ' >> ' + res
         return res
 
+    def get_ancestors(self):
+        """
+        :return: list of the pks of all parents, starting with the direct parent, from the vocabulary tree
+        """
+        if self.parent_class_id is None:
+            return []
+        return [self.parent_class_id] + vocab_tree.get_tree(self.parent_class_id).get_ancestors(self.parent_class_id)
+
+    def get_descendants(self):
+        """
+        :return: list of the pks of all children, grandchildren etc. from the vocabulary tree
+        """
+        return vocab_tree.get_tree().get_descendants(self.pk)
+
+    def get_subtree(self, include_self=True):
+        """
+        :param include_self: whether the vocabulary itself is part of the result
+        :return: queryset of the vocabulary and all its descendants, resolved with one join on the closure table
+        """
+        qs = type(self).objects.filter(ancestor_closures__ancestor_id=self.pk)
+        if not include_self:
+            qs = qs.exclude(pk=self.pk)
+        return qs
+
+
+class VocabsClosure(models.Model):
+    """Closure table of the parent_class hierarchy of VocabsBaseClass, see helper_functions.closure"""
+
+    ancestor = models.ForeignKey(
+        VocabsBaseClass, related_name="descendant_closures", on_delete=models.CASCADE
+    )
+    descendant = models.ForeignKey(
+        VocabsBaseClass, related_name="ancestor_closures", on_delete=models.CASCADE
+    )
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = [["ancestor", "descendant"]]
+        indexes = [models.Index(fields=["descendant", "depth"])]
+
 
 @reversion.register(follow=['vocabsbaseclass_ptr'])
 class RelationBaseClass(VocabsBaseClass):
@@ -92,20 +150,14 @@ class RelationBaseClass(VocabsBaseClass):
 
     @cached_property
     def label_reverse(self):
-        d = self
         if len(self.name_reverse) < 1:
             res = '(' + self.name + ')'
         else:
             res = self.name_reverse
-        while d.parent_class:
-            try:
-                t = RelationBaseClass.objects.get(pk=d.parent_class.pk).name_reverse
-                if len(t) < 1:
-                    t = '(' + d.parent_class.name + ')'
-            except Exception as e:
-                t = '(' + d.parent_class.name + ')'
-            res = t + ' >> ' + res
-            d = d.parent_class
+        if self.parent_class_id is not None:
+            parent_label = vocab_tree.get_tree(self.parent_class_id).get_label_reverse(self.parent_class_id)
+            if parent_label is not None:
+                res = parent_label + ' >> ' + res
         return res
 
     def save(self, *args, **kwargs):
@@ -220,8 +272,6 @@ class AbstractRelationType(RelationBaseClass):
     class Meta:
         abstract = True
 
-    _all_relationtype_classes = None
-    _all_relationtype_names = None
     _related_entity_field_names = None
 
 
@@ -234,25 +284,7 @@ class AbstractRelationType(RelationBaseClass):
         :return: list of all python classes of the relationtypes defined within this models' module  
         """
 
-        if cls._all_relationtype_classes == None:
-
-            relationtype_classes = []
-            relationtype_names = []
-
-            for relationtype_name, relationtype_class in inspect.getmembers(
-                    sys.modules[__name__], inspect.isclass):
-
-                if relationtype_class.__module__ == "apis_core.apis_vocabularies.models" and \
-                        relationtype_name != "ent_class" and \
-                        relationtype_name.endswith("Relation"):
-
-                    relationtype_classes.append(relationtype_class)
-                    relationtype_names.append(relationtype_name.lower())
-
-            cls._all_relationtype_classes = relationtype_classes
-            cls._all_relationtype_names = relationtype_names
-
-        return cls._all_relationtype_classes
+        return registry.get_relationtype_classes()
 
 
     @classmethod
@@ -262,11 +294,11 @@ class AbstractRelationType(RelationBaseClass):
         :return: The model class of the relationtype respective to the given name
         """
 
-        for relationtype_class in cls.get_all_relationtype_classes():
-            if relationtype_class.__name__.lower() == relationtype_name.lower():
-                return relationtype_class
+        relationtype_class = registry.get_relationtype_class(relationtype_name)
+        if relationtype_class is None:
+            raise Exception("Could not find relationtype class of name:", relationtype_name)
 
-        raise Exception("Could not find relationtype class of name:", relationtype_name)
+        return relationtype_class
 
 
     @classmethod
@@ -275,11 +307,7 @@ class AbstractRelationType(RelationBaseClass):
         :return: list of all class names in lower case of the relationtypes defined within this models' module
         """
 
-        if cls._all_relationtype_names == None:
-
-            cls.get_all_relationtype_classes()
-
-        return cls._all_relationtype_names
+        return registry.get_relationtype_names()
 
 
     # Methods dealing with related entities
@@ -462,3 +490,15 @@ if a_ents:
                     ent_class = type(f"{rel_class_name}Relation", (AbstractRelationType,), attributes)
                     globals()[f"{rel_class_name}Relation"] = ent_class
 
+
+@receiver(post_save, dispatch_uid="invalidate_vocab_tree_save")
+@receiver(post_delete, dispatch_uid="invalidate_vocab_tree_delete")
+def invalidate_vocab_tree(sender, instance, **kwargs):
+    if isinstance(instance, VocabsBaseClass):
+        vocab_tree.invalidate()
+        render_cache.invalidate([render_cache.VOCABS_DEP])
+
+
+@receiver(post_delete, sender=VocabNames, dispatch_uid="forget_vocab_name_pks")
+def forget_vocab_name_pks(sender, instance, **kwargs):
+    _vocab_name_pks.clear()
@@ -0,0 +1,142 @@
+"""
+Process wide in-memory tree of all vocabularies.
+
+The tree holds name, reverse name and parent of every VocabsBaseClass row. It is loaded with two queries on first use
+and answers labels, reverse labels, ancestors and descendants without touching the database. It is dropped by the
+save and delete signals of the vocabularies (see apis_vocabularies.models) and additionally reloaded after
+VOCAB_TREE_TTL seconds, so that changes made by other processes or by queryset updates are picked up as well.
+"""
+
+import time
+
+from django.conf import settings
+
+VOCAB_TREE_TTL = getattr(settings, "APIS_VOCAB_TREE_TTL", 300)
+
+_tree = None
+
+
+class VocabTree:
+    """
+    Immutable snapshot of the vocabulary hierarchy.
+
+    :param nodes: dict of pk -> (name, name_reverse, parent pk), name_reverse is None for vocabularies which are not
+        relation types
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.children = {}
+        for pk, (name, name_reverse, parent_pk) in nodes.items():
+            if parent_pk is not None:
+                self.children.setdefault(parent_pk, []).append(pk)
+        self.loaded = time.monotonic()
+        self._labels = {}
+        self._labels_reverse = {}
+
+    def __contains__(self, pk):
+        return pk in self.nodes
+
+    def get_ancestors(self, pk):
+        """
+        :param pk: pk of a vocabulary
+        :return: list of the pks of all parents, starting with the direct parent
+        """
+        res = []
+        parent_pk = self.nodes[pk][2] if pk in self.nodes else None
+        while parent_pk is not None and parent_pk in self.nodes and parent_pk not in res:
+            res.append(parent_pk)
+            parent_pk = self.nodes[parent_pk][2]
+        return res
+
+    def get_descendants(self, pk):
+        """
+        :param pk: pk of a vocabulary
+        :return: list of the pks of all children, grandchildren etc. in breadth first order
+        """
+        res = []
+        seen = {pk}
+        queue = list(self.children.get(pk, []))
+        while queue:
+            child = queue.pop(0)
+            if child in seen:
+                continue
+            seen.add(child)
+            res.append(child)
+            queue.extend(self.children.get(child, []))
+        return res
+
+    def get_label(self, pk):
+        """
+        :param pk: pk of a vocabulary
+        :return: the names of all ancestors and the vocabulary joined by ' >> ', None for unknown pks
+        """
+        if pk not in self._labels:
+            if pk not in self.nodes:
+                return None
+            names = [self.nodes[p][0] for p in self.get_ancestors(pk)[::-1]]
+            names.append(self.nodes[pk][0])
+            self._labels[pk] = " >> ".join(names)
+        return self._labels[pk]
+
+    def _get_name_reverse(self, pk):
+        name, name_reverse, parent_pk = self.nodes[pk]
+        if name_reverse is None or len(name_reverse) < 1:
+            return "(" + name + ")"
+        return name_reverse
+
+    def get_label_reverse(self, pk):
+        """
+        :param pk: pk of a vocabulary
+        :return: the reverse names of all ancestors and the vocabulary joined by ' >> ', None for unknown pks
+        """
+        if pk not in self._labels_reverse:
+            if pk not in self.nodes:
+                return None
+            names = [self._get_name_reverse(p) for p in self.get_ancestors(pk)[::-1]]
+            names.append(self._get_name_reverse(pk))
+            self._labels_reverse[pk] = " >> ".join(names)
+        return self._labels_reverse[pk]
+
+
+def load_tree():
+    """
+    :return: a new VocabTree, loaded with two queries
+    """
+    # local import: apis_vocabularies.models imports this module
+    from apis_core.apis_vocabularies.models import RelationBaseClass, VocabsBaseClass
+
+    nodes = {
+        pk: (name, None, parent_pk)
+        for pk, name, parent_pk in VocabsBaseClass.objects.values_list("pk", "name", "parent_class_id")
+    }
+    for pk, name_reverse in RelationBaseClass.objects.values_list("pk", "name_reverse"):
+        if pk in nodes:
+            nodes[pk] = (nodes[pk][0], name_reverse, nodes[pk][2])
+    return VocabTree(nodes)
+
+
+def get_tree(required_pk=None):
+    """
+    Returns the current tree, (re)loading it if it was invalidated, is older than VOCAB_TREE_TTL or does not contain
+    required_pk yet.
+
+    :param required_pk: optional pk of a vocabulary that must be part of the tree
+    :return: VocabTree
+    """
+    global _tree
+    tree = _tree
+    if (
+        tree is None
+        or time.monotonic() - tree.loaded > VOCAB_TREE_TTL
+        or (required_pk is not None and required_pk not in tree)
+    ):
+        tree = load_tree()
+        _tree = tree
+    return tree
+
+
+def invalidate():
+    """Drops the tree, it is reloaded on the next use"""
+    global _tree
+    _tree = None
@@ -1,32 +1,19 @@
-import inspect
-import sys
-
 from django.conf import settings
 
+from apis_core.helper_functions import registry
+
 
 def add_entities(request):
-    ent_list = []
-    for name, obj in inspect.getmembers(
-        sys.modules['apis_core.apis_entities.models'], inspect.isclass
-    ):
-        if obj.__module__ == 'apis_core.apis_entities.models' and name != "AbstractEntity" and name != "ent_class":
-            ent_list.append(str(name).lower())
     res = {
-        'entities_list': ent_list,
+        'entities_list': registry.get_entity_names(),
         'request': request
     }
     return res
 
 
 def add_relations(request):
-    relations_list = []
-    for name, obj in inspect.getmembers(
-        sys.modules['apis_core.apis_relations.models'], inspect.isclass
-    ):
-        if obj.__module__ == 'apis_core.apis_relations.models' and name not in ["AbstractRelation", "AnnotationRelationLinkManager", "ent_class", "BaseRelationManager", "RelationPublishedQueryset"]:
-            relations_list.append(str(name).lower())
     res = {
-        'relations_list': relations_list,
+        'relations_list': registry.get_relation_names(),
         'request': request
     }
     return res
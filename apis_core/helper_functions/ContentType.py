@@ -1,8 +1,8 @@
-import importlib
-import inspect
 from django.contrib.contenttypes.models import ContentType
 from django.db.models.base import ModelBase
 
+from apis_core.helper_functions import registry
+
 
 class GetContentTypes:
 
@@ -66,7 +66,7 @@ class GetContentTypes:
             lst_conts ([list], optional): [list of entity names]. Defaults to list of apis_core entities.
         """        
         models_exclude = ["texttype_collections", "relationbaseclass", "baserelationmanager", "relationpublishedqueryset"]
-        apis_modules = ['apis_core.apis_metainfo.models', 'apis_core.apis_vocabularies.models', 'apis_core.apis_entities.models', 'apis_core.apis_relations.models']
+        apis_modules = registry.APIS_MODULES
         if lst_conts is not None:
             r2 = []
             for c in lst_conts:
@@ -74,11 +74,9 @@ class GetContentTypes:
                     if c in c2:
                         r2.append(c2)
             apis_modules = r2
-        lst_cont_pre = [importlib.import_module(x) for x in apis_modules]
         lst_cont = []
-        for m in lst_cont_pre:
-            for cls_n in dir(m):
-                if not cls_n.startswith('__') and "__module__" in list(dir(getattr(m, cls_n))):
-                    if getattr(m, cls_n).__module__ in apis_modules and cls_n.lower() not in models_exclude and not "abstract" in cls_n.lower() and inspect.isclass(getattr(m, cls_n)):
-                        lst_cont.append(getattr(m, cls_n))
-        self._lst_cont = lst_cont
\ No newline at end of file
+        for m in apis_modules:
+            for cls in registry.get_module_classes(m):
+                if cls.__name__.lower() not in models_exclude and not "abstract" in cls.__name__.lower():
+                    lst_cont.append(cls)
+        self._lst_cont = lst_cont
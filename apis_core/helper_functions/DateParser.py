@@ -1,11 +1,26 @@
 import math
 import re
 from datetime import datetime, timedelta
+from functools import lru_cache
 
+# maximum number of distinct written dates whose parsing results are kept in memory
+PARSE_DATE_CACHE_SIZE = 2 ** 16
 
+# patterns compiled once at import instead of on every call
+_re_year = re.compile(r"\d{3,4}$")
+_re_month_year = re.compile(r"\d{1,2}\.\d{3,4}$")
+_re_day_month_year = re.compile(r"\d{1,2}\.\d{1,2}\.\d{3,4}$")
+_re_year_month = re.compile(r"\d{3,4}\.\d{1,2}\.?$")
+_re_year_month_day = re.compile(r"\d{3,4}\.\d{1,2}\.\d{1,2}\.?$")
+_re_dot = re.compile(r"\.")
+_re_angle = re.compile(r"(<.*?>)")
+_re_ab_bis = re.compile(r"(ab|bis)")
+
+
+@lru_cache(maxsize=PARSE_DATE_CACHE_SIZE)
 def parse_date( date_string: str ) -> (datetime, datetime, datetime):
     """
-    function to parse a string date field of an entity
+    function to parse a string date field of an entity, the results are memoized per string
 
     :param date_string : str :
         the field value passed by a user
@@ -99,32 +114,32 @@ def parse_date( date_string: str ) -> (datetime, datetime, datetime):
         day = None
 
         # check for all kind of Y-M-D combinations
-        if re.match(r"\d{3,4}$", date):
+        if _re_year.match(date):
             # year
             year = int(date)
 
-        elif re.match(r"\d{1,2}\.\d{3,4}$", date):
+        elif _re_month_year.match(date):
             # month - year
-            tmp = re.split(r"\.", date)
+            tmp = _re_dot.split(date)
             month = int(tmp[0])
             year = int(tmp[1])
 
-        elif re.match(r"\d{1,2}\.\d{1,2}\.\d{3,4}$", date):
+        elif _re_day_month_year.match(date):
             # day - month - year
-            tmp = re.split(r"\.", date)
+            tmp = _re_dot.split(date)
             day = int(tmp[0])
             month = int(tmp[1])
             year = int(tmp[2])
 
-        elif re.match(r"\d{3,4}\.\d{1,2}\.?$", date):
+        elif _re_year_month.match(date):
             # year - month
-            tmp = re.split(r"\.", date)
+            tmp = _re_dot.split(date)
             year = int(tmp[0])
             month = int(tmp[1])
 
-        elif re.match(r"\d{3,4}\.\d{1,2}\.\d{1,2}\.?$", date):
+        elif _re_year_month_day.match(date):
             # year - month - day
-            tmp = re.split(r"\.", date)
+            tmp = _re_dot.split(date)
             year = int(tmp[0])
             month = int(tmp[1])
             day = int(tmp[2])
@@ -197,7 +212,7 @@ def parse_date( date_string: str ) -> (datetime, datetime, datetime):
         date_bis = None
 
         # split for angle brackets, check if explicit iso date is contained within them
-        date_split_angle = re.split(r"(<.*?>)", date_string)
+        date_split_angle = _re_angle.split(date_string)
 
 
         if len(date_split_angle) > 1:
@@ -258,7 +273,7 @@ def parse_date( date_string: str ) -> (datetime, datetime, datetime):
             found_single = False
 
             # split by allowed keywords 'ab' and 'bis' and iterate over them
-            date_split_ab_bis = re.split(r"(ab|bis)", date_string)
+            date_split_ab_bis = _re_ab_bis.split(date_string)
             for i, v in enumerate(date_split_ab_bis):
 
                 if v == "ab":
@@ -325,6 +340,27 @@ def parse_date( date_string: str ) -> (datetime, datetime, datetime):
 
 
 
+def parse_dates(date_strings):
+    """
+    function to parse many string date fields at once, every distinct string is parsed only once
+
+    :param date_strings : iterable of str :
+        the field values passed by users, empty values are allowed
+
+    :return list of tuples (datetime, datetime, datetime) :
+        the results of parse_date in the order of date_strings, (None, None, None) for empty values
+    """
+
+    date_strings = list(date_strings)
+    parsed = {None: (None, None, None), "": (None, None, None)}
+    for date_string in set(date_strings):
+        if date_string not in parsed:
+            parsed[date_string] = parse_date(date_string)
+    return [parsed[date_string] for date_string in date_strings]
+
+
+
+
 def get_date_help_text_from_dates(single_date, single_start_date, single_end_date, single_date_written):
     """
     function for creating string help text from parsed dates, to provide feedback to the user
@@ -367,3 +367,8 @@ def generate_all_fields():
                     # equals to True, then for entity_class_a and entity_class_b, their respective relation class
                     # has been found, thus interrupt the loop going through these relation classes.
                     break
+
+
+    # Now that all ManyToMany fields are wired, define the shortcut methods to related entities once per entity class
+    for entity_class in entity_classes:
+        entity_class.create_relation_methods_from_manytomany_fields()
@@ -10,7 +10,7 @@ import rdflib
 import yaml
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-from django.core.exceptions import FieldError, MultipleObjectsReturned
+from django.core.exceptions import MultipleObjectsReturned
 from django.db.models.fields import CharField as TCharField
 from django.db.models.fields import FloatField as TFloatField
 from django.db.models.fields.related import ForeignKey as TForeignKey
@@ -22,6 +22,7 @@ from apis_core.apis_labels.models import Label
 from apis_core.apis_metainfo.models import Uri as genUri, Collection, Uri
 from apis_core.apis_vocabularies.models import LabelType
 from apis_core.default_settings.RDF_settings_new import sameAs
+from apis_core.helper_functions.merge import merge_entities
 
 APIS_RDF_YAML_SETTINGS = getattr(
         settings,
@@ -312,46 +313,10 @@ class RDFParser(object):
         :param app_label_relations: (string) the label of the Django app that contains the relations
         :return: django object saved to db or False if nothing was saved
         """
-        for rel in ContentType.objects.filter(app_label=app_label_relations, model__icontains=self.kind.lower()):
-            rel_q = {'related_' + self.kind.lower(): m_obj}
-            rel2 = rel.model_class()
-            try:
-                for rel_exst in rel2.objects.filter(**rel_q):
-                    setattr(rel_exst, 'related_'+self.kind.lower()+'_id', self.objct.pk)
-                    rel_exst.save()
-            except FieldError:  # e.g. PlacePlace relations have different related_ fields
-                rel_q = {'related_' + self.kind.lower()+'A': m_obj}
-                for rel_exst in rel2.objects.filter(**rel_q):
-                    setattr(rel_exst, 'related_'+self.kind.lower()+'A_id', self.objct.pk)
-                    rel_exst.save()
-                rel_q = {'related_' + self.kind.lower() + 'B': m_obj}
-                for rel_exst in rel2.objects.filter(**rel_q):
-                    setattr(rel_exst, 'related_'+self.kind.lower()+'B_id', self.objct.pk)
-                    rel_exst.save()
-        for z in genUri.objects.filter(entity=m_obj):
-            z.entity_id = self.objct.pk
-            z.save()
-        for z in Label.objects.filter(temp_entity=m_obj):
-            z.temp_entity_id = self.objct.pk
-            z.save()
-        if hasattr(m_obj, 'first_name'):
-            legacy_name = '{}, {}'.format(m_obj.name, m_obj.first_name)
-        else:
-            legacy_name = m_obj.name
-        lt, created = LabelType.objects.get_or_create(name='legacy name')
-        Label.objects.create(temp_entity_id=self.objct.pk, label=legacy_name, label_type=lt)
-        for col in m_obj.collection.all():
-            self.objct.collection.add(col)
-        if 'apis_highlighter' in settings.INSTALLED_APPS:
-            for ann in m_obj.annotation_set.all():  # Todo: check if this works now with highlighter
-                ann.entity_link = self.objct
-                ann.save()
-        for txt in m_obj.text.all():
-            self.objct.text.add(txt)
         if m_obj.source:
             self.objct.source = m_obj.source
             self.objct.save()
-        m_obj.delete()
+        merge_entities(self.objct, [m_obj], legacy_label_type='legacy name')
         return self.objct
 
 
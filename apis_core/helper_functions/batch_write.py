@@ -0,0 +1,277 @@
+"""
+Batch creation of entities and relations, e.g. for annotation and NER pipelines.
+
+A batch is a list of items like ``{"type": "person", "ref": "p1", "data": {"name": "Doe", "first_name": "Jane"}}`` or
+``{"type": "personplace", "data": {"related_person": {"ref": "p1"}, "related_place": "http://...", "relation_type": 3}}``.
+Foreign keys and ManyToMany fields are given as primary keys, the entities of a relation as primary keys, uris or refs
+of entities created in the same batch. Entities can additionally get a list of "uris" in their data.
+
+Instead of validating and saving item by item, all references of the batch are resolved with one query per kind
+(uris, entities, each vocabulary or other related model), the field values are validated in memory and the rows are
+written with TempEntityClass.bulk_create_instances, one batch per class. Only on PostgreSQL the root rows of the
+entities are batched as well; on MySQL/MariaDB and sqlite each of them is its own INSERT. As with bulk_create_instances
+no save signals are sent and no reversion history is written; the modification stamps of the entities which got new
+relations are bumped once at the end.
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from apis_core.apis_metainfo.models import TempEntityClass, Uri
+from apis_core.helper_functions import registry
+
+
+def _writable_fields(model):
+    """
+    :param model: an entity or relation class
+    :return: tuple of the dict of name -> concrete field and the dict of name -> ManyToMany field which can be set
+    """
+    fields = {f.name: f for f in model._meta.concrete_fields if f.editable and not f.primary_key and not f.auto_created}
+    many_to_many = {f.name: f for f in model._meta.many_to_many if f.editable and not f.name.endswith("_set")}
+    return fields, many_to_many
+
+
+class _Item:
+    def __init__(self, index, raw):
+        self.index = index
+        self.raw = raw
+        self.model = None
+        self.instance = None
+        self.errors = {}
+        self.refs = {}
+        self.many_to_many = {}
+        self.uris = []
+
+    def add_error(self, field, message):
+        self.errors.setdefault(field, []).append(message)
+
+
+def _parse_item(index, raw, entity_fields):
+    """
+    Builds the unsaved instance of an item, the references (to other entities, vocabularies etc.) are only collected.
+
+    :param index: position of the item in the batch
+    :param raw: the item as sent by the client
+    :param entity_fields: dict of relation class -> tuple of the names of its entity fields
+    :return: the _Item
+    """
+    item = _Item(index, raw)
+    if not isinstance(raw, dict) or not isinstance(raw.get("data", {}), dict):
+        item.add_error("non_field_errors", "An item has to be an object with a type and data")
+        return item
+    type_name = str(raw.get("type", "")).lower().replace(" ", "")
+    item.model = registry.get_entity_class(type_name) or registry.get_relation_class(type_name)
+    if item.model is None:
+        item.add_error("type", f"Unknown entity or relation type: {raw.get('type')}")
+        return item
+    fields, many_to_many = _writable_fields(item.model)
+    values = {}
+    for name, value in raw.get("data", {}).items():
+        if name in entity_fields.get(item.model, ()):
+            item.refs[name] = value
+        elif name in many_to_many:
+            if not isinstance(value, list):
+                item.add_error(name, "Expected a list of primary keys")
+            else:
+                item.many_to_many[name] = value
+        elif name in fields and fields[name].is_relation:
+            item.refs[name] = value
+        elif name in fields:
+            values[name] = value
+        elif name == "uris" and item.model not in entity_fields:
+            item.uris = value if isinstance(value, list) else [value]
+        else:
+            item.add_error(name, "Unknown field")
+    item.instance = item.model(**values)
+    try:
+        # only the given values are validated, the references are checked in bulk
+        item.instance.clean_fields(exclude=[f.name for f in item.model._meta.fields if f.name not in values])
+    except ValidationError as e:
+        for name, messages in e.message_dict.items():
+            for message in messages:
+                item.add_error(name, message)
+    for name in entity_fields.get(item.model, ()):
+        if name not in item.refs:
+            item.add_error(name, "This field is required")
+    if item.model in entity_fields and "relation_type" not in item.refs:
+        item.add_error("relation_type", "This field is required")
+    return item
+
+
+def _is_pk(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_ref(value):
+    return isinstance(value, str) or _is_pk(value)
+
+
+def write_batch(raw_items, user=None, atomic=True, batch_size=1000):
+    """
+    Validates and creates the entities and relations of a batch, see the module docstring.
+
+    :param raw_items: list of items
+    :param user: optional user, items of classes the user may not add are invalid
+    :param atomic: if True nothing is written as soon as one item is invalid, else the valid items are written
+    :param batch_size: maximum number of rows per insert
+    :return: tuple of the list of per item results ({"index", "status", and "id" or "errors"}) and whether anything
+        was written
+    """
+    entity_fields = {
+        relation_class: (
+            relation_class.get_related_entity_field_nameA(),
+            relation_class.get_related_entity_field_nameB(),
+        )
+        for relation_class in registry.get_relation_classes()
+    }
+    items = [_parse_item(index, raw, entity_fields) for index, raw in enumerate(raw_items)]
+    if user is not None:
+        for item in items:
+            if item.model is not None and not user.has_perm(
+                f"{item.model._meta.app_label}.add_{item.model._meta.model_name}"
+            ):
+                item.add_error("type", f"You may not add {item.model.__name__} objects")
+    refs = {}
+    for item in items:
+        ref = item.raw.get("ref") if isinstance(item.raw, dict) else None
+        if ref is not None and item.model is not None:
+            if item.model in entity_fields:
+                item.add_error("ref", "Only entities can be referenced")
+            elif not _is_ref(ref):
+                item.add_error("ref", "A ref has to be a string or an integer")
+            elif ref in refs:
+                item.add_error("ref", f"Duplicate ref: {ref}")
+            else:
+                refs[ref] = item
+
+    # one query for all uris, the new ones have to be unique and the referenced ones resolve to entities
+    uris = {value for item in items for value in item.refs.values() if isinstance(value, str)}
+    uris.update(str(uri) for item in items for uri in item.uris)
+    uri_entities = dict(Uri.objects.filter(uri__in=uris).values_list("uri", "entity_id")) if uris else {}
+    # one query for the classes of all referenced entities
+    entity_pks = {
+        value
+        for item in items
+        for name, value in item.refs.items()
+        if name in entity_fields.get(item.model, ()) and _is_pk(value)
+    }
+    entity_pks.update(pk for pk in uri_entities.values() if pk is not None)
+    contenttypes = (
+        dict(TempEntityClass.objects.filter(pk__in=entity_pks).values_list("pk", "self_contenttype_id"))
+        if entity_pks
+        else {}
+    )
+    # one query per other related model (vocabularies, collections, sources ...)
+    related_pks = {}
+    for item in items:
+        if item.model is None:
+            continue
+        fields, many_to_many = _writable_fields(item.model)
+        for name, value in item.refs.items():
+            if name not in entity_fields.get(item.model, ()):
+                related_pks.setdefault(fields[name].related_model, set()).update([value] if _is_pk(value) else [])
+        for name, values in item.many_to_many.items():
+            related_pks.setdefault(many_to_many[name].related_model, set()).update(x for x in values if _is_pk(x))
+    existing = {}
+    for model, pks in related_pks.items():
+        existing[model] = set(model.objects.filter(pk__in=pks).values_list("pk", flat=True)) if pks else set()
+
+    new_uris = set()
+    # the entities first, so that the relations know whether the entities they refer to are valid
+    for item in sorted(items, key=lambda x: x.model in entity_fields):
+        if item.model is None:
+            continue
+        fields, many_to_many = _writable_fields(item.model)
+        for name, value in item.refs.items():
+            field = fields[name]
+            if name in entity_fields.get(item.model, ()):
+                target_model = field.related_model
+                if isinstance(value, dict) and "ref" in value:
+                    target = refs.get(value["ref"]) if _is_ref(value["ref"]) else None
+                    if target is None or target.model != target_model:
+                        item.add_error(name, f"No {target_model.__name__} with ref {value['ref']} in the batch")
+                    elif len(target.errors) > 0:
+                        item.add_error(name, f"The item with ref {value['ref']} is invalid")
+                    else:
+                        item.refs[name] = target
+                    continue
+                pk = uri_entities.get(value) if isinstance(value, str) else value if _is_pk(value) else None
+                if pk is None or contenttypes.get(pk) != ContentType.objects.get_for_model(target_model).pk:
+                    item.add_error(name, f"No {target_model.__name__} found for {value}")
+                else:
+                    setattr(item.instance, field.attname, pk)
+            elif value is None:
+                if not field.null:
+                    item.add_error(name, "This field may not be null")
+            elif not _is_pk(value) or value not in existing[field.related_model]:
+                item.add_error(name, f"No {field.related_model.__name__} with primary key {value}")
+            else:
+                setattr(item.instance, field.attname, value)
+        for name, values in item.many_to_many.items():
+            missing = [pk for pk in values if not _is_pk(pk) or pk not in existing[many_to_many[name].related_model]]
+            if len(missing) > 0:
+                item.add_error(name, f"No {many_to_many[name].related_model.__name__} with primary keys {missing}")
+        for uri in item.uris:
+            if str(uri) in uri_entities or str(uri) in new_uris:
+                item.add_error("uris", f"The uri {uri} exists already")
+            new_uris.add(str(uri))
+
+    invalid = [item for item in items if len(item.errors) > 0]
+    valid = [item for item in items if len(item.errors) == 0]
+    if atomic and len(invalid) > 0:
+        valid = []
+    if len(valid) > 0:
+        with transaction.atomic():
+            # the entities first, so that the relations can refer to the new ones
+            for relations in [False, True]:
+                by_model = {}
+                for item in valid:
+                    if (item.model in entity_fields) == relations:
+                        by_model.setdefault(item.model, []).append(item)
+                for model, model_items in by_model.items():
+                    if relations:
+                        for item in model_items:
+                            for name, value in item.refs.items():
+                                if isinstance(value, _Item):
+                                    setattr(item.instance, model._meta.get_field(name).attname, value.instance.pk)
+                    model.bulk_create_instances([item.instance for item in model_items], batch_size=batch_size)
+            through_rows = {}
+            for item in valid:
+                for name, values in item.many_to_many.items():
+                    field = item.model._meta.get_field(name)
+                    through = field.remote_field.through
+                    through_rows.setdefault(through, []).extend(
+                        through(
+                            **{
+                                f"{field.m2m_field_name()}_id": item.instance.pk,
+                                f"{field.m2m_reverse_field_name()}_id": pk,
+                            }
+                        )
+                        for pk in dict.fromkeys(values)
+                    )
+            for through, rows in through_rows.items():
+                through.objects.bulk_create(rows, batch_size=batch_size)
+            Uri.objects.bulk_create(
+                [Uri(uri=str(uri), entity_id=item.instance.pk) for item in valid for uri in dict.fromkeys(item.uris)],
+                batch_size=batch_size,
+            )
+            TempEntityClass.touch(
+                {
+                    getattr(item.instance, item.model._meta.get_field(name).attname)
+                    for item in valid
+                    if item.model in entity_fields
+                    for name in entity_fields[item.model]
+                }
+            )
+
+    results = []
+    written = {item.index for item in valid}
+    for item in items:
+        if item.index in written:
+            results.append({"index": item.index, "status": "created", "id": item.instance.pk})
+        elif len(item.errors) > 0:
+            results.append({"index": item.index, "status": "invalid", "errors": item.errors})
+        else:
+            results.append({"index": item.index, "status": "not written"})
+    return results, len(valid) > 0
@@ -0,0 +1,58 @@
+"""
+Bulk insert of multi-table inherited models.
+
+Django's bulk_create refuses models with concrete parents, since the primary keys of the parent rows are needed for
+the child rows. bulk_insert_multi_table inserts the rows of every model in the inheritance chain in batches instead,
+except for the root rows on databases which do not return the keys of a bulk insert (see bulk_insert_multi_table).
+"""
+
+from django.db import connections, router, transaction
+
+
+def bulk_insert_multi_table(model, instances, batch_size=1000):
+    """
+    Inserts new instances of a multi-table inherited model, without calling save() or sending signals.
+
+    With Django 3.1 only PostgreSQL returns the primary keys of a bulk insert. On all other databases, including
+    MySQL/MariaDB and sqlite, the rows of the root model (TempEntityClass) are inserted one by one, only the rows of the
+    other models are batched.
+
+    :param model: the concrete model class of the instances
+    :param instances: list of unsaved instances of model
+    :param batch_size: maximum number of rows per insert
+    :return: the instances, with their primary keys set
+    """
+    if len(instances) == 0:
+        return instances
+    db = router.db_for_write(model)
+    connection = connections[db]
+    models_chain = list(reversed(model._meta.get_parent_list())) + [model]
+    root = models_chain[0]
+    root_fields = [f for f in root._meta.local_concrete_fields if f is not root._meta.pk]
+    with transaction.atomic(using=db, savepoint=False):
+        size = min(batch_size, max(connection.ops.bulk_batch_size(root_fields, instances), 1))
+        for i in range(0, len(instances), size):
+            batch = instances[i : i + size]
+            if connection.features.can_return_rows_from_bulk_insert:
+                rows = root._base_manager._insert(batch, fields=root_fields, returning_fields=[root._meta.pk], using=db)
+            else:
+                rows = []
+                for obj in batch:
+                    rows.extend(
+                        root._base_manager._insert(
+                            [obj], fields=root_fields, returning_fields=[root._meta.pk], using=db
+                        )
+                    )
+            for obj, row in zip(batch, rows):
+                setattr(obj, root._meta.pk.attname, row[0])
+        for parent_model in models_chain[1:]:
+            for obj in instances:
+                setattr(obj, parent_model._meta.pk.attname, getattr(obj, root._meta.pk.attname))
+            fields = parent_model._meta.local_concrete_fields
+            size = min(batch_size, max(connection.ops.bulk_batch_size(fields, instances), 1))
+            for i in range(0, len(instances), size):
+                parent_model._base_manager._insert(instances[i : i + size], fields=fields, using=db)
+    for obj in instances:
+        obj._state.adding = False
+        obj._state.db = db
+    return instances
@@ -0,0 +1,98 @@
+"""
+Maintenance of closure tables for the parent_class hierarchies of vocabularies and collections.
+
+A closure table holds one (ancestor, descendant, depth) row for every node and each of its ancestors, including the
+node itself with depth 0. "X and all of its descendants" then is a single indexed join, e.g.
+``ProfessionType.objects.filter(ancestor_closures__ancestor_id=x)``.
+
+The rows are kept up to date from the save() methods of the hierarchical models; deleted nodes lose their rows through
+the cascading foreign keys. Code that creates nodes without save() (e.g. bulk_create) has to call add_closure_nodes,
+code that moves nodes without save() rebuild_closure afterwards.
+"""
+
+from django.db import transaction
+
+
+def update_closure(closure_model, node_pk, parent_pk):
+    """
+    Brings the closure rows of a saved node in line with its parent. A node whose parent did not change costs one
+    query.
+
+    :param closure_model: the closure model, with ancestor, descendant and depth fields
+    :param node_pk: pk of the saved node
+    :param parent_pk: pk of the parent of the node or None
+    """
+    rows = dict(
+        closure_model.objects.filter(descendant_id=node_pk, depth__lte=1).values_list("depth", "ancestor_id")
+    )
+    if 0 in rows and rows.get(1) == parent_pk:
+        return
+    with transaction.atomic(savepoint=False):
+        if 0 not in rows:
+            # new node, it has no descendants yet
+            subtree = [(node_pk, 0)]
+            closure_model.objects.create(ancestor_id=node_pk, descendant_id=node_pk, depth=0)
+        else:
+            # moved node, the rows between the subtree and its old ancestors are dropped
+            subtree = list(closure_model.objects.filter(ancestor_id=node_pk).values_list("descendant_id", "depth"))
+            subtree_pks = [pk for pk, depth in subtree]
+            if parent_pk in subtree_pks:
+                raise ValueError("A node can not be moved below itself or one of its descendants")
+            closure_model.objects.filter(descendant_id__in=subtree_pks).exclude(ancestor_id__in=subtree_pks).delete()
+        if parent_pk is not None:
+            ancestors = closure_model.objects.filter(descendant_id=parent_pk).values_list("ancestor_id", "depth")
+            closure_model.objects.bulk_create(
+                [
+                    closure_model(ancestor_id=ancestor_pk, descendant_id=pk, depth=ancestor_depth + 1 + depth)
+                    for ancestor_pk, ancestor_depth in ancestors
+                    for pk, depth in subtree
+                ],
+                batch_size=1000,
+            )
+
+
+def add_closure_nodes(closure_model, nodes, batch_size=1000):
+    """
+    Inserts the closure rows of many new leaf nodes, e.g. after a bulk import, with batched reads and inserts.
+
+    :param closure_model: the closure model, with ancestor, descendant and depth fields
+    :param nodes: list of (pk, parent pk) tuples of nodes without closure rows, parents before their children
+    :param batch_size: maximum number of rows per insert
+    """
+    new_pks = {pk for pk, parent_pk in nodes}
+    parent_pks = list({parent_pk for pk, parent_pk in nodes if parent_pk not in new_pks and parent_pk is not None})
+    ancestors = {}
+    for i in range(0, len(parent_pks), 500):
+        for ancestor_pk, descendant_pk, depth in closure_model.objects.filter(
+            descendant_id__in=parent_pks[i : i + 500]
+        ).values_list("ancestor_id", "descendant_id", "depth"):
+            ancestors.setdefault(descendant_pk, []).append((ancestor_pk, depth))
+    rows = []
+    for pk, parent_pk in nodes:
+        node_ancestors = [(pk, 0)] + [(a, depth + 1) for a, depth in ancestors.get(parent_pk, [])]
+        ancestors[pk] = node_ancestors
+        rows.extend(closure_model(ancestor_id=a, descendant_id=pk, depth=depth) for a, depth in node_ancestors)
+    closure_model.objects.bulk_create(rows, batch_size=batch_size)
+
+
+def rebuild_closure(closure_model, node_model):
+    """
+    Recreates all rows of a closure table from the parent_class fields of the nodes, with one read and batched inserts.
+
+    :param closure_model: the closure model, with ancestor, descendant and depth fields
+    :param node_model: the model holding the parent_class hierarchy
+    """
+    parents = dict(node_model.objects.values_list("pk", "parent_class_id"))
+    rows = []
+    for pk in parents:
+        ancestor_pk = pk
+        depth = 0
+        seen = set()
+        while ancestor_pk is not None and ancestor_pk not in seen:
+            seen.add(ancestor_pk)
+            rows.append(closure_model(ancestor_id=ancestor_pk, descendant_id=pk, depth=depth))
+            ancestor_pk = parents.get(ancestor_pk)
+            depth += 1
+    with transaction.atomic():
+        closure_model.objects.all().delete()
+        closure_model.objects.bulk_create(rows, batch_size=1000)
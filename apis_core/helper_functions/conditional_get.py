@@ -0,0 +1,133 @@
+"""
+Conditional GET for the detail endpoints of the API.
+
+Entities, relations and vocabularies carry a modification stamp (the field modified), which is bumped on save and,
+for entities and relations, also whenever something else shown in their serialization changes: their relations,
+labels, uris, texts, collections and vocabularies, and the related entities (see TempEntityClass.touch and the
+receivers in apis_metainfo.models). The ETag and Last-Modified headers are derived from it, so a request with a
+matching If-None-Match (or a not older If-Modified-Since) is answered with a 304 after a single query for the stamp,
+without loading and serializing the object. MAX_AGE from the settings is sent as max-age of the Cache-Control header.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def has_modification_stamp(model):
+    """
+    :param model: a model class
+    :return: True if model has the modified field
+    """
+    try:
+        model._meta.get_field("modified")
+    except FieldDoesNotExist:
+        return False
+    return True
+
+
+def get_modification_stamp(queryset, **lookup):
+    """
+    :param queryset: queryset of a model with a modification stamp
+    :param lookup: lookup selecting the object, e.g. pk=1
+    :return: the modification stamp of the object or None if it does not exist (or has no stamp)
+    """
+    stamp = queryset.prefetch_related(None).filter(**lookup).values_list("modified", flat=True)[:1]
+    stamp = list(stamp)
+    return stamp[0] if len(stamp) > 0 else None
+
+
+def get_etag(request, model, pk, modified, renderer_format=None):
+    """
+    The ETag depends on everything that changes the representation: the object and its stamp, the full path with the
+    query parameters (e.g. fields=), the format and whether the user is authenticated (which changes what is visible).
+
+    :param request: the request
+    :param model: the model class
+    :param pk: primary key of the object
+    :param modified: modification stamp of the object
+    :param renderer_format: format of the accepted renderer
+    :return: the quoted ETag
+    """
+    user = getattr(request, "user", None)
+    key = "|".join(
+        [
+            model._meta.label_lower,
+            str(pk),
+            modified.isoformat(),
+            request.get_full_path(),
+            str(renderer_format),
+            str(user is not None and user.is_authenticated),
+        ]
+    )
+    return quote_etag(hashlib.md5(key.encode("utf-8")).hexdigest())
+
+
+def set_validators(request, response, etag, modified):
+    """
+    Sets the ETag, Last-Modified and Cache-Control headers of response.
+
+    :param request: the request
+    :param response: the response
+    :param etag: the quoted ETag
+    :param modified: modification stamp of the object
+    :return: the response
+    """
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(modified.timestamp())
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        patch_cache_control(response, private=True, max_age=getattr(settings, "MAX_AGE", 0))
+    else:
+        patch_cache_control(response, max_age=getattr(settings, "MAX_AGE", 0))
+    patch_vary_headers(response, ["Accept", "Cookie"])
+    return response
+
+
+def conditional_get(request, model, pk, modified, render, renderer_format=None):
+    """
+    Answers request with a 304 (or 412) if the validators of the request match, else with render().
+
+    :param request: the request
+    :param model: the model class
+    :param pk: primary key of the object
+    :param modified: modification stamp of the object
+    :param render: callable returning the full response
+    :param renderer_format: format of the accepted renderer
+    :return: the response
+    """
+    etag = get_etag(request, model, pk, modified, renderer_format=renderer_format)
+    response = get_conditional_response(request, etag=etag, last_modified=int(modified.timestamp()))
+    if response is None:
+        response = render()
+        if response.status_code != 200:
+            return response
+    return set_validators(request, response, etag, modified)
+
+
+class ConditionalGetMixin:
+    """
+    Adds conditional GET to the retrieve action of a viewset whose model has a modification stamp.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        if not has_modification_stamp(self.get_queryset().model):
+            return super().retrieve(request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        lookup_value = self.kwargs[lookup_url_kwarg]
+        modified = get_modification_stamp(
+            self.filter_queryset(self.get_queryset()), **{self.lookup_field: lookup_value}
+        )
+        if modified is None:
+            return super().retrieve(request, *args, **kwargs)
+        return conditional_get(
+            request,
+            self.get_queryset().model,
+            lookup_value,
+            modified,
+            lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs),
+            renderer_format=getattr(getattr(request, "accepted_renderer", None), "format", None),
+        )
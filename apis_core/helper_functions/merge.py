@@ -0,0 +1,131 @@
+"""
+Set based merge engine for duplicate entities.
+
+Merging moves everything that points to the duplicates (uris, labels, collections, texts, vocabularies and the
+relations of every relation class) over to the entity that is kept and deletes the duplicates afterwards. Instead of
+saving every moved row on its own, every kind of row is moved with one queryset ``update()`` or one bulk insert, so that
+the number of queries per merge does not depend on how many relations the duplicates have.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from apis_core.apis_labels.models import Label
+from apis_core.apis_metainfo.models import Uri
+from apis_core.apis_relations.models import AbstractRelation
+from apis_core.apis_vocabularies.models import LabelType
+
+DEFAULT_LEGACY_LABEL_TYPE = "Legacy name (merge)"
+
+
+def _merge_many_to_many(keep, duplicate_pks):
+    """
+    Adds the ManyToMany targets of the duplicates to the kept entity, one select and one related manager ``add()`` per
+    field. ``add()`` inserts only the missing rows in bulk and fires ``m2m_changed`` once per field, so that e.g. the
+    collection permissions stay in sync.
+
+    The ManyToMany fields that are generated through the relation classes (ending with '_set') are moved via the
+    relations themselves.
+    """
+    for field in keep._meta.many_to_many:
+        if field.name.endswith("_set"):
+            continue
+        through = field.remote_field.through
+        source_field_name = field.m2m_field_name()
+        target_field_name = field.m2m_reverse_field_name()
+        target_pks = set(
+            through.objects.filter(**{f"{source_field_name}_id__in": duplicate_pks}).values_list(
+                f"{target_field_name}_id", flat=True
+            )
+        )
+        if len(target_pks) > 0:
+            getattr(keep, field.name).add(*target_pks)
+
+
+def _merge_relations(keep, duplicate_pks):
+    """
+    Repoints the relations of every relation class that involves the entity class of the kept entity, with one
+    ``update()`` per side of each relation class.
+
+    :return: set of the pks of the entities on the other side of the repointed relations, their serialization changes
+        as well
+    """
+    entity_class = type(keep)
+    other_pks = set()
+    for relation_class in AbstractRelation.get_relation_classes_of_entity_class(entity_class):
+        field_name_a = relation_class.get_related_entity_field_nameA()
+        field_name_b = relation_class.get_related_entity_field_nameB()
+        field_names = {}
+        if relation_class.get_related_entity_classA() == entity_class:
+            field_names[field_name_a] = field_name_b
+        if relation_class.get_related_entity_classB() == entity_class:
+            field_names[field_name_b] = field_name_a
+        for field_name, other_field_name in field_names.items():
+            relations = relation_class.objects.filter(**{f"{field_name}_id__in": duplicate_pks})
+            other_pks.update(relations.values_list(f"{other_field_name}_id", flat=True))
+            relations.update(**{f"{field_name}_id": keep.pk}, modified=timezone.now())
+    return other_pks
+
+
+def _merge_cluster(keep, duplicates, label_type):
+    duplicate_pks = [duplicate.pk for duplicate in duplicates]
+
+    _merge_many_to_many(keep, duplicate_pks)
+    Uri.objects.filter(entity_id__in=duplicate_pks).update(entity_id=keep.pk)
+    Label.objects.filter(temp_entity_id__in=duplicate_pks).update(temp_entity_id=keep.pk)
+    Label.objects.bulk_create(
+        [Label(label=str(duplicate), label_type=label_type, temp_entity_id=keep.pk) for duplicate in duplicates]
+    )
+    other_pks = _merge_relations(keep, duplicate_pks)
+    if "apis_highlighter" in settings.INSTALLED_APPS:
+        for duplicate in duplicates:
+            for ann in duplicate.annotation_set.all():  # Todo: check if this works now with highlighter
+                ann.entity_link = keep
+                ann.save()
+    type(keep).objects.filter(pk__in=duplicate_pks).delete()
+    type(keep).touch({keep.pk} | (other_pks - set(duplicate_pks)))
+
+
+def merge_entity_clusters(clusters, legacy_label_type=DEFAULT_LEGACY_LABEL_TYPE):
+    """
+    Merges many clusters of duplicates in one transaction.
+
+    :param clusters: iterable of (keep, duplicates) tuples. keep is the entity instance to merge into, duplicates is an
+        iterable of entity instances or primary keys of the same entity class. Duplicates of a different class than
+        keep are skipped.
+    :param legacy_label_type: name of the LabelType used for the labels which preserve the names of the duplicates
+    :return: list of the kept entities
+    """
+    res = []
+    with transaction.atomic():
+        label_type, created = LabelType.objects.get_or_create(name=legacy_label_type)
+        for keep, duplicates in clusters:
+            entity_class = type(keep)
+            pks = []
+            instances = []
+            for duplicate in duplicates:
+                if isinstance(duplicate, int):
+                    pks.append(duplicate)
+                elif type(duplicate) == entity_class:
+                    instances.append(duplicate)
+            if len(pks) > 0:
+                instances.extend(entity_class.objects.filter(pk__in=pks))
+            if keep.pk in [instance.pk for instance in instances]:
+                raise ValueError("You can not merge an entity with itself")
+            if len(instances) > 0:
+                _merge_cluster(keep, instances, label_type)
+            res.append(keep)
+    return res
+
+
+def merge_entities(keep, duplicates, legacy_label_type=DEFAULT_LEGACY_LABEL_TYPE):
+    """
+    Merges the duplicates into keep, see merge_entity_clusters.
+
+    :param keep: the entity instance to merge into
+    :param duplicates: iterable of entity instances or primary keys
+    :param legacy_label_type: name of the LabelType used for the labels which preserve the names of the duplicates
+    :return: the kept entity
+    """
+    return merge_entity_clusters([(keep, duplicates)], legacy_label_type=legacy_label_type)[0]
@@ -0,0 +1,163 @@
+"""
+Process-wide registry of the APIS model classes.
+
+The entity, relation and relationtype classes are collected once (either when the field generator wires the models
+together at import time or at the latest in ``EntitiesConfig.ready``) and are afterwards looked up by their lower case
+class name in constant time. Before this registry existed every lookup reflected over the model modules with
+``inspect.getmembers``.
+"""
+
+import importlib
+import inspect
+
+ENTITIES_MODULE = "apis_core.apis_entities.models"
+RELATIONS_MODULE = "apis_core.apis_relations.models"
+VOCABULARIES_MODULE = "apis_core.apis_vocabularies.models"
+METAINFO_MODULE = "apis_core.apis_metainfo.models"
+
+APIS_MODULES = [METAINFO_MODULE, VOCABULARIES_MODULE, ENTITIES_MODULE, RELATIONS_MODULE]
+
+_entity_classes = {}
+_relation_classes = {}
+_relationtype_classes = {}
+_module_classes = {}
+_built = False
+
+# counts how often the model modules were reflected upon, used to verify that lookups don't trigger scans
+scan_count = 0
+
+
+def _scan_module(module_name):
+    """
+    :param module_name: dotted path of one of the APIS model modules
+    :return: list of the classes defined within that module, sorted by their name
+    """
+    global scan_count
+    scan_count += 1
+
+    classes = []
+    for name, cls in inspect.getmembers(importlib.import_module(module_name), inspect.isclass):
+        if cls.__module__ == module_name and cls not in classes:
+            classes.append(cls)
+    return classes
+
+
+def _concrete_subclasses(module_name, base_class):
+    return {
+        cls.__name__.lower(): cls
+        for cls in _scan_module(module_name)
+        if issubclass(cls, base_class) and not cls._meta.abstract
+    }
+
+
+def build_registry(force=False):
+    """
+    Collects the entity, relation and relationtype classes into the registry dictionaries.
+
+    :param force: rebuild the registry even if it was already built (used in ``AppConfig.ready`` so that classes added
+        after the first build, e.g. by ``APIS_ADDITIONAL_ENTITIES``, are picked up)
+    :return: None
+    """
+    global _built
+
+    if _built and not force:
+        return
+
+    # local imports: the model modules import this registry
+    from apis_core.apis_entities.models import AbstractEntity
+    from apis_core.apis_relations.models import AbstractRelation
+    from apis_core.apis_vocabularies.models import AbstractRelationType
+
+    _entity_classes.clear()
+    _entity_classes.update(_concrete_subclasses(ENTITIES_MODULE, AbstractEntity))
+    _relation_classes.clear()
+    _relation_classes.update(_concrete_subclasses(RELATIONS_MODULE, AbstractRelation))
+    _relationtype_classes.clear()
+    _relationtype_classes.update(_concrete_subclasses(VOCABULARIES_MODULE, AbstractRelationType))
+    _module_classes.clear()
+    _built = True
+
+
+def get_entity_classes():
+    """
+    :return: list of all entity classes, sorted by their name
+    """
+    build_registry()
+    return list(_entity_classes.values())
+
+
+def get_entity_names():
+    """
+    :return: list of all entity class names in lower case, sorted
+    """
+    build_registry()
+    return list(_entity_classes.keys())
+
+
+def get_entity_class(name):
+    """
+    :param name: str : the (case insensitive) name of an entity class
+    :return: the entity class or None if there is none of the given name
+    """
+    build_registry()
+    return _entity_classes.get(name.lower())
+
+
+def get_relation_classes():
+    """
+    :return: list of all relation classes, sorted by their name
+    """
+    build_registry()
+    return list(_relation_classes.values())
+
+
+def get_relation_names():
+    """
+    :return: list of all relation class names in lower case, sorted
+    """
+    build_registry()
+    return list(_relation_classes.keys())
+
+
+def get_relation_class(name):
+    """
+    :param name: str : the (case insensitive) name of a relation class
+    :return: the relation class or None if there is none of the given name
+    """
+    build_registry()
+    return _relation_classes.get(name.lower())
+
+
+def get_relationtype_classes():
+    """
+    :return: list of all relationtype classes, sorted by their name
+    """
+    build_registry()
+    return list(_relationtype_classes.values())
+
+
+def get_relationtype_names():
+    """
+    :return: list of all relationtype class names in lower case, sorted
+    """
+    build_registry()
+    return list(_relationtype_classes.keys())
+
+
+def get_relationtype_class(name):
+    """
+    :param name: str : the (case insensitive) name of a relationtype class
+    :return: the relationtype class or None if there is none of the given name
+    """
+    build_registry()
+    return _relationtype_classes.get(name.lower())
+
+
+def get_module_classes(module_name):
+    """
+    :param module_name: dotted path of one of the APIS model modules
+    :return: list of the classes defined within that module; the module is only reflected upon on the first call
+    """
+    if module_name not in _module_classes:
+        _module_classes[module_name] = _scan_module(module_name)
+    return _module_classes[module_name]
@@ -0,0 +1,166 @@
+"""
+Cache of the rendered representations of entities (JSON, TEI, CIDOC, ProsopogrAPhI ...) served by GetEntityGeneric.
+
+Every cache entry records the dependencies it was rendered from (the entity itself, the entities it shows as targets
+of its relations and the vocabularies) together with the version each of them had. A dependency version is a random
+token stored in the cache as well; invalidating a dependency deletes its token, so exactly the entries rendered from it
+become stale, without having to know or scan them. A hit costs one get and one get_many on the cache, which works with
+every Django cache backend, including the local-memory and the file-based one.
+
+The cache is off unless APIS_RENDER_CACHE names an alias of CACHES. The local-memory backend is only shared within a
+process, so with several worker processes a shared backend (e.g. the file-based one) has to be used. The entries are
+kept APIS_RENDER_CACHE_TIMEOUT seconds (default one hour).
+
+The dependencies are invalidated by the save and delete signals of entities, relations, labels, uris, texts and
+vocabularies (see TempEntityClass.touch and the receivers in apis_metainfo.models and apis_vocabularies.models).
+"""
+
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+VOCABS_DEP = "vocabs"
+
+
+def get_cache():
+    """
+    :return: the cache of the rendered representations or None if the cache is off
+    """
+    alias = getattr(settings, "APIS_RENDER_CACHE", None)
+    if alias is None:
+        return None
+    return caches[alias]
+
+
+def entity_dep(pk):
+    """
+    :param pk: pk of an entity
+    :return: the dependency name of the entity
+    """
+    return f"entity:{pk}"
+
+
+def _dep_key(dep):
+    return f"apis_render:dep:{dep}"
+
+
+def get_render_key(request, pk, modified, renderer_format):
+    """
+    :param request: the request
+    :param pk: pk of the entity
+    :param modified: modification stamp of the entity
+    :param renderer_format: format of the accepted renderer
+    :return: the cache key of the representation or None if the cache is off
+    """
+    if get_cache() is None:
+        return None
+    user = getattr(request, "user", None)
+    key = "|".join(
+        [
+            str(pk),
+            modified.isoformat() if modified is not None else "",
+            str(renderer_format),
+            request.get_host(),
+            request.get_full_path(),
+            str(user is not None and user.is_authenticated),
+        ]
+    )
+    return "apis_render:entry:" + hashlib.md5(key.encode("utf-8")).hexdigest()
+
+
+def get_versions(deps):
+    """
+    Returns the current versions of deps, creating the missing ones. The versions of the entity have to be taken
+    before it is loaded for rendering, so that an invalidation during the rendering is not lost.
+
+    :param deps: iterable of dependency names
+    :return: dict of dependency name -> version
+    """
+    cache = get_cache()
+    deps = list(set(deps))
+    if cache is None or len(deps) == 0:
+        return {}
+    current = cache.get_many([_dep_key(dep) for dep in deps])
+    res = {}
+    for dep in deps:
+        version = current.get(_dep_key(dep))
+        if version is None:
+            version = uuid.uuid4().hex
+            if not cache.add(_dep_key(dep), version, timeout=None):
+                version = cache.get(_dep_key(dep), version)
+        res[dep] = version
+    return res
+
+
+def get_rendered(key):
+    """
+    :param key: cache key as returned by get_render_key
+    :return: tuple of the rendered content and its content type, or None if there is no valid entry
+    """
+    cache = get_cache()
+    if cache is None or key is None:
+        return None
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    versions = entry["versions"]
+    current = cache.get_many([_dep_key(dep) for dep in versions])
+    for dep, version in versions.items():
+        if current.get(_dep_key(dep)) != version:
+            return None
+    return entry["content"], entry["content_type"]
+
+
+def set_rendered(key, versions, content, content_type):
+    """
+    :param key: cache key as returned by get_render_key
+    :param versions: dict of dependency name -> version the content was rendered from, see get_versions
+    :param content: the rendered content
+    :param content_type: its content type
+    """
+    cache = get_cache()
+    if cache is None or key is None:
+        return
+    cache.set(
+        key,
+        {"versions": versions, "content": content, "content_type": content_type},
+        timeout=getattr(settings, "APIS_RENDER_CACHE_TIMEOUT", 3600),
+    )
+
+
+def get_entity_deps(pk, data):
+    """
+    :param pk: pk of the entity
+    :param data: the serialized entity, as returned by EntitySerializer
+    :return: list of the dependencies of the representation: the entity, the targets of its relations and the
+        vocabularies
+    """
+    deps = [entity_dep(pk), VOCABS_DEP]
+    for relations in (data.get("relations") or {}).values():
+        for rel in relations:
+            target = rel.get("target") or {}
+            if target.get("id") is not None:
+                deps.append(entity_dep(target["id"]))
+    return deps
+
+
+def invalidate(deps):
+    """
+    Makes all entries which were rendered from one of deps stale.
+
+    :param deps: iterable of dependency names
+    """
+    cache = get_cache()
+    deps = list(deps)
+    if cache is None or len(deps) == 0:
+        return
+    cache.delete_many([_dep_key(dep) for dep in deps])
+
+
+def invalidate_entities(pks):
+    """
+    :param pks: iterable of entity pks, None values are ignored
+    """
+    invalidate([entity_dep(pk) for pk in pks if pk is not None])
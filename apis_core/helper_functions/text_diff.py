@@ -0,0 +1,221 @@
+"""
+Maps character offsets of an old version of a text onto a new version.
+
+Used to re-anchor the highlighter annotations when a text is edited. Both versions are split into word tokens once, the
+token sequences are diffed in one pass and all offsets are then mapped through the resulting matching blocks with a
+binary search, instead of searching and weighting the context of every annotation in the whole new text.
+"""
+
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from difflib import SequenceMatcher
+
+_token_re = re.compile(r"\s+|\w+|[^\w\s]")
+
+# the Myers diff of ranges without unique tokens gives up after this many inserted or deleted tokens
+MAX_EDITS = 1000
+# ranges of at most this many token pairs are then matched with difflib
+MAX_DIFFLIB_PAIRS = 1000000
+
+
+def _tokenize(text):
+    """
+    :param text: the text to split
+    :return: tuple of the tokens and of their start offsets, the tokens cover the whole text
+    """
+    tokens = []
+    starts = []
+    for m in _token_re.finditer(text):
+        tokens.append(m.group())
+        starts.append(m.start())
+    return tokens, starts
+
+
+def _longest_increasing_subsequence(pairs):
+    """
+    :param pairs: list of (index old, index new) tuples sorted by index old
+    :return: the longest sublist in which index new is increasing as well
+    """
+    tails = []
+    tail_pairs = []
+    previous = []
+    for n, (a, b) in enumerate(pairs):
+        i = bisect_left(tails, b)
+        previous.append(tail_pairs[i - 1] if i > 0 else None)
+        if i == len(tails):
+            tails.append(b)
+            tail_pairs.append(n)
+        else:
+            tails[i] = b
+            tail_pairs[i] = n
+    res = []
+    n = tail_pairs[-1] if tail_pairs else None
+    while n is not None:
+        res.append(pairs[n])
+        n = previous[n]
+    return res[::-1]
+
+
+def _myers_matches(a, b, max_edits):
+    """
+    Myers' O(ND) diff: the running time grows with the number of edits, not with the number of repetitions of the
+    tokens, so it also works for long repetitive ranges.
+
+    :param a: the old tokens
+    :param b: the new tokens
+    :param max_edits: maximum number of inserted and deleted tokens
+    :return: list of the matching (index a, index b) pairs in order, or None if there are more edits than max_edits
+    """
+    n, m = len(a), len(b)
+    offset = max_edits + 1
+    v = [0] * (2 * max_edits + 3)
+    trace = []
+    for d in range(max_edits + 1):
+        # the furthest x per diagonal k before step d, for the backtracking
+        trace.append(array("l", v[offset - d - 1 : offset + d + 2]))
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                matches = []
+                for step in range(d, -1, -1):
+                    prev_v = trace[step]
+                    k = x - y
+                    if k == -step or (k != step and prev_v[step + k] < prev_v[step + k + 2]):
+                        prev_k = k + 1
+                    else:
+                        prev_k = k - 1
+                    prev_x = prev_v[step + 1 + prev_k]
+                    prev_y = prev_x - prev_k
+                    while x > prev_x and y > prev_y:
+                        x -= 1
+                        y -= 1
+                        matches.append((x, y))
+                    x, y = prev_x, prev_y
+                return matches[::-1]
+    return None
+
+
+def _match_tokens(tokens_old, tokens_new, alo, ahi, blo, bhi, matches):
+    """
+    Patience diff of tokens_old[alo:ahi] and tokens_new[blo:bhi], appends the matching (index old, index new) pairs to
+    matches in order.
+
+    Tokens that occur exactly once on both sides are used as anchors, the ranges between the anchors are diffed the
+    same way. Ranges without such tokens fall back to a Myers diff and, if that has too many edits, to difflib for
+    small ranges. Larger ranges with that many edits are split in halves.
+    """
+    suffix = []
+    while alo < ahi and blo < bhi and tokens_old[alo] == tokens_new[blo]:
+        matches.append((alo, blo))
+        alo += 1
+        blo += 1
+    while alo < ahi and blo < bhi and tokens_old[ahi - 1] == tokens_new[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+        suffix.append((ahi, bhi))
+    if alo < ahi and blo < bhi:
+        counts = {}
+        for i in range(alo, ahi):
+            entry = counts.setdefault(tokens_old[i], [0, i, 0, None])
+            entry[0] += 1
+        for j in range(blo, bhi):
+            entry = counts.get(tokens_new[j])
+            if entry is not None:
+                entry[2] += 1
+                entry[3] = j
+        unique = sorted((e[1], e[3]) for e in counts.values() if e[0] == 1 and e[2] == 1)
+        if len(unique) > 0:
+            a, b = alo, blo
+            for anchor_a, anchor_b in _longest_increasing_subsequence(unique):
+                _match_tokens(tokens_old, tokens_new, a, anchor_a, b, anchor_b, matches)
+                matches.append((anchor_a, anchor_b))
+                a, b = anchor_a + 1, anchor_b + 1
+            _match_tokens(tokens_old, tokens_new, a, ahi, b, bhi, matches)
+        else:
+            range_matches = _myers_matches(tokens_old[alo:ahi], tokens_new[blo:bhi], MAX_EDITS)
+            if range_matches is not None:
+                matches.extend((alo + a, blo + b) for a, b in range_matches)
+            elif (ahi - alo) * (bhi - blo) <= MAX_DIFFLIB_PAIRS:
+                # without autojunk, frequent tokens would be treated as junk and never match
+                seq = SequenceMatcher(None, tokens_old[alo:ahi], tokens_new[blo:bhi], autojunk=False)
+                for a, b, size in seq.get_matching_blocks():
+                    matches.extend((alo + a + k, blo + b + k) for k in range(size))
+            else:
+                # too many edits for one diff, the halves are diffed on their own, only tokens near the cut can get
+                # lost
+                amid = (alo + ahi) // 2
+                bmid = blo + (bhi - blo) * (amid - alo) // (ahi - alo)
+                _match_tokens(tokens_old, tokens_new, alo, amid, blo, bmid, matches)
+                _match_tokens(tokens_old, tokens_new, amid, ahi, bmid, bhi, matches)
+    matches.extend(reversed(suffix))
+
+
+def get_matching_blocks(text_old, text_new):
+    """
+    Diffs the two texts on word level with a patience diff, which is close to linear for the usual edits of a text.
+
+    :param text_old: the old version of the text
+    :param text_new: the new version of the text
+    :return: list of (old start, new start, length) tuples in characters, sorted by old start and not overlapping
+    """
+    tokens_old, starts_old = _tokenize(text_old)
+    tokens_new, starts_new = _tokenize(text_new)
+    matches = []
+    _match_tokens(tokens_old, tokens_new, 0, len(tokens_old), 0, len(tokens_new), matches)
+    blocks = []
+    for a, b in matches:
+        start_old = starts_old[a]
+        start_new = starts_new[b]
+        length = len(tokens_old[a])
+        if blocks and blocks[-1][0] + blocks[-1][2] == start_old and blocks[-1][1] + blocks[-1][2] == start_new:
+            blocks[-1][2] += length
+        else:
+            blocks.append([start_old, start_new, length])
+    return [tuple(block) for block in blocks]
+
+
+def map_spans(text_old, text_new, spans):
+    """
+    Maps (start, end) spans of the old text onto the new text.
+
+    A span is kept if both of its ends lie in unchanged parts of the text and the new text still contains the same
+    string between the mapped offsets.
+
+    :param text_old: the old version of the text
+    :param text_new: the new version of the text
+    :param spans: iterable of (start, end) tuples in the old text
+    :return: list with a (start, end) tuple in the new text or None for every span
+    """
+    blocks = get_matching_blocks(text_old, text_new)
+    block_starts = [block[0] for block in blocks]
+
+    def map_offset(offset, is_end):
+        # an end offset is exclusive, so it is mapped through the block containing the character before it
+        i = bisect_right(block_starts, offset - 1 if is_end else offset) - 1
+        if i < 0:
+            return None
+        start_old, start_new, length = blocks[i]
+        if is_end and not start_old < offset <= start_old + length:
+            return None
+        if not is_end and not start_old <= offset < start_old + length:
+            return None
+        return offset - start_old + start_new
+
+    res = []
+    for start, end in spans:
+        new_start = map_offset(start, False)
+        new_end = map_offset(end, True)
+        if new_start is None or new_end is None or text_new[new_start:new_end] != text_old[start:end]:
+            res.append(None)
+        else:
+            res.append((new_start, new_end))
+    return res
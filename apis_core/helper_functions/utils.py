@@ -1,5 +1,8 @@
 from django.conf import settings
 
+from apis_core.apis_vocabularies import vocab_tree
+from apis_core.apis_vocabularies.models import VocabsClosure
+
 
 def access_for_all(self, viewtype="list"):
     if self.request.user.is_authenticated:
@@ -42,20 +45,18 @@ ENTITIES_DEFAULT_COLS = [
 ]
 
 def get_child_classes(objids, obclass, labels=False):
-    """used to retrieve a list of primary keys of sub classes"""
+    """used to retrieve a list of primary keys of sub classes, resolved with one query on the closure table"""
     if labels:
         labels_lst = []
-    for obj in objids:
-        obj = obclass.objects.get(pk=obj)
-        p_class = list(obj.vocabsbaseclass_set.all())
-        p = p_class.pop() if len(p_class) > 0 else False
-        while p:
-            if p.pk not in objids:
-                if labels:
-                    labels_lst.append((p.pk, p.label))
-                objids.append(p.pk)
-            p_class += list(p.vocabsbaseclass_set.all())
-            p = p_class.pop() if len(p_class) > 0 else False
+    descendants = VocabsClosure.objects.filter(ancestor_id__in=objids, depth__gt=0).order_by(
+        "ancestor_id", "depth", "descendant_id"
+    ).values_list("descendant_id", flat=True)
+    tree = vocab_tree.get_tree() if labels else None
+    for pk in descendants:
+        if pk not in objids:
+            if labels:
+                labels_lst.append((pk, tree.get_label(pk)))
+            objids.append(pk)
     if labels:
         return (objids, labels_lst)
     else:
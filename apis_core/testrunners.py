@@ -42,6 +42,8 @@ class APISTestRunner(DiscoverRunner):
                     "vocabnames",
                     "vocabsuri",
                     "uricandidate",
+                    "vocabsclosure",
+                    "collectionclosure",
                 ]
             )
             .exclude(model__icontains="baseclass")
@@ -63,6 +65,7 @@ class APISTestRunner(DiscoverRunner):
                         "vocab_name",
                         "userAdded",
                         "groups_allowed",
+                        "self_contenttype",
                     ]:
                         continue
                     if fld.__class__.__name__ in ["ForeignKey", "ManyToManyField"]:
@@ -103,6 +106,7 @@ class APISTestRunner(DiscoverRunner):
                     "vocab_name",
                     "id",
                     "vocabsuri",
+                    "self_contenttype",
                 ]:
                     continue
                 elif "date_written" in fld.name: